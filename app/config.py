@@ -2,7 +2,49 @@ import os
 
 # Clave secreta para JWT
 SECRET_KEY = os.environ.get("JWT_SECRET_KEY", "default_dev_key_CHANGE_IN_PRODUCTION")
+# Número de tokens ya verificados que se guardan para no volver a comprobar su firma
+TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", 1024))
 
 # Otras configuraciones que puedas necesitar
 DEBUG = True
-DATABASE_DIR = os.path.join(os.path.dirname(__file__), 'database')
\ No newline at end of file
+# Nivel de los logs de la aplicación; con DEBUG se ven los mensajes de diagnóstico
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "WARNING").upper()
+DATABASE_DIR = os.path.join(os.path.dirname(__file__), 'database')
+
+# Backend de almacenamiento: "json" (ficheros de app/database) o "sqlite".
+# Para pasar a SQLite, migrar antes los datos con `python migrate_to_sqlite.py`
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "json")
+SQLITE_PATH = os.environ.get("SQLITE_PATH", os.path.join(DATABASE_DIR, 'app.db'))
+
+# Colecciones que registran sus cambios en un diario (append-only) en lugar de
+# reescribir el fichero completo, p.ej. JOURNALED_COLLECTIONS=cars
+JOURNALED_COLLECTIONS = [name for name in os.environ.get("JOURNALED_COLLECTIONS", "").split(",") if name]
+# Número de entradas del diario a partir del cual se compacta en un snapshot nuevo
+JOURNAL_COMPACT_THRESHOLD = int(os.environ.get("JOURNAL_COMPACT_THRESHOLD", 1000))
+
+# Tamaño máximo de página que aceptan los listados paginados (p.ej. GET /cars)
+MAX_PAGE_SIZE = int(os.environ.get("MAX_PAGE_SIZE", 100))
+
+# Serializador JSON de las respuestas: "orjson" (si está instalado) o "default" (el de Flask)
+JSON_PROVIDER = os.environ.get("JSON_PROVIDER", "orjson")
+# Las respuestas de al menos COMPRESS_MIN_SIZE bytes se comprimen con brotli o gzip
+# según Accept-Encoding; se guardan comprimidas las COMPRESS_CACHE_SIZE últimas con ETag
+COMPRESS_MIN_SIZE = int(os.environ.get("COMPRESS_MIN_SIZE", 1024))
+COMPRESS_LEVEL = int(os.environ.get("COMPRESS_LEVEL", 6))
+COMPRESS_CACHE_SIZE = int(os.environ.get("COMPRESS_CACHE_SIZE", 256))
+
+# Hash de contraseñas (método de werkzeug, p.ej. "scrypt:32768:8:1" o "pbkdf2:sha256:600000").
+# Si cambia, los hashes antiguos se recalculan al iniciar sesión
+PASSWORD_HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD", "scrypt:32768:8:1")
+# Procesos que calculan hashes. El hilo de la petición espera el resultado, así que
+# las operaciones pendientes se limitan a PASSWORD_QUEUE_LIMIT (por defecto, dos por
+# proceso del pool y menos que los REQUEST_THREADS hilos que atienden peticiones en
+# cada worker, p.ej. --threads de gunicorn) y cada espera a PASSWORD_TIMEOUT segundos.
+# Por encima de cualquiera de los dos se responde 503 con Retry-After
+PASSWORD_WORKERS = int(os.environ.get("PASSWORD_WORKERS", min(2, os.cpu_count() or 1)))
+REQUEST_THREADS = int(os.environ.get("REQUEST_THREADS", 8))
+PASSWORD_QUEUE_LIMIT = int(os.environ.get(
+    "PASSWORD_QUEUE_LIMIT", max(1, min(2 * PASSWORD_WORKERS, REQUEST_THREADS - 1))
+))
+PASSWORD_TIMEOUT = float(os.environ.get("PASSWORD_TIMEOUT", 5))
+PASSWORD_RETRY_AFTER = int(os.environ.get("PASSWORD_RETRY_AFTER", 2))
@@ -1,4 +1,6 @@
+import logging
 from flask import Flask, jsonify, request
+from config import LOG_LEVEL
 from flask_cors import CORS
 from routes.cars import cars_bp
 from routes.sales import sales_bp
@@ -6,8 +8,21 @@ from routes.favorites import favorites_bp
 from routes.auth import auth_bp
 from routes.reviews import reviews_bp
 from routes.bookings import bookings_bp
+from routes.compression import compress_response
+from routes.json_provider import json_provider
+from storage.repository import cache_stats
+
+# Logs de la aplicación (routes.*, storage.*) con el nivel de LOG_LEVEL; los de
+# Flask/Werkzeug no se tocan. Por debajo del nivel los mensajes no se formatean
+log_handler = logging.StreamHandler()
+log_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+for name in ('routes', 'storage'):
+    logging.getLogger(name).setLevel(LOG_LEVEL)
+    logging.getLogger(name).addHandler(log_handler)
 
 app = Flask(__name__)
+app.json = json_provider(app)
+app.after_request(compress_response)
 
 # Use ONLY the Flask-CORS extension for handling CORS
 CORS(app, 
@@ -54,5 +69,10 @@ app.register_blueprint(bookings_bp)
 def test():
     return jsonify({"message": "Server is running!"}), 200
 
+# Estadísticas de la caché de colecciones (aciertos/fallos por colección)
+@app.route('/storage/stats', methods=['GET'])
+def storage_stats():
+    return jsonify(cache_stats()), 200
+
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
\ No newline at end of file
@@ -1,3 +1,8 @@
+# Límites que caben en las columnas del almacén de ventas (año int16, unidades int32)
+MIN_YEAR, MAX_YEAR = 1886, 9999
+MAX_UNITS = 2 ** 31 - 1
+
+
 class Sale:
     def __init__(self, year, model, country, units_sold, total_units=None):
         self.year = year
@@ -6,6 +11,32 @@ class Sale:
         self.units_sold = units_sold
         self.total_units = total_units  # Nuevo atributo para el total de unidades vendidas
 
+    @classmethod
+    def from_dict(cls, data):
+        """Crea una venta a partir de un dict; ValueError con el motivo si algún campo no es válido."""
+        for field in ('year', 'model', 'country', 'units_sold'):
+            if field not in data:
+                raise ValueError(f"Field '{field}' is required.")
+
+        if not isinstance(data['year'], int) or isinstance(data['year'], bool):
+            raise ValueError("Year must be a numeric value.")
+        if not MIN_YEAR <= data['year'] <= MAX_YEAR:
+            raise ValueError(f"Year must be between {MIN_YEAR} and {MAX_YEAR}.")
+
+        if not isinstance(data['model'], str) or not data['model'].strip():
+            raise ValueError("Model must be a non-empty string.")
+
+        if not isinstance(data['country'], str) or not data['country'].strip():
+            raise ValueError("Country must be a non-empty string.")
+
+        units = data['units_sold']
+        if not isinstance(units, int) or isinstance(units, bool) or units < 0:
+            raise ValueError("Units sold must be a non-negative integer.")
+        if units > MAX_UNITS:
+            raise ValueError(f"Units sold must not exceed {MAX_UNITS}.")
+
+        return cls(data['year'], data['model'], data['country'], units)
+
     def to_dict(self):
         return {
             "year": self.year,
@@ -1,9 +1,15 @@
-from flask import Blueprint, request, jsonify, Response
-from werkzeug.security import generate_password_hash, check_password_hash
+from flask import Blueprint, g, request, jsonify, Response
+from config import PASSWORD_RETRY_AFTER, SECRET_KEY, TOKEN_CACHE_SIZE
+from routes.passwords import PasswordPoolBusy, check_password, hash_password, needs_rehash, rehash_later
+from storage.repository import get_collection
+from collections import OrderedDict
+from functools import wraps
 import base64
-import json
+import hashlib
 import os
 import re
+import threading
+import time
 import jwt
 from datetime import datetime, timedelta
 
@@ -11,36 +17,30 @@ from datetime import datetime, timedelta
 auth_bp = Blueprint('auth', __name__)
 
 # Configuración del almacenamiento de usuarios
-USERS_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database/users.json')
-
-# Clave secreta para JWT
-SECRET_KEY = os.environ.get("JWT_SECRET_KEY", "default_dev_key_CHANGE_IN_PRODUCTION")
+users_repo = get_collection('users')
+USERS_FILE = users_repo.path
 
 # Si no hay variable de entorno y estamos en producción, lanzar un error
 if os.environ.get("FLASK_ENV") == "production" and SECRET_KEY == "default_dev_key_CHANGE_IN_PRODUCTION":
     import sys
     print("ERROR: JWT_SECRET_KEY no configurada en entorno de producción", file=sys.stderr)
 
-# Funciones de gestión de usuarios
-def ensure_dir():
-    directory = os.path.dirname(USERS_FILE)
-    if not os.path.exists(directory):
-        os.makedirs(directory)
-
-def load_users():
-    ensure_dir()
-    if not os.path.exists(USERS_FILE):
-        with open(USERS_FILE, 'w') as f:
-            json.dump([], f)
-        return []
-    
-    with open(USERS_FILE, 'r') as f:
-        return json.load(f)
+# Los hashes de contraseñas se calculan en un pool de procesos con la cola
+# acotada: si está lleno se pide al cliente que lo reintente más tarde
+@auth_bp.errorhandler(PasswordPoolBusy)
+def password_pool_busy(error):
+    response = jsonify({'error': 'Servidor ocupado, inténtalo de nuevo en unos segundos'})
+    response.status_code = 503
+    response.headers['Retry-After'] = str(PASSWORD_RETRY_AFTER)
+    return response
 
-def save_users(users):
-    ensure_dir()
-    with open(USERS_FILE, 'w') as f:
-        json.dump(users, f, indent=4)
+# Guarda el hash recalculado si la contraseña no ha cambiado mientras tanto
+def save_rehash(username, old_hash):
+    def save(new_hash):
+        user = users_repo.get(username)
+        if user and user['password'] == old_hash:
+            users_repo.update(username, {**user, 'password': new_hash})
+    return save
 
 # Esta función solo se usará para el proceso inicial de login
 def get_basic_auth_credentials():
@@ -72,25 +72,21 @@ def register():
     if not re.match(email_pattern, username):
         return jsonify({'error': 'El nombre de usuario debe ser un email válido'}), 400
     
-    # Cargar usuarios existentes
-    users = load_users()
-    
-    # Verificar si el usuario ya existe
-    if any(user['username'] == username for user in users):
+    # Verificar si el usuario ya existe (se repite dentro del commit, ver abajo)
+    if users_repo.get(username):
         return jsonify({'error': 'El nombre de usuario ya existe'}), 400
     
     # Crear nuevo usuario con contraseña encriptada
-    hashed_password = generate_password_hash(password)
+    hashed_password = hash_password(password)
     # Por defecto, los nuevos usuarios no son administradores
     new_user = {
         'username': username, 
         'password': hashed_password,
         'is_admin': False  # Añadimos este campo
     }
-    users.append(new_user)
-    
-    # Guardar en el archivo JSON
-    save_users(users)
+    # Guardar sólo si nadie ha registrado el mismo usuario mientras se calculaba el hash
+    if users_repo.insert_if(new_user, lambda: users_repo.get(username) is None) is None:
+        return jsonify({'error': 'El nombre de usuario ya existe'}), 400
     
     # Generar token JWT incluyendo el rol de usuario
     token_payload = {
@@ -115,14 +111,15 @@ def login():
     if not username or not password:
         return jsonify({'error': 'Credenciales incompletas'}), 401
     
-    # Cargar usuarios existentes
-    users = load_users()
-    
     # Buscar usuario y verificar contraseña hasheada (esto es seguro)
-    user = next((user for user in users if user['username'] == username), None)
-    if not user or not check_password_hash(user['password'], password):
+    user = users_repo.get(username)
+    if not user or not check_password(user['password'], password):
         return jsonify({'error': 'Usuario o contraseña inválidos'}), 401
     
+    # Si ha cambiado el coste configurado, se recalcula el hash sin retrasar la respuesta
+    if needs_rehash(user['password']):
+        rehash_later(password, save_rehash(username, user['password']))
+    
     # Verificar si el usuario es admin (si no tiene el campo, asumimos False)
     is_admin = user.get('is_admin', False)
     
@@ -140,18 +137,41 @@ def login():
         'is_admin': is_admin
     }), 200
 
-# Nueva función para verificar tokens JWT
+# Tokens ya verificados: sha256 del token -> claims. Una sesión que repite
+# peticiones con el mismo token no vuelve a comprobar la firma.
+_verified_tokens = OrderedDict()
+_verified_lock = threading.Lock()
+
 def verify_token(token):
+    """Claims de un token JWT válido y no expirado, o None."""
+    key = hashlib.sha256(token.encode('utf-8')).digest()
+    with _verified_lock:
+        claims = _verified_tokens.get(key)
+        if claims is not None:
+            # La caché respeta la caducidad del token
+            if claims.get('exp') is not None and claims['exp'] <= time.time():
+                del _verified_tokens[key]
+                return None
+            _verified_tokens.move_to_end(key)
+            return claims
+
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
-        return payload['username']
-    except jwt.ExpiredSignatureError:
+        claims = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
+    except jwt.InvalidTokenError:  # Incluye ExpiredSignatureError
         return None
-    except jwt.InvalidTokenError:
+    if not claims.get('username'):
         return None
 
-# Middleware para verificar token
+    with _verified_lock:
+        _verified_tokens[key] = claims
+        while len(_verified_tokens) > TOKEN_CACHE_SIZE:
+            _verified_tokens.popitem(last=False)
+    return claims
+
+# Middleware para verificar token: pasa el username a la vista y deja los
+# claims del token en flask.g (g.username, g.is_admin)
 def token_required(f):
+    @wraps(f)
     def decorated(*args, **kwargs):
         token = None
         auth_header = request.headers.get('Authorization')
@@ -162,14 +182,25 @@ def token_required(f):
         if not token:
             return jsonify({'error': 'Token requerido'}), 401
             
-        username = verify_token(token)
-        if not username:
+        claims = verify_token(token)
+        if not claims:
             return jsonify({'error': 'Token inválido o expirado'}), 401
-            
+        
+        g.username = claims['username']
+        g.is_admin = bool(claims.get('is_admin', False))
+        return f(g.username, *args, **kwargs)
+    
+    return decorated
+
+# Como token_required, pero sólo para administradores (según el rol incluido en el token)
+def admin_required(f):
+    @wraps(f)
+    @token_required
+    def decorated(username, *args, **kwargs):
+        if not g.is_admin:
+            return jsonify({"error": "Acceso denegado. Se requieren privilegios de administrador."}), 403
         return f(username, *args, **kwargs)
     
-    # Mantener el nombre de la función para Flask
-    decorated.__name__ = f.__name__
     return decorated
 
 # Ejemplo de ruta protegida
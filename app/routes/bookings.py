@@ -1,113 +1,48 @@
-from flask import Blueprint, request, jsonify
-from routes.auth import token_required
-import json
-import os
+from flask import Blueprint, g, request, jsonify
+from routes.auth import admin_required, token_required
+from config import MAX_PAGE_SIZE
+from routes.caching import conditional
+from routes.pagination import decode_cursor, encode_cursor, parse_limit
+from storage.booking_indexes import (
+    booking_calendar, booking_interval, booking_intervals, bookings_by_user, parse_datetime
+)
+from storage.repository import get_collection
 from datetime import datetime
-import jwt
-from config import SECRET_KEY
-from routes.auth import load_users
-from pathlib import Path
+import logging
 
 bookings_bp = Blueprint('bookings', __name__)
+logger = logging.getLogger(__name__)
 
-# Cambiar la ruta al archivo para que apunte a la carpeta correcta
-DATABASE_DIR = os.path.join(os.path.dirname(__file__), '..', 'database')
-BOOKINGS_FILE = os.path.join(DATABASE_DIR, 'bookings.json')
-USERS_FILE = os.path.join(DATABASE_DIR, 'users.json')  # Add this line
-
-# Funciones auxiliares para gestionar el almacenamiento
-def read_bookings():
-    if not os.path.exists(BOOKINGS_FILE):
-        # Crear directorio si no existe
-        os.makedirs(os.path.dirname(BOOKINGS_FILE), exist_ok=True)
-        # Crear archivo vacío con una lista
-        with open(BOOKINGS_FILE, 'w') as f:
-            json.dump([], f)
-        return []
-    
-    with open(BOOKINGS_FILE, 'r') as f:
-        try:
-            return json.load(f)
-        except json.JSONDecodeError:
-            return []
-
-def write_bookings(bookings):
-    if not os.path.exists(DATABASE_DIR):
-        os.makedirs(DATABASE_DIR)
-    with open(BOOKINGS_FILE, 'w') as f:
-        json.dump(bookings, f, indent=4)
-
-def load_bookings():
-    """Cargar todas las reservas del archivo JSON"""
-    try:
-        if not os.path.exists(BOOKINGS_FILE):
-            return []
-        with open(BOOKINGS_FILE, 'r') as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"Error al cargar reservas: {str(e)}")
-        return []
-
-def save_bookings(bookings):
-    """Guardar todas las reservas en el archivo JSON"""
-    with open(BOOKINGS_FILE, 'w') as f:
-        json.dump(bookings, f, indent=4)
-
-# Helper function to get full user details
-def get_user_details(username):
-    with open(USERS_FILE, 'r') as f:
-        users = json.load(f)
-    
-    return next((user for user in users if user['username'] == username), None)
+bookings_repo = get_collection('bookings')
+cars_repo = get_collection('cars')
+BOOKINGS_FILE = bookings_repo.path
+# Parámetros de /admin/bookings que activan el filtrado y la paginación
+ADMIN_BOOKING_ARGS = ('from', 'to', 'car_id', 'user_id', 'sort', 'limit', 'cursor')
 
 # Endpoints para reservas
 @bookings_bp.route('/bookings', methods=['GET'])
 @token_required
-def get_bookings(current_user):
+def get_bookings(username):
     try:
-        with open(BOOKINGS_FILE, 'r') as f:
-            bookings = json.load(f)
+        # If admin, return all bookings (rol incluido en el token)
+        if g.is_admin:
+            return jsonify(bookings_repo.all()), 200
         
-        # Get user details
-        user_id = None
-        is_admin = False
-        
-        if isinstance(current_user, str):
-            # current_user is a username
-            with open(USERS_FILE, 'r') as f:
-                users = json.load(f)
-            
-            user = next((u for u in users if u['username'] == current_user), None)
-            if user:
-                user_id = user.get('id')
-                is_admin = user.get('is_admin', False)
-        else:
-            # current_user is already a dict
-            user_id = current_user.get('id')
-            is_admin = current_user.get('is_admin', False)
-        
-        # If admin, return all bookings
-        if is_admin:
-            return jsonify(bookings), 200
-        
-        # For regular users, filter bookings to show only their own
-        user_bookings = [booking for booking in bookings if str(booking.get('user_id')) == str(user_id)]
-        return jsonify(user_bookings), 200
+        # For regular users, only their own bookings (índice por usuario; las reservas
+        # guardan el username como user_id)
+        return jsonify(bookings_by_user(bookings_repo).bookings(username)), 200
         
     except Exception as e:
-        print(f"Error al obtener reservas: {str(e)}")
+        logger.exception("Error al obtener reservas de %s", username)
         return jsonify({'error': f'Error al obtener reservas: {str(e)}'}), 500
 
 @bookings_bp.route('/bookings', methods=['POST'])
 @token_required
 def create_booking(current_user):
     try:
-        # Imprimir información de depuración
-        print("Current user type:", type(current_user))
-        print("Current user value:", current_user)
+        logger.debug("Nueva reserva de %r", current_user)
         
         booking_data = request.json
-        bookings = read_bookings()
         
         # Validar datos de entrada
         required_fields = ['car_id', 'date', 'time', 'return_date', 'return_time']
@@ -129,8 +64,9 @@ def create_booking(current_user):
         except (ValueError, TypeError):
             return jsonify({'error': 'car_id debe ser un número entero'}), 400
             
+        # El id lo asigna el repositorio dentro del commit (len + 1 se repetía tras borrar)
         new_booking = {
-            'id': len(bookings) + 1,
+            'id': None,
             'user_id': user_id,
             'car_id': car_id,
             'date': booking_data['date'],
@@ -140,59 +76,62 @@ def create_booking(current_user):
             'created_at': datetime.now().isoformat()
         }
         
-        # Verificar si ya existe una reserva para ese coche en ese horario
-        for booking in bookings:
-            if (booking['car_id'] == new_booking['car_id'] and 
-                booking['date'] == new_booking['date'] and 
-                booking['time'] == new_booking['time']):
-                return jsonify({
-                    'error': 'Este coche ya está reservado para esa fecha y hora'
-                }), 400
-        
-        bookings.append(new_booking)
-        write_bookings(bookings)
+        interval = booking_interval(new_booking)
+        if interval is None:
+            return jsonify({'error': 'Fechas no válidas: la devolución debe ser posterior a la recogida'}), 400
+        
+        # Verificar que el coche no tenga otra reserva que se solape con este periodo.
+        # La comprobación se hace dentro del commit para que dos peticiones
+        # simultáneas no puedan reservar el mismo hueco
+        new_booking = bookings_repo.insert_if(
+            new_booking, lambda: not booking_intervals(bookings_repo).overlaps(car_id, *interval)
+        )
+        if new_booking is None:
+            return jsonify({
+                'error': 'Este coche ya está reservado en esas fechas'
+            }), 400
         
         return jsonify(new_booking), 201
     except Exception as e:
-        import traceback
-        print("Error al procesar la reserva:")
-        traceback.print_exc()  # Imprimir el stacktrace completo
+        logger.exception("Error al procesar la reserva")
         return jsonify({'error': f'Error interno del servidor: {str(e)}'}), 500
 
+# Coches sin reservas que se solapen con el periodo [from, to)
+@bookings_bp.route('/cars/available', methods=['GET'])
+@conditional('cars', 'bookings')
+def get_available_cars():
+    try:
+        start = parse_datetime(request.args['from'])
+        end = parse_datetime(request.args['to'])
+    except (KeyError, ValueError):
+        return jsonify({'error': "Parámetros 'from' y 'to' requeridos (YYYY-MM-DD o YYYY-MM-DDTHH:MM)"}), 400
+    if end <= start:
+        return jsonify({'error': "'to' debe ser posterior a 'from'"}), 400
+
+    # Una búsqueda binaria por coche en el índice de intervalos, sin recorrer las reservas
+    intervals = booking_intervals(bookings_repo)
+    available = [car for car in cars_repo.all() if not intervals.overlaps(car.get('id'), start, end)]
+    return jsonify({"data": available, "total": len(available)}), 200
+
 @bookings_bp.route('/bookings/<int:booking_id>', methods=['DELETE'])
 @token_required
 def delete_booking(username, booking_id):
     try:
-        # Ruta al archivo de reservas
-        bookings_file = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database/bookings.json')
-        
-        # Cargar las reservas
-        with open(bookings_file, 'r') as f:
-            bookings = json.load(f)
-        
         # Buscar la reserva por ID
-        booking_index = None
-        for i, booking in enumerate(bookings):
-            if booking.get('id') == booking_id:
-                booking_index = i
-                break
+        booking = bookings_repo.get(booking_id)
                 
-        if booking_index is None:
+        if booking is None:
             return jsonify({"error": "Reserva no encontrada"}), 404
         
         # Comprobar que el usuario es el propietario de la reserva
-        booking_user_id = bookings[booking_index].get('user_id')
+        booking_user_id = booking.get('user_id')
         
         # Comparar el username del token con el user_id de la reserva
         if username != booking_user_id:
             return jsonify({"error": "No tienes permiso para cancelar esta reserva"}), 403
         
-        # Eliminar la reserva
-        deleted_booking = bookings.pop(booking_index)
-        
-        # Guardar los cambios
-        with open(bookings_file, 'w') as f:
-            json.dump(bookings, f, indent=4)
+        # Eliminar la reserva y guardar los cambios
+        deleted_booking = bookings_repo.delete(booking_id)
         
         return jsonify({
             "message": "Reserva cancelada correctamente",
@@ -200,91 +139,64 @@ def delete_booking(username, booking_id):
         }), 200
         
     except Exception as e:
-        import traceback
-        print(f"Error al eliminar reserva: {str(e)}")
-        traceback.print_exc()
+        logger.exception("Error al eliminar la reserva %s", booking_id)
         return jsonify({"error": f"Error del servidor: {str(e)}"}), 500
 
-# Endpoint para obtener todas las reservas (solo admin)
+# Endpoint para consultar las reservas (solo admin)
 @bookings_bp.route('/admin/bookings', methods=['GET'])
-@token_required
+@admin_required
 def get_all_bookings(username):
-    # Load the full user object to check admin status
-    users = load_users()
-    current_user = next((user for user in users if user['username'] == username), {})
-    
-    # Now check admin status from the user object
-    if not current_user.get('is_admin', False):
-        return jsonify({"error": "Acceso denegado. Se requieren privilegios de administrador."}), 403
+    # Sin filtros ni paginación se devuelve la lista completa, como antes
+    if not any(name in request.args for name in ADMIN_BOOKING_ARGS):
+        return jsonify(bookings_repo.all())
     
-    # Continue with existing function logic...
-    bookings = read_bookings()
-    return jsonify(bookings)
-
-# Modificar la función que agregamos para evitar el conflicto de nombres
-@bookings_bp.route('/admin/bookings', methods=['GET'], endpoint='admin_get_all_bookings')  # Cambiado el endpoint
-def admin_get_all_bookings():  # Renombrada la función
+    # Reservas que se solapan con [from, to), filtradas por coche/usuario y paginadas por cursor
+    sort = request.args.get('sort', 'date')
+    cursor = request.args.get('cursor')
+    user_id = request.args.get('user_id')
     try:
-        # Verificar autenticación
-        auth_header = request.headers.get('Authorization')
-        if not auth_header or not auth_header.startswith('Bearer '):
-            return jsonify({"error": "Token no proporcionado o formato incorrecto"}), 401
-        
-        # Extraer el token
-        token = auth_header.split(' ')[1]
-        
-        try:
-            # Verificar el token y los permisos de administrador
-            payload = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
-            is_admin = payload.get('is_admin', False)
-            
-            if not is_admin:
-                return jsonify({"error": "Acceso denegado. Se requiere rol de administrador"}), 403
-                
-        except jwt.ExpiredSignatureError:
-            return jsonify({"error": "Token expirado"}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({"error": "Token inválido"}), 401
-        
-        # Obtener todas las reservas
-        bookings = load_bookings()
-        
-        return jsonify(bookings), 200
-        
-    except Exception as e:
-        print(f"Error al obtener todas las reservas: {str(e)}")
-        return jsonify({"error": f"Error del servidor: {str(e)}"}), 500
+        start, end = (parse_datetime(request.args[name]) if name in request.args else None
+                      for name in ('from', 'to'))
+        car_id = int(request.args['car_id']) if 'car_id' in request.args else None
+        limit = parse_limit(request.args.get('limit'), MAX_PAGE_SIZE, MAX_PAGE_SIZE)
+        after = None
+        if cursor:
+            position = decode_cursor(cursor)
+            sort, (value, booking_id) = position['sort'], position['after']
+            if not isinstance(sort, str) or not isinstance(booking_id, int):
+                raise ValueError
+            after = (parse_datetime(value), booking_id)
+    except (ValueError, TypeError, KeyError):
+        return jsonify({"error": "Parámetros no válidos: from, to, car_id, limit o cursor"}), 400
+    if sort not in ('date', '-date'):
+        return jsonify({"error": "sort debe ser date o -date"}), 400
+    
+    data, last_key, has_more = [], None, False
+    for key, booking in booking_calendar(bookings_repo).window(start, end, after, reverse=sort == '-date'):
+        if car_id is not None and booking.get('car_id') != car_id:
+            continue
+        if user_id is not None and str(booking.get('user_id')) != user_id:
+            continue
+        if len(data) == limit:
+            has_more = True
+            break
+        data.append(booking)
+        last_key = key
+    
+    next_cursor = None
+    if has_more:
+        next_cursor = encode_cursor({"sort": sort, "after": [last_key[0].isoformat(), last_key[1]]})
+    return jsonify({"data": data, "limit": limit, "next_cursor": next_cursor}), 200
 
 # Ruta para obtener las reservas del usuario autenticado
 @bookings_bp.route('/user/bookings', methods=['GET'])
 @token_required
 def get_user_bookings(username):  # La función token_required pasa el username, no un diccionario
     try:
-        # El username será el correo electrónico del usuario (yu@yu.com)
-        user_id = username  # Usa directamente el username como user_id
-        
-        # Log para depuración
-        print(f"Buscando reservas para: {user_id}")
-        
-        # Abrir el archivo de reservas
-        bookings_file = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database/bookings.json')
-        if not os.path.exists(bookings_file):
-            return jsonify([]), 200
-            
-        with open(bookings_file, 'r') as f:
-            bookings = json.load(f)
-        
-        # Filtrar las reservas que pertenecen al usuario
-        user_bookings = [booking for booking in bookings if booking.get('user_id') == user_id]
-        
-        # Log para depuración
-        print(f"User ID: {user_id}, Found bookings: {len(user_bookings)}")
-        print(f"Todas las reservas: {bookings}")
-        print(f"Reservas filtradas: {user_bookings}")
-        
+        # El username (correo del usuario) es el user_id de sus reservas
+        user_bookings = bookings_by_user(bookings_repo).bookings(username)
+        logger.debug("Reservas de %s: %d", username, len(user_bookings))
         return jsonify(user_bookings), 200
     except Exception as e:
-        import traceback
-        print(f"Error al obtener reservas de usuario: {str(e)}")
-        traceback.print_exc()
-        return jsonify({"error": str(e)}), 500
\ No newline at end of file
+        logger.exception("Error al obtener reservas de %s", username)
+        return jsonify({"error": str(e)}), 500
@@ -0,0 +1,57 @@
+import hashlib
+from functools import wraps
+
+from flask import Response, make_response, request
+
+from routes.compression import cached_body, negotiate_encoding
+from storage.repository import get_collection
+
+
+def conditional(*collections):
+    """GET condicional a partir de la versión de las colecciones de las que depende la respuesta.
+
+    El ETag combina la URL completa, la cabecera Accept y el fingerprint de
+    cada colección, de modo que cambia en cuanto se escribe en cualquiera de
+    ellas. Si el cliente envía un If-None-Match que coincide se responde 304
+    sin ejecutar el handler, y si ya hay un cuerpo comprimido para ese ETag
+    se devuelve sin volver a generarlo. Cache-Control: no-cache hace que el
+    navegador revalide siempre en lugar de servir una copia caducada.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            tokens, modified = [request.full_path, request.headers.get('Accept', '')], None
+            for name in collections:
+                token, last_modified = get_collection(name).fingerprint()
+                tokens.append(f'{name}:{token}')
+                if last_modified is not None:
+                    modified = max(modified or 0, last_modified)
+            etag = hashlib.sha1('|'.join(tokens).encode('utf-8')).hexdigest()
+
+            # Las variantes comprimidas llevan su propio ETag (ver routes.compression)
+            encoding = negotiate_encoding()
+            variant = f'{etag}-{encoding}' if encoding else None
+            matched = next((tag for tag in (etag, variant) if tag and request.if_none_match.contains(tag)), None)
+            cached = cached_body(variant) if variant and not matched else None
+
+            if matched:
+                response = make_response('', 304)
+                response.set_etag(matched)
+            elif cached:
+                body, mimetype = cached
+                response = Response(body, mimetype=mimetype)
+                response.headers['Content-Encoding'] = encoding
+                response.set_etag(variant)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                response.set_etag(etag)
+
+            response.vary.add('Accept-Encoding')
+            if modified is not None:
+                response.last_modified = modified
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return decorated
+    return decorator
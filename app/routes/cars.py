@@ -1,35 +1,39 @@
 from flask import Blueprint, jsonify, request
-import json
-import os
+from config import MAX_PAGE_SIZE
+from routes.caching import conditional
+from routes.pagination import decode_cursor, encode_cursor, parse_limit, split_arg
+from storage.car_indexes import (
+    SORT_FIELDS, bitmap_index, inverted_index, model_year_index, prefix_index, sort_value,
+    sorted_index
+)
+from storage.repository import get_collection
 import re
 
 cars_bp = Blueprint('cars', __name__)
 
-DB_FILE = os.path.abspath(os.path.join(os.path.dirname(__file__), '../database/db.json'))
+cars_repo = get_collection('cars')
+DB_FILE = cars_repo.path
 
-def ensure_db_exists():
-    if not os.path.exists(DB_FILE):
-        os.makedirs(os.path.dirname(DB_FILE), exist_ok=True)
-        with open(DB_FILE, 'w') as f:
-            json.dump([], f, indent=4)  # Inicializar con una lista vacía
+DUPLICATE_CAR = "Car with the same model and year already exists."
 
-def read_db():
-    ensure_db_exists()
-    with open(DB_FILE, 'r') as f:
-        return json.load(f)
+def is_duplicate(car_data, exclude_id=None):
+    # Unicidad de (modelo, año) con el índice hash, sin recorrer el catálogo
+    return model_year_index(cars_repo).conflicts(car_data['model'], car_data['year'], exclude_id)
 
-def write_db(data):
-    ensure_db_exists()
-    with open(DB_FILE, 'w') as f:
-        json.dump(data, f, indent=4)
+def validate_car_data(car_data, exclude_id=None):
+    for field in ('make', 'model', 'year'):
+        if field not in car_data:
+            return f"Field '{field}' is required."
 
-def validate_car_data(car_data, cars):
-    for car in cars:
-        if car.get('id') == car_data.get('id'):
-            continue
+    # Los tipos se comprueban antes de usar modelo y año como clave del índice
+    if not isinstance(car_data['make'], str) or not isinstance(car_data['model'], str):
+        return "Make and model must be text."
+
+    if not isinstance(car_data['year'], int) or isinstance(car_data['year'], bool):
+        return "Year must be a numeric value."
 
-        if car['model'] == car_data['model'] and car['year'] == car_data['year']:
-            return "Car with the same model and year already exists."
+    if is_duplicate(car_data, exclude_id):
+        return DUPLICATE_CAR
 
     # Validar que la marca no contenga números
     if any(char.isdigit() for char in car_data['make']):
@@ -42,33 +46,135 @@ def validate_car_data(car_data, cars):
     if not re.match(r'^[A-Za-z][A-Za-z0-9\s\-]*$', car_data['model']):
         return "Model must start with a letter and can contain letters, numbers, spaces, or hyphens."
 
-    if not isinstance(car_data['year'], int):
-        return "Year must be a numeric value."
-
     return None
 
 @cars_bp.route('/cars', methods=['GET'])
+@conditional('cars')
 def get_cars():
     model = request.args.get('model')  # Obtener el parámetro 'model' de la URL
-    page = int(request.args.get('page', 1))  # Página actual (por defecto 1)
-    limit = int(request.args.get('limit', 5))  # Límite de registros por página (por defecto 5)
-    cars = read_db()
+    sort = request.args.get('sort')  # Paginación por clave: id, year o make ('-' para descendente)
+    cursor = request.args.get('cursor')
+    include_total = request.args.get('include_total', 'true').lower() != 'false'
+    # Filtros por faceta: marca (cualquiera de la lista), rango de años y extras (todos)
+    makes = split_arg('make')
+    features = split_arg('features')
+    with_facets = request.args.get('facets', 'false').lower() == 'true'
+    try:
+        year_from, year_to = (int(request.args[name]) if name in request.args else None
+                              for name in ('year_from', 'year_to'))
+        page = int(request.args.get('page', 1))  # Página actual (por defecto 1)
+        # Límite de registros por página (por defecto 5, como máximo MAX_PAGE_SIZE)
+        limit = parse_limit(request.args.get('limit'), 5, MAX_PAGE_SIZE)
+        after = None
+        if cursor:
+            position = decode_cursor(cursor)
+            sort, (value, car_id) = position['sort'], position['after']
+            if not isinstance(sort, str) or not isinstance(car_id, int):
+                raise ValueError
+            after = (sort_value(sort.lstrip('-'), value), car_id)
+    except (ValueError, TypeError, KeyError):
+        return jsonify({'error': 'Invalid page, limit or cursor'}), 400
+
+    # Coches con alguna palabra del modelo que empieza por el texto buscado
+    # (sin distinción de mayúsculas/minúsculas), resueltos con el índice de prefijos
+    index = prefix_index(cars_repo)
+    ids = index.lookup(model) if model else None
+
+    # Los filtros por faceta se resuelven como intersecciones de bitmaps
+    extra = {}
+    if makes or features or year_from is not None or year_to is not None or with_facets:
+        selected, extra["facets"] = bitmap_index(cars_repo).query(
+            makes, year_from, year_to, features, within=ids
+        )
+        ids = set(selected)
 
-    if model:
-        # Filtrar coches cuyo modelo contenga el texto proporcionado (sin distinción de mayúsculas/minúsculas)
-        cars = [
-            car for car in cars
-            if any(word.lower().startswith(model.lower()) for word in car.get('model', '').split())
-        ]
+    if sort or cursor:
+        return get_cars_by_key(ids, sort or 'id', after, limit, include_total, extra)
+
+    cars = cars_repo.all() if ids is None else index.records(ids)
 
     # Implementar paginación
     start = (page - 1) * limit
     end = start + limit
     paginated_cars = cars[start:end]
 
-    return jsonify({
+    response = {
+        "data": paginated_cars,
+        "page": page,
+        "limit": limit,
+        **extra
+    }
+    if include_total:
+        response["total"] = len(cars)
+    return jsonify(response), 200
+
+def get_cars_by_key(ids, sort, after, limit, include_total, extra):
+    field = sort.lstrip('-')
+    if field not in SORT_FIELDS:
+        return jsonify({'error': f"sort must be one of {', '.join(SORT_FIELDS)}"}), 400
+
+    # Sin filtros se recorre el índice ordenado desde el cursor: el coste depende
+    # del tamaño de la página, no de su profundidad. Con filtros sólo se ordenan
+    # los coches candidatos, en vez de recorrer el índice saltando los demás
+    index = sorted_index(cars_repo, field)
+    reverse = sort.startswith('-')
+    if ids is None:
+        entries = index.scan(after, reverse)
+    else:
+        candidates = [car for car in map(cars_repo.get, ids) if car]
+        entries = index.scan_within(candidates, after, reverse, limit + 1)
+    paginated_cars, last_key, has_more = [], None, False
+    for key, car in entries:
+        if len(paginated_cars) == limit:
+            has_more = True
+            break
+        paginated_cars.append(car)
+        last_key = key
+
+    response = {
         "data": paginated_cars,
-        "total": len(cars),
+        "limit": limit,
+        "next_cursor": encode_cursor({"sort": sort, "after": list(last_key)}) if has_more else None,
+        **extra
+    }
+    if include_total:
+        response["total"] = len(index) if ids is None else len(ids)
+    return jsonify(response), 200
+
+@cars_bp.route('/cars/suggest', methods=['GET'])
+@conditional('cars')
+def suggest_models():
+    # Autocompletado: modelos cuyas palabras empiezan por el texto escrito
+    query = request.args.get('q', '')
+    try:
+        limit = parse_limit(request.args.get('limit'), 10, MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+
+    if not query.strip():
+        return jsonify({"suggestions": []}), 200
+    return jsonify({"suggestions": prefix_index(cars_repo).suggest(query, limit)}), 200
+
+@cars_bp.route('/cars/search', methods=['GET'])
+@conditional('cars')
+def search_cars():
+    # Búsqueda de texto en marca, modelo y extras, ordenada por relevancia
+    query = request.args.get('q', '')
+    try:
+        page = int(request.args.get('page', 1))
+        limit = parse_limit(request.args.get('limit'), 10, MAX_PAGE_SIZE)
+        if page < 1:
+            raise ValueError
+    except ValueError:
+        return jsonify({'error': 'Invalid page or limit'}), 400
+
+    total, ranked = inverted_index(cars_repo).search(query, page * limit)
+    results = [{"score": score, "car": car} for score, car in ranked[(page - 1) * limit:]]
+
+    return jsonify({
+        "query": query,
+        "data": results,
+        "total": total,
         "page": page,
         "limit": limit
     }), 200
@@ -76,22 +182,59 @@ def get_cars():
 @cars_bp.route('/cars', methods=['POST'])
 def create_car():
     new_car = request.json
-    cars = read_db()
 
-    new_car['id'] = max([car['id'] for car in cars], default=0) + 1
+    # El id lo asigna el repositorio dentro del commit para que no se repita entre workers
+    new_car['id'] = None
 
-    error = validate_car_data(new_car, cars)
+    error = validate_car_data(new_car)
     if error:
         return jsonify({'error': error}), 400
 
-    cars.append(new_car)
-    write_db(cars)
+    # La unicidad se vuelve a comprobar dentro del commit: otra petición
+    # simultánea puede haber dado de alta el mismo modelo y año
+    new_car = cars_repo.insert_if(new_car, lambda: not is_duplicate(new_car))
+    if new_car is None:
+        return jsonify({'error': DUPLICATE_CAR}), 400
     return jsonify(new_car), 201
 
+@cars_bp.route('/cars/bulk', methods=['POST'])
+def bulk_create_cars():
+    # Lista JSON de coches: se validan todos y los válidos se guardan en un único commit
+    new_cars = request.get_json(silent=True)
+    if not isinstance(new_cars, list):
+        return jsonify({'error': 'Body must be a JSON list of cars'}), 400
+
+    valid, errors, seen = [], [], set()
+    for i, new_car in enumerate(new_cars):
+        if not isinstance(new_car, dict):
+            errors.append({"index": i, "error": "Car must be a JSON object."})
+            continue
+        new_car = {**new_car, 'id': None}
+        error = validate_car_data(new_car)
+        # Duplicados dentro del propio lote (el índice sólo conoce los coches ya guardados)
+        if not error and (new_car['model'], new_car['year']) in seen:
+            error = DUPLICATE_CAR
+        if error:
+            errors.append({"index": i, "error": error})
+            continue
+        seen.add((new_car['model'], new_car['year']))
+        valid.append((i, new_car))
+
+    # Los válidos se guardan juntos, comprobando otra vez la unicidad dentro del commit
+    saved = cars_repo.append_if([car for _, car in valid], lambda car: not is_duplicate(car)) if valid else []
+    inserted = []
+    for (i, _), car in zip(valid, saved):
+        if car is None:
+            errors.append({"index": i, "error": DUPLICATE_CAR})
+        else:
+            inserted.append(car)
+    errors.sort(key=lambda error: error["index"])
+    return jsonify({"inserted": inserted, "errors": errors}), 201 if inserted else 400
+
 @cars_bp.route('/cars/<int:car_id>', methods=['GET'])
+@conditional('cars')
 def get_car(car_id):
-    cars = read_db()
-    car = next((car for car in cars if car['id'] == car_id), None)
+    car = cars_repo.get(car_id)
     if not car:
         return jsonify({'error': 'Car not found'}), 404
     return jsonify(car)
@@ -99,37 +242,31 @@ def get_car(car_id):
 @cars_bp.route('/cars/<int:car_id>', methods=['PUT'])
 def update_car(car_id):
     updated_car = request.json
-    cars = read_db()
 
     # Validar que el coche exista
-    if not any(car['id'] == car_id for car in cars):
+    existing_car = cars_repo.get(car_id)
+    if not existing_car:
         return jsonify({'error': 'Car not found'}), 404
 
-    # Excluir el coche actual antes de validar
-    other_cars = [car for car in cars if car['id'] != car_id]
+    # El id lo fija la URL: no se puede renumerar un coche ni duplicar el id de otro
+    if updated_car.get('id', car_id) != car_id:
+        return jsonify({'error': 'Car id cannot be changed.'}), 400
 
-    # Validar los datos del coche
-    error = validate_car_data(updated_car, other_cars)
+    # Validar los datos del coche (excluyendo el coche actual de la comprobación de unicidad)
+    error = validate_car_data(updated_car, exclude_id=car_id)
     if error:
         return jsonify({'error': error}), 400
 
-    # Actualizar el coche
-    for car in cars:
-        if car['id'] == car_id:
-            car.update(updated_car)
-            break
-
-    write_db(cars)
+    # Actualizar el coche (sin modificar el registro en caché)
+    updated_car = {**existing_car, **updated_car, 'id': car_id}
+    cars_repo.update(car_id, updated_car)
     return jsonify(updated_car), 200
 
 @cars_bp.route('/cars/<int:car_id>', methods=['DELETE'])
 def delete_car(car_id):
-    cars = read_db()
-    car_to_delete = next((car for car in cars if car['id'] == car_id), None)
+    car_to_delete = cars_repo.delete(car_id)
 
     if car_to_delete:
-        cars.remove(car_to_delete)
-        write_db(cars)
         return jsonify(car_to_delete), 200
 
     return jsonify({'error': 'Car not found'}), 404
\ No newline at end of file
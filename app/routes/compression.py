@@ -0,0 +1,98 @@
+import threading
+import zlib
+from collections import OrderedDict
+
+from flask import request
+
+from config import COMPRESS_CACHE_SIZE, COMPRESS_LEVEL, COMPRESS_MIN_SIZE
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional: sin él sólo se ofrece gzip
+    brotli = None
+
+# Por orden de preferencia cuando el cliente acepta ambas con la misma calidad
+ENCODINGS = ['br', 'gzip'] if brotli else ['gzip']
+COMPRESSIBLE = {'application/json', 'application/x-ndjson', 'text/plain', 'text/html', 'text/csv'}
+BROTLI_QUALITY = 5  # Las calidades altas son demasiado lentas para respuestas dinámicas
+
+_bodies = OrderedDict()  # ETag de la variante comprimida -> (cuerpo, mimetype)
+_bodies_lock = threading.Lock()
+
+
+def negotiate_encoding():
+    """Codificación a usar según Accept-Encoding, o None para enviar sin comprimir."""
+    return request.accept_encodings.best_match(ENCODINGS)
+
+
+def compress_chunks(chunks, encoding, flush=False):
+    """Comprime un iterable de fragmentos; con flush cada fragmento se envía en cuanto se comprime."""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        write, partial, finish = compressor.process, compressor.flush, compressor.finish
+    else:
+        compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, 31)  # 31: formato gzip
+        write, finish = compressor.compress, compressor.flush
+        partial = lambda: compressor.flush(zlib.Z_SYNC_FLUSH)
+    for chunk in chunks:
+        data = write(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+        if flush:
+            data += partial()
+        if data:
+            yield data
+    yield finish()
+
+
+def cached_body(etag):
+    with _bodies_lock:
+        cached = _bodies.get(etag)
+        if cached is not None:
+            _bodies.move_to_end(etag)
+        return cached
+
+
+def _store_body(etag, body, mimetype):
+    with _bodies_lock:
+        _bodies[etag] = (body, mimetype)
+        _bodies.move_to_end(etag)
+        while len(_bodies) > COMPRESS_CACHE_SIZE:
+            _bodies.popitem(last=False)
+
+
+def compress_response(response):
+    """after_request: comprime con brotli/gzip las respuestas de texto grandes.
+
+    Las respuestas en streaming se comprimen fragmento a fragmento. Las que
+    llevan ETag (ver routes.caching) se guardan ya comprimidas con el ETag de
+    su variante para no volver a serializarlas ni comprimirlas mientras la
+    colección no cambie.
+    """
+    if response.mimetype not in COMPRESSIBLE or response.status_code not in (200, 304):
+        return response
+    response.vary.add('Accept-Encoding')
+    if response.status_code != 200 or 'Content-Encoding' in response.headers or response.direct_passthrough:
+        return response
+
+    encoding = negotiate_encoding()
+    if not encoding:
+        return response
+
+    if response.is_streamed:
+        response.response = compress_chunks(response.response, encoding, flush=True)
+        response.headers.pop('Content-Length', None)
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_SIZE:
+        return response
+    compressed = b''.join(compress_chunks([body], encoding))
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        variant = f'{etag}-{encoding}'
+        response.set_etag(variant)
+        _store_body(variant, compressed, response.mimetype)
+    return response
@@ -1,103 +1,98 @@
-import json
-import os
-import jwt
 from flask import Blueprint, jsonify, request
-from functools import wraps
+from routes.auth import token_required
+from storage.favorite_indexes import favorite_sets
+from storage.repository import get_collection
 
 favorites_bp = Blueprint('favorites', __name__)
 
-FAVORITES_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'favorites.json')
-SECRET_KEY = os.environ.get("JWT_SECRET_KEY", "default_dev_key_CHANGE_IN_PRODUCTION")
+favorites_repo = get_collection('favorites')
+cars_repo = get_collection('cars')
+FAVORITES_FILE = favorites_repo.path
 
-def load_favorites():
-    if not os.path.exists(FAVORITES_FILE):
-        with open(FAVORITES_FILE, 'w') as f:
-            json.dump({"favorites": []}, f)
-        return {"favorites": []}
-    
-    with open(FAVORITES_FILE, 'r') as f:
-        return json.load(f)
-
-def save_favorites(data):
-    with open(FAVORITES_FILE, 'w') as f:
-        json.dump(data, f, indent=2)
+def change_favorites(username, change):
+    # `change(carIds actuales)` devuelve la nueva lista, o None si no hay cambios.
+    # Se ejecuta dentro del commit con el registro al día, así que dos peticiones
+    # simultáneas del mismo usuario no pierden el cambio de la otra ni crean dos registros
+    def apply(user):
+        car_ids = change(user['carIds'] if user else [])
+        if car_ids is None:
+            return None
+        return {**(user or {"username": username}), "carIds": car_ids}
 
-# Decorador para extraer username del token JWT
-def token_required(f):
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        token = None
-        auth_header = request.headers.get('Authorization')
-        
-        if auth_header and auth_header.startswith('Bearer '):
-            token = auth_header.split(' ')[1]
-        
-        if not token:
-            return jsonify({'error': 'Token requerido'}), 401
-            
-        try:
-            # Decodificar el token para obtener el username
-            payload = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
-            username = payload['username']
-        except jwt.ExpiredSignatureError:
-            return jsonify({'error': 'Token expirado'}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({'error': 'Token inválido'}), 401
-            
-        return f(username, *args, **kwargs)
-    
-    return decorated
+    user = favorites_repo.modify(username, apply)
+    return user['carIds'] if user else []
 
 # Rutas actualizadas - ya no toman username de la URL
 @favorites_bp.route('/favorites', methods=['GET'])
 @token_required
 def get_user_favorites(username):
-    data = load_favorites()
-    
-    for user in data['favorites']:
-        if user['username'] == username:
-            return jsonify({"carIds": user['carIds']})
-    
+    user = favorites_repo.get(username)
     # Si el usuario no existe, devuelve una lista vacía
-    return jsonify({"carIds": []})
+    car_ids = user['carIds'] if user else []
+    response = {"carIds": car_ids}
+    
+    # ?expand=cars: los coches completos en la misma respuesta (se omiten los ya borrados)
+    if request.args.get('expand') == 'cars':
+        response["cars"] = [car for car in map(cars_repo.get, car_ids) if car]
+    return jsonify(response)
 
 @favorites_bp.route('/favorites/add/<int:car_id>', methods=['POST'])
 @token_required
 def add_favorite(username, car_id):
-    data = load_favorites()
-    
-    # Buscar al usuario en la lista
-    user_exists = False
-    for user in data['favorites']:
-        if user['username'] == username:
-            user_exists = True
-            # Agregar coche a favoritos si no está ya
-            if car_id not in user['carIds']:
-                user['carIds'].append(car_id)
-            break
-    
-    # Si el usuario no existe, lo creamos
-    if not user_exists:
-        data['favorites'].append({
-            "username": username,
-            "carIds": [car_id]
-        })
+    # Agregar coche a favoritos si no está ya; si el índice ya lo tiene no se escribe nada
+    if car_id not in favorite_sets(favorites_repo).car_ids(username):
+        change_favorites(username, lambda car_ids: None if car_id in car_ids else car_ids + [car_id])
     
-    save_favorites(data)
     return jsonify({"message": "Coche añadido a favoritos", "success": True})
 
 @favorites_bp.route('/favorites/remove/<int:car_id>', methods=['DELETE'])
 @token_required
 def remove_favorite(username, car_id):
-    data = load_favorites()
+    user = favorites_repo.get(username)
     
-    for user in data['favorites']:
-        if user['username'] == username:
-            if car_id in user['carIds']:
-                user['carIds'].remove(car_id)
-                save_favorites(data)
-                return jsonify({"message": "Coche eliminado de favoritos", "success": True})
-            else:
-                return jsonify({"message": "El coche no está en favoritos", "success": False})
+    if user:
+        removed = []
+
+        def remove(car_ids):
+            if car_id not in car_ids:
+                return None
+            removed.append(car_id)
+            return [id for id in car_ids if id != car_id]
+
+        if car_id in favorite_sets(favorites_repo).car_ids(username):
+            change_favorites(username, remove)
+        if removed:
+            return jsonify({"message": "Coche eliminado de favoritos", "success": True})
+        else:
+            return jsonify({"message": "El coche no está en favoritos", "success": False})
     
-    return jsonify({"message": "Usuario no encontrado", "success": False})
\ No newline at end of file
+    return jsonify({"message": "Usuario no encontrado", "success": False})
+
+@favorites_bp.route('/favorites/batch', methods=['POST'])
+@token_required
+def batch_favorites(username):
+    # {"add": [ids], "remove": [ids]}: todos los cambios se guardan en una sola escritura
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Se esperaba un objeto JSON con 'add' y/o 'remove'"}), 400
+    to_add, to_remove = data.get('add', []), data.get('remove', [])
+    if not all(isinstance(ids, list) and all(isinstance(id, int) and not isinstance(id, bool) for id in ids)
+               for ids in (to_add, to_remove)):
+        return jsonify({"error": "'add' y 'remove' deben ser listas de ids de coche"}), 400
+    
+    # Primero se quitan y después se añaden los que no estén ya, sobre la lista
+    # que hay en el momento del commit
+    discard = set(to_remove)
+    changes = {}
+
+    def apply(car_ids):
+        current = set(car_ids)
+        changes['removed'] = [id for id in dict.fromkeys(to_remove) if id in current]
+        remaining = current - discard
+        changes['added'] = [id for id in dict.fromkeys(to_add) if id not in remaining]
+        if not (changes['added'] or changes['removed']):
+            return None
+        return [id for id in car_ids if id not in discard] + changes['added']
+
+    car_ids = change_favorites(username, apply)
+    return jsonify({"carIds": car_ids, **changes, "success": True})
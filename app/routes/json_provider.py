@@ -0,0 +1,51 @@
+from flask.json.provider import DefaultJSONProvider
+
+from config import JSON_PROVIDER
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional: sin él se usa el codificador de Flask
+    orjson = None
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Proveedor JSON de Flask que serializa con orjson.
+
+    La salida es la misma que la del proveedor por defecto (claves ordenadas,
+    fechas en formato HTTP, compacta salvo en modo debug) con dos diferencias:
+    los caracteres no ASCII se envían en UTF-8 sin escapar y las claves
+    numéricas se ordenan como texto. Los tipos que orjson no conoce se delegan
+    en `DefaultJSONProvider.default`.
+    """
+
+    def _options(self, indent=False):
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def dumps(self, obj, **kwargs):
+        # Opciones propias de json.dumps (cls, indent=4, ...): se usa el codificador estándar
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default, option=self._options()).decode()
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        body = orjson.dumps(obj, default=self.default, option=self._options(indent))
+        return self._app.response_class(body + b'\n', mimetype=self.mimetype)
+
+
+def json_provider(app):
+    """Proveedor configurado en JSON_PROVIDER; si orjson no está instalado, el de Flask."""
+    if JSON_PROVIDER == 'orjson' and orjson is not None:
+        return OrjsonProvider(app)
+    return DefaultJSONProvider(app)
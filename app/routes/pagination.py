@@ -0,0 +1,36 @@
+import base64
+import json
+from flask import request
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(values):
+    """Cursor opaco para el cliente con los valores de la última posición devuelta."""
+    raw = json.dumps(values, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        return json.loads(raw)
+    except ValueError:
+        raise InvalidCursor("Invalid cursor")
+
+
+def parse_limit(value, default=None, maximum=None):
+    """Tamaño de página de la query string; ValueError si no es un entero positivo."""
+    if value is None:
+        return default
+    limit = int(value)
+    if limit < 1:
+        raise ValueError("limit must be a positive integer")
+    return min(limit, maximum) if maximum else limit
+
+
+def split_arg(name):
+    # Admite tanto ?model=A,B como ?model=A&model=B
+    return [value.strip() for raw in request.args.getlist(name) for value in raw.split(',') if value.strip()]
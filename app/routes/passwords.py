@@ -0,0 +1,111 @@
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from multiprocessing import get_context
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from config import PASSWORD_HASH_METHOD, PASSWORD_QUEUE_LIMIT, PASSWORD_TIMEOUT, PASSWORD_WORKERS
+
+
+class PasswordPoolBusy(Exception):
+    """Hay demasiados hashes pendientes o tardan demasiado: la petición debe reintentarse más tarde."""
+
+
+_pool = None
+_pool_lock = threading.Lock()
+# Operaciones en cola o en curso; al llegar al límite se rechazan las nuevas
+_pending = threading.BoundedSemaphore(PASSWORD_QUEUE_LIMIT)
+
+
+def _executor():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: no se heredan los hilos ni los locks del proceso de Flask
+            _pool = ProcessPoolExecutor(PASSWORD_WORKERS, mp_context=get_context('spawn'))
+        return _pool
+
+
+def _submit(fn, *args):
+    """Envía el cálculo al pool de procesos; PasswordPoolBusy si la cola está llena."""
+    if not _pending.acquire(blocking=False):
+        raise PasswordPoolBusy()
+    try:
+        future = _executor().submit(fn, *args)
+    except BaseException:
+        _pending.release()
+        raise
+    future.add_done_callback(lambda _: _pending.release())
+    return future
+
+
+def _wait(future):
+    """Resultado del cálculo; el hilo de la petición espera como mucho PASSWORD_TIMEOUT segundos."""
+    try:
+        return future.result(timeout=PASSWORD_TIMEOUT)
+    except FutureTimeout:
+        # Si aún no ha empezado se retira de la cola (y libera su plaza)
+        future.cancel()
+        raise PasswordPoolBusy()
+
+
+def hash_password(password):
+    return _wait(_submit(generate_password_hash, password, PASSWORD_HASH_METHOD))
+
+
+def check_password(password_hash, password):
+    return _wait(_submit(check_password_hash, password_hash, password))
+
+
+def _method_of(method):
+    # Forma normalizada del método tal como werkzeug la guarda delante del hash
+    return generate_password_hash('', method).split('$', 1)[0]
+
+
+_method = None
+_method_lock = threading.Lock()
+
+
+def _current_method():
+    """Prefijo del método configurado, o None mientras no se conozca.
+
+    Obtenerlo exige calcular un hash completo, así que se hace una sola vez
+    en el pool y el hilo de la petición nunca lo espera.
+    """
+    global _method
+    with _method_lock:
+        if _method is None:
+            try:
+                _method = _submit(_method_of, PASSWORD_HASH_METHOD)
+            except PasswordPoolBusy:
+                return None
+        if not _method.done():
+            return None
+        if _method.exception() is not None:
+            _method = None  # Se reintenta en la siguiente llamada
+            return None
+        return _method.result()
+
+
+def needs_rehash(password_hash):
+    """Indica si el hash se calculó con otro método o coste que el configurado."""
+    method = _current_method()
+    return method is not None and password_hash.split('$', 1)[0] != method
+
+
+def rehash_later(password, save):
+    """Recalcula el hash con el método actual en segundo plano y lo pasa a `save`.
+
+    Si el pool está ocupado no se hace nada: se volverá a intentar en el
+    siguiente inicio de sesión. `save` se ejecuta en un hilo propio para no
+    bloquear el hilo del executor que entrega los resultados del pool.
+    """
+    try:
+        future = _submit(generate_password_hash, password, PASSWORD_HASH_METHOD)
+    except PasswordPoolBusy:
+        return
+
+    def saved(done):
+        if done.exception() is None:
+            threading.Thread(target=save, args=(done.result(),), daemon=True).start()
+    future.add_done_callback(saved)
@@ -1,111 +1,92 @@
 from flask import Blueprint, jsonify, request
-import json
-import os
+from config import MAX_PAGE_SIZE
+from routes.auth import token_required
+from routes.caching import conditional
+from routes.pagination import decode_cursor, encode_cursor, parse_limit, split_arg
+from storage.repository import get_collection
+from storage.review_indexes import REVIEW_SORT_FIELDS, rating_aggregates, reviews_by_car
 import datetime
-from functools import wraps
-import jwt
 
 reviews_bp = Blueprint('reviews', __name__)
 
-# Configuración
-SECRET_KEY = os.environ.get("JWT_SECRET_KEY", "default_dev_key_CHANGE_IN_PRODUCTION")
-REVIEWS_FILE = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'reviews.json')
-
-# Función para verificar token
-def token_required(f):
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        token = None
-        auth_header = request.headers.get('Authorization')
-        
-        if auth_header and auth_header.startswith('Bearer '):
-            token = auth_header.split(' ')[1]
-        
-        if not token:
-            return jsonify({'error': 'Token requerido'}), 401
-            
-        try:
-            payload = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
-            username = payload['username']
-        except jwt.ExpiredSignatureError:
-            return jsonify({'error': 'Token expirado'}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({'error': 'Token inválido'}), 401
-            
-        return f(username, *args, **kwargs)
-    
-    return decorated
-
-# Funciones para manejar el archivo de reseñas
-def ensure_reviews_file_exists():
-    directory = os.path.dirname(REVIEWS_FILE)
-    if not os.path.exists(directory):
-        os.makedirs(directory)
-    
-    if not os.path.exists(REVIEWS_FILE):
-        with open(REVIEWS_FILE, 'w') as f:
-            json.dump({"reviews": []}, f)
-
-def load_reviews():
-    ensure_reviews_file_exists()
-    try:
-        with open(REVIEWS_FILE, 'r') as f:
-            return json.load(f)
-    except json.JSONDecodeError:
-        return {"reviews": []}
-
-def save_reviews(data):
-    ensure_reviews_file_exists()
-    with open(REVIEWS_FILE, 'w') as f:
-        json.dump(data, f, indent=4)
+reviews_repo = get_collection('reviews')
+REVIEWS_FILE = reviews_repo.path
 
 # Endpoint para obtener reseñas de un coche
 @reviews_bp.route('/reviews/<int:car_id>', methods=['GET'])
+@conditional('reviews')
 def get_reviews(car_id):
-    data = load_reviews()
-    car_reviews = [review for review in data["reviews"] if review["car_id"] == car_id]
-    
-    # Calcular la media de puntuación
-    avg_rating = 0
-    if car_reviews:
-        avg_rating = sum(review["rating"] for review in car_reviews) / len(car_reviews)
-    
-    return jsonify({
+    # Orden por fecha o puntuación ('-' para descendente); sin limit se devuelven todas
+    sort = request.args.get('sort', 'date')
+    cursor = request.args.get('cursor')
+    try:
+        limit = parse_limit(request.args.get('limit'), None, MAX_PAGE_SIZE)
+        after = None
+        if cursor:
+            position = decode_cursor(cursor)
+            sort, after = position['sort'], tuple(position['after'])
+            if not isinstance(sort, str) or len(after) != 2:
+                raise ValueError
+    except (ValueError, TypeError, KeyError):
+        return jsonify({"error": "limit o cursor no válido"}), 400
+    if sort.lstrip('-') not in REVIEW_SORT_FIELDS:
+        return jsonify({"error": f"sort debe ser uno de {', '.join(REVIEW_SORT_FIELDS)}"}), 400
+    value_type = str if sort.lstrip('-') == 'date' else int
+    if after and not (isinstance(after[0], value_type) and isinstance(after[1], int)):
+        return jsonify({"error": "cursor no válido"}), 400
+
+    # Sólo se recorren las reseñas de este coche, ya ordenadas, desde el cursor
+    index = reviews_by_car(reviews_repo).sorted_by(car_id, sort.lstrip('-'))
+    car_reviews, last_key, has_more = [], None, False
+    for key, review in index.scan(after, reverse=sort.startswith('-')):
+        if limit is not None and len(car_reviews) == limit:
+            has_more = True
+            break
+        car_reviews.append(review)
+        last_key = key
+
+    avg_rating, total = rating_aggregates(reviews_repo).average(car_id)
+    response = {
         "reviews": car_reviews,
-        "avgRating": round(avg_rating, 1),
-        "total": len(car_reviews)
-    })
+        "avgRating": avg_rating,
+        "total": total
+    }
+    if limit is not None or cursor:
+        response["next_cursor"] = encode_cursor({"sort": sort, "after": list(last_key)}) if has_more else None
+    return jsonify(response)
 
 # Endpoint para crear una reseña
 @reviews_bp.route('/reviews', methods=['POST'])
 @token_required
 def create_review(username):
-    data = load_reviews()
     review_data = request.json
     
     if not all(key in review_data for key in ["car_id", "text", "rating"]):
         return jsonify({"error": "Faltan datos requeridos"}), 400
     
-    rating = int(review_data.get("rating", 0))
+    # car_id indexa los agregados de puntuaciones: sólo se admiten enteros
+    car_id = review_data["car_id"]
+    if not isinstance(car_id, int) or isinstance(car_id, bool):
+        return jsonify({"error": "car_id debe ser un número entero"}), 400
+    
+    try:
+        rating = int(review_data.get("rating", 0))
+    except (TypeError, ValueError):
+        return jsonify({"error": "La puntuación debe estar entre 1 y 5"}), 400
     if not (1 <= rating <= 5):
         return jsonify({"error": "La puntuación debe estar entre 1 y 5"}), 400
     
-    # Crear ID único para la reseña
-    review_id = 1
-    if data["reviews"]:
-        review_id = max(review["id"] for review in data["reviews"]) + 1
-    
+    # El ID único de la reseña lo asigna el repositorio al guardarla
     new_review = {
-        "id": review_id,
-        "car_id": review_data["car_id"],
+        "id": None,
+        "car_id": car_id,
         "username": username,
         "text": review_data["text"],
         "rating": rating,
         "date": datetime.datetime.now().isoformat()
     }
     
-    data["reviews"].append(new_review)
-    save_reviews(data)
+    new_review = reviews_repo.insert(new_review)
     
     return jsonify({"review": new_review, "success": True}), 201
 
@@ -113,61 +94,77 @@ def create_review(username):
 @reviews_bp.route('/reviews/<int:review_id>', methods=['PUT'])
 @token_required
 def update_review(username, review_id):
-    data = load_reviews()
     review_data = request.json
     
     # Buscar la reseña
-    for review in data["reviews"]:
-        if review["id"] == review_id:
-            # Verificar que es el propietario
-            if review["username"] != username:
-                return jsonify({"error": "No tienes permiso para editar esta reseña"}), 403
-            
-            if "text" in review_data:
-                review["text"] = review_data["text"]
-            
-            if "rating" in review_data:
-                rating = int(review_data["rating"])
-                if not (1 <= rating <= 5):
-                    return jsonify({"error": "La puntuación debe estar entre 1 y 5"}), 400
-                review["rating"] = rating
-            
-            review["updated"] = datetime.datetime.now().isoformat()
-            
-            save_reviews(data)
-            return jsonify({"review": review, "success": True})
+    review = reviews_repo.get(review_id)
+    if not review:
+        return jsonify({"error": "Reseña no encontrada"}), 404
+    
+    # Verificar que es el propietario
+    if review["username"] != username:
+        return jsonify({"error": "No tienes permiso para editar esta reseña"}), 403
+    
+    # Trabajar sobre una copia para no alterar la caché si la validación falla
+    review = dict(review)
+    
+    if "text" in review_data:
+        review["text"] = review_data["text"]
+    
+    if "rating" in review_data:
+        try:
+            rating = int(review_data["rating"])
+        except (TypeError, ValueError):
+            return jsonify({"error": "La puntuación debe estar entre 1 y 5"}), 400
+        if not (1 <= rating <= 5):
+            return jsonify({"error": "La puntuación debe estar entre 1 y 5"}), 400
+        review["rating"] = rating
+    
+    review["updated"] = datetime.datetime.now().isoformat()
     
-    return jsonify({"error": "Reseña no encontrada"}), 404
+    reviews_repo.update(review_id, review)
+    return jsonify({"review": review, "success": True})
 
 # Endpoint para eliminar una reseña
 @reviews_bp.route('/reviews/<int:review_id>', methods=['DELETE'])
 @token_required
 def delete_review(username, review_id):
-    data = load_reviews()
+    review = reviews_repo.get(review_id)
+    if not review:
+        return jsonify({"error": "Reseña no encontrada"}), 404
     
-    for i, review in enumerate(data["reviews"]):
-        if review["id"] == review_id:
-            # Verificar que es el propietario
-            if review["username"] != username:
-                return jsonify({"error": "No tienes permiso para eliminar esta reseña"}), 403
-            
-            del data["reviews"][i]
-            save_reviews(data)
-            return jsonify({"message": "Reseña eliminada correctamente", "success": True})
+    # Verificar que es el propietario
+    if review["username"] != username:
+        return jsonify({"error": "No tienes permiso para eliminar esta reseña"}), 403
     
-    return jsonify({"error": "Reseña no encontrada"}), 404
+    reviews_repo.delete(review_id)
+    return jsonify({"message": "Reseña eliminada correctamente", "success": True})
 
 # Endpoint para obtener la puntuación media de un coche
 @reviews_bp.route('/cars/<int:car_id>/average-rating', methods=['GET'])
+@conditional('reviews')
 def get_average_rating(car_id):
-    data = load_reviews()
-    car_reviews = [review for review in data["reviews"] if review["car_id"] == car_id]
-    
-    if not car_reviews:
-        return jsonify({"avgRating": 0, "total": 0})
-    
-    avg_rating = sum(review["rating"] for review in car_reviews) / len(car_reviews)
+    # Suma y número de reseñas mantenidos con cada escritura: no se recorren las reseñas
+    avg_rating, total = rating_aggregates(reviews_repo).average(car_id)
     return jsonify({
-        "avgRating": round(avg_rating, 1),
-        "total": len(car_reviews)
-    })
\ No newline at end of file
+        "avgRating": avg_rating,
+        "total": total
+    })
+
+# Endpoint para obtener la puntuación media de varios coches (p.ej. una página del catálogo)
+@reviews_bp.route('/cars/average-ratings', methods=['GET'])
+@conditional('reviews')
+def get_average_ratings():
+    try:
+        car_ids = [int(car_id) for car_id in split_arg('ids')]
+    except ValueError:
+        return jsonify({"error": "ids debe ser una lista de ids de coche"}), 400
+    if len(car_ids) > MAX_PAGE_SIZE:
+        return jsonify({"error": f"Como máximo {MAX_PAGE_SIZE} coches por petición"}), 400
+
+    aggregates = rating_aggregates(reviews_repo)
+    ratings = {}
+    for car_id in car_ids:
+        avg_rating, total = aggregates.average(car_id)
+        ratings[str(car_id)] = {"avgRating": avg_rating, "total": total}
+    return jsonify({"ratings": ratings})
@@ -1,54 +1,126 @@
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, Response, current_app, jsonify, request
 from models.sale import Sale
-import json
-import os
+from routes.caching import conditional
+from routes.pagination import decode_cursor, encode_cursor, parse_limit, split_arg
+from storage.repository import get_collection
+from storage.sales_store import DIMENSIONS, FIELDS, METRICS, get_sales_store, verify_rollups
 
 sales_bp = Blueprint('sales', __name__)
 
-SALES_FILE = os.path.abspath(os.path.join(os.path.dirname(__file__), '../database/sales.json'))
-DB_FILE = os.path.abspath(os.path.join(os.path.dirname(__file__), '../database/db.json'))
-
-def read_file(file_path):
-    if not os.path.exists(file_path):
-        return []
-    with open(file_path, 'r') as f:
-        return json.load(f)
-
-def read_sales_db():
-    if not os.path.exists(SALES_FILE):
-        return []
-    with open(SALES_FILE, 'r') as f:
-        return json.load(f)
+sales_repo = get_collection('sales')
+SALES_FILE = sales_repo.path
+STREAM_CHUNK = 1000  # Filas serializadas por fragmento en modo NDJSON
+BULK_BATCH = 5000    # Filas válidas por commit en /sales/bulk
+MAX_BULK_ERRORS = 1000  # Errores detallados como máximo en la respuesta de /sales/bulk
+
+def build_sale(sale_data):
+    """Venta validada con el modelo Sale, en el formato de sales.json (ValueError si no es válida)."""
+    if not isinstance(sale_data, dict):
+        raise ValueError("Sale must be a JSON object.")
+    sale = Sale.from_dict(sale_data).to_dict()
+    del sale['total_units']  # Se calcula en los informes, no se guarda por venta
+    return sale
+
+def wants_ndjson():
+    if request.args.get('format') == 'ndjson':
+        return True
+    return request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson']) == 'application/x-ndjson'
 
 @sales_bp.route('/sales', methods=['GET'])
+@conditional('sales')
 def get_sales():
     model = request.args.get('model')
-    sales = read_sales_db()
-
+    cursor = request.args.get('cursor')
+    fields = split_arg('fields') or list(FIELDS)
+    if any(field not in FIELDS for field in fields):
+        return jsonify({"error": f"fields must be a combination of {', '.join(FIELDS)}"}), 400
+
+    try:
+        limit = parse_limit(request.args.get('limit'))
+        start = decode_cursor(cursor)['pos'] if cursor else 0
+        if not isinstance(start, int):
+            raise ValueError
+    except (ValueError, TypeError, KeyError):
+        return jsonify({"error": "Invalid limit or cursor"}), 400
+
+    store = get_sales_store()
+    mask = None
     if model:
-        sales = [sale for sale in sales if sale['model'].lower() == model.lower()]
-        if not sales:
+        mask = store.model_mask(model)
+        if not mask.any():
             return jsonify({"error": f"No sales found for model '{model}'"}), 404
 
-    return jsonify({"data": sales, "total": len(sales)}), 200
+    positions, total, following = store.page(mask, start, limit)
+    next_cursor = encode_cursor({"pos": following}) if following is not None else None
+
+    if wants_ndjson():
+        # Se serializa por fragmentos: la memoria no depende del número de filas
+        dumps = current_app.json.dumps
+        def generate():
+            for i in range(0, len(positions), STREAM_CHUNK):
+                rows = store.rows(positions[i:i + STREAM_CHUNK], fields)
+                yield ''.join(dumps(row) + '\n' for row in rows)
+
+        response = Response(generate(), mimetype='application/x-ndjson')
+        response.headers['X-Total-Count'] = str(total)
+        if next_cursor:
+            response.headers['X-Next-Cursor'] = next_cursor
+        return response
+
+    body = {"data": store.rows(positions, fields), "total": total}
+    if limit or cursor:
+        body["next_cursor"] = next_cursor
+    return jsonify(body), 200
+
+@sales_bp.route('/sales', methods=['POST'])
+def create_sale():
+    sale_data = request.get_json(silent=True)
+    if sale_data is None:
+        return jsonify({"error": "Invalid JSON body"}), 400
+
+    try:
+        sale = build_sale(sale_data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # La vista columnar y sus agregados se actualizan con el commit, sin recalcular
+    sales_repo.insert(sale)
+    return jsonify(sale), 201
+
+@sales_bp.route('/sales/bulk', methods=['POST'])
+def bulk_create_sales():
+    # Cuerpo NDJSON: una venta por línea. Se lee en streaming y se guarda por lotes,
+    # añadiendo al final de sales.json sin cargar las ventas existentes.
+    inserted, failed, errors, batch = 0, 0, [], []
+    loads = current_app.json.loads
+    for line_number, line in enumerate(request.stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            batch.append(build_sale(loads(line)))
+        except ValueError as e:  # Incluye JSON mal formado
+            failed += 1
+            if len(errors) < MAX_BULK_ERRORS:
+                errors.append({"line": line_number, "error": str(e)})
+            continue
+        if len(batch) >= BULK_BATCH:
+            sales_repo.append(batch)
+            inserted += len(batch)
+            batch = []
+    if batch:
+        sales_repo.append(batch)
+        inserted += len(batch)
+
+    status = 201 if inserted else 400
+    return jsonify({"inserted": inserted, "failed": failed, "errors": errors}), status
 
 @sales_bp.route('/sales/annual', methods=['GET'])
+@conditional('sales')
 def get_annual_sales():
-    sales = read_file(SALES_FILE)
-
-    # Agrupar ventas por país
-    country_sales = {}
-    for sale in sales:
-        country = sale['country']
-        units = sale['units_sold']
-        if country not in country_sales:
-            country_sales[country] = 0
-        country_sales[country] += units
-
-    # Formatear los datos para el frontend
+    # Totales por país ya agregados
     formatted_sales = [
         {"country": country, "total_units": units}
-        for country, units in country_sales.items()
+        for country, units in get_sales_store().rollups.totals_by_country()
     ]
 
     # Ordenar por unidades vendidas de mayor a menor
@@ -57,22 +129,12 @@ def get_annual_sales():
     return jsonify(formatted_sales), 200
 
 @sales_bp.route('/sales/top-models', methods=['GET'])
+@conditional('sales')
 def get_top_models():
-    sales = read_file(SALES_FILE)
-
-    # Agrupar ventas por modelo
-    model_sales = {}
-    for sale in sales:
-        model = sale['model']
-        units = sale['units_sold']
-        if model not in model_sales:
-            model_sales[model] = 0
-        model_sales[model] += units
-
-    # Formatear los datos para el frontend
+    # Totales por modelo ya agregados
     formatted_sales = [
         {"model": model, "total_units": units}
-        for model, units in model_sales.items()
+        for model, units in get_sales_store().rollups.totals_by_model()
     ]
 
     # Ordenar por unidades vendidas de mayor a menor
@@ -81,43 +143,73 @@ def get_top_models():
     return jsonify(formatted_sales), 200
 
 @sales_bp.route('/sales/total-by-year', methods=['GET'])
+@conditional('sales')
 def get_total_sales_by_year():
-    sales = read_file(SALES_FILE)
-
-    # Agrupar ventas por año
-    year_sales = {}
-    for sale in sales:
-        year = sale['year']
-        units = sale['units_sold']
-        year_sales[year] = year_sales.get(year, 0) + units
-
-    # Formatear los datos para el frontend
-    formatted_sales = [{"year": year, "total_units": units} for year, units in year_sales.items()]
-    formatted_sales.sort(key=lambda x: x["year"])  # Ordenar por año
+    # Totales por año ya agregados (ordenados por año)
+    formatted_sales = [
+        {"year": year, "total_units": units}
+        for year, units in get_sales_store().rollups.totals_by_year()
+    ]
 
     return jsonify(formatted_sales), 200
 
 @sales_bp.route('/sales/model/<model_name>', methods=['GET'])
+@conditional('sales')
 def get_sales_by_model(model_name):
-    sales = read_file(SALES_FILE)
-
-    # Filtrar ventas por el modelo especificado
-    model_sales = [sale for sale in sales if sale['model'].lower() == model_name.lower()]
+    # Totales por año del modelo, a partir del agregado (modelo, año)
+    totals = get_sales_store().rollups.model_totals_by_year(model_name)
 
-    if not model_sales:
+    if not totals:
         return jsonify({"error": f"No sales found for model '{model_name}'"}), 404
 
-    # Agrupar ventas por año
-    grouped_sales = {}
-    for sale in model_sales:
-        year = sale['year']
-        units = sale['units_sold']
-        grouped_sales[year] = grouped_sales.get(year, 0) + units
-
-    # Formatear los datos para el frontend
-    formatted_sales = [{"year": year, "units_sold": units} for year, units in grouped_sales.items()]
-    formatted_sales.sort(key=lambda x: x["year"])  # Ordenar por año
+    formatted_sales = [
+        {"year": year, "units_sold": units}
+        for year, units in totals
+    ]
 
     return jsonify({"model": model_name, "sales": formatted_sales}), 200
 
-
+@sales_bp.route('/sales/aggregate', methods=['GET'])
+@conditional('sales')
+def aggregate_sales():
+    group_by = split_arg('group_by')
+    metric = request.args.get('metric', 'sum')
+    sort = request.args.get('sort')
+
+    invalid = [dimension for dimension in group_by if dimension not in DIMENSIONS]
+    if invalid or len(set(group_by)) != len(group_by):
+        return jsonify({"error": f"group_by must be a combination of {', '.join(DIMENSIONS)}"}), 400
+    if metric not in METRICS:
+        return jsonify({"error": f"metric must be one of {', '.join(METRICS)}"}), 400
+    if sort and sort.lstrip('-') not in group_by + [metric]:
+        return jsonify({"error": "sort must be a group_by field or the metric, optionally prefixed with '-'"}), 400
+
+    try:
+        year_from, year_to, limit = (int(request.args[name]) if name in request.args else None
+                                     for name in ('year_from', 'year_to', 'limit'))
+    except ValueError:
+        return jsonify({"error": "year_from, year_to and limit must be integers"}), 400
+    if limit is not None and limit < 1:
+        return jsonify({"error": "limit must be a positive integer"}), 400
+
+    store = get_sales_store()
+    mask = store.filter_mask(year_from, year_to, split_arg('model'), split_arg('country'))
+    results = store.aggregate(group_by, metric, mask)
+
+    # Por defecto se ordena por las dimensiones agrupadas
+    if sort:
+        field = sort.lstrip('-')
+        results.sort(key=lambda x: x[field], reverse=sort.startswith('-'))
+    else:
+        results.sort(key=lambda x: [x[dimension] for dimension in group_by])
+    if limit is not None:
+        results = results[:limit]
+
+    return jsonify({"group_by": group_by, "metric": metric, "data": results}), 200
+
+@sales_bp.route('/sales/rollups/check', methods=['GET'])
+@conditional('sales')
+def check_sales_rollups():
+    # Compara los agregados mantenidos incrementalmente con un recálculo completo
+    mismatches = verify_rollups()
+    return jsonify({"consistent": not mismatches, "mismatches": mismatches}), 200 if not mismatches else 500
@@ -0,0 +1,214 @@
+import heapq
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime
+from itertools import accumulate
+
+
+def parse_datetime(date, time=None):
+    """datetime de una fecha ('YYYY-MM-DD') y hora opcional ('HH:MM'); ValueError si no es válida.
+
+    Las fechas son siempre locales: una zona horaria (p.ej. '10:00+02:00')
+    también es un ValueError, porque no se pueden comparar con las demás.
+    """
+    if not isinstance(date, str) or (time is not None and not isinstance(time, str)):
+        raise ValueError("Fecha u hora no válida")
+    value = datetime.fromisoformat(f'{date}T{time}' if time else date)
+    if value.tzinfo is not None:
+        raise ValueError("Fecha u hora con zona horaria")
+    return value
+
+
+def booking_interval(booking):
+    """Intervalo [recogida, devolución) de una reserva, o None si sus fechas no son válidas."""
+    try:
+        start = parse_datetime(booking.get('date'), booking.get('time'))
+        end = parse_datetime(booking.get('return_date'), booking.get('return_time'))
+    except ValueError:
+        return None
+    return (start, end) if start < end else None
+
+
+class BookingIntervals:
+    """Índice de intervalos de las reservas de cada coche para detectar solapamientos.
+
+    Por coche se guardan las reservas ordenadas por inicio y, para cada
+    posición, el fin más tardío hasta ella: una reserva [inicio, fin) se
+    solapa con alguna si entre las que empiezan antes de `fin` hay una que
+    acaba después de `inicio`, lo que se resuelve con una búsqueda binaria
+    aunque haya solapamientos antiguos. Las listas de un coche se sustituyen
+    enteras al cambiar (copy-on-write).
+    """
+
+    def __init__(self, records=()):
+        grouped = {}
+        for record in records:
+            interval = booking_interval(record)
+            if interval:
+                grouped.setdefault(record.get('car_id'), []).append((*interval, record.get('id')))
+        self._cars = {car_id: self._build(sorted(entries)) for car_id, entries in grouped.items()}
+
+    @staticmethod
+    def _build(entries):
+        starts = [start for start, _, _ in entries]
+        reach = list(accumulate((end for _, end, _ in entries), max))
+        return entries, starts, reach
+
+    @staticmethod
+    def apply_changes(index, changes):
+        by_car = {}
+        for old, new in changes:
+            if old is not None and booking_interval(old):
+                by_car.setdefault(old.get('car_id'), []).append((old, None))
+            if new is not None and booking_interval(new):
+                by_car.setdefault(new.get('car_id'), []).append((None, new))
+        for car_id, car_changes in by_car.items():
+            entries = list(index._cars[car_id][0]) if car_id in index._cars else []
+            for old, new in car_changes:
+                if old is not None:
+                    entry = (*booking_interval(old), old.get('id'))
+                    i = bisect_left(entries, entry)
+                    if i < len(entries) and entries[i] == entry:
+                        del entries[i]
+                if new is not None:
+                    insort(entries, (*booking_interval(new), new.get('id')))
+            if entries:
+                index._cars[car_id] = index._build(entries)
+            else:
+                index._cars.pop(car_id, None)
+
+    def overlaps(self, car_id, start, end):
+        """Indica si alguna reserva del coche se solapa con [start, end)."""
+        cached = self._cars.get(car_id)
+        if cached is None:
+            return False
+        _, starts, reach = cached
+        i = bisect_left(starts, end)
+        return i > 0 and reach[i - 1] > start
+
+
+class BookingCalendar:
+    """Reservas de cada coche ordenadas por (recogida, id) para consultarlas por rango de fechas.
+
+    Como en BookingIntervals, `reach` guarda por coche el fin más tardío hasta
+    cada posición, así que las reservas que terminan antes de la ventana se
+    saltan con una búsqueda binaria; las de todos los coches se mezclan en
+    orden con heapq.merge. Un cambio sólo reconstruye las listas de su coche
+    (copy-on-write), no las de todo el calendario.
+    """
+
+    def __init__(self, records=()):
+        grouped = {}
+        for record in records:
+            interval = booking_interval(record)
+            if interval:
+                grouped.setdefault(record.get('car_id'), []).append(((interval[0], record.get('id')), interval[1], record))
+        self._cars = {car_id: self._build(sorted(entries, key=lambda entry: entry[0]))
+                      for car_id, entries in grouped.items()}
+
+    @staticmethod
+    def _build(entries):
+        keys = [key for key, _, _ in entries]
+        ends = [end for _, end, _ in entries]
+        records = [record for _, _, record in entries]
+        return keys, ends, records, list(accumulate(ends, max))
+
+    @staticmethod
+    def apply_changes(calendar, changes):
+        by_car = {}
+        for old, new in changes:
+            if old is not None and booking_interval(old):
+                by_car.setdefault(old.get('car_id'), []).append((old, None))
+            if new is not None and booking_interval(new):
+                by_car.setdefault(new.get('car_id'), []).append((None, new))
+        for car_id, car_changes in by_car.items():
+            keys, ends, records, _ = calendar._cars.get(car_id, ([], [], [], []))
+            entries, keys = list(zip(keys, ends, records)), list(keys)
+            for old, new in car_changes:
+                if old is not None:
+                    key = (booking_interval(old)[0], old.get('id'))
+                    i = bisect_left(keys, key)
+                    if i < len(keys) and keys[i] == key:
+                        del entries[i], keys[i]
+                if new is not None:
+                    interval = booking_interval(new)
+                    key = (interval[0], new.get('id'))
+                    i = bisect_left(keys, key)
+                    entries.insert(i, (key, interval[1], new))
+                    keys.insert(i, key)
+            if entries:
+                calendar._cars[car_id] = calendar._build(entries)
+            else:
+                calendar._cars.pop(car_id, None)
+
+    @staticmethod
+    def _window(entries, start, end, after, reverse):
+        keys, ends, records, reach = entries
+        lo = 0 if start is None else bisect_right(reach, start)
+        hi = len(keys) if end is None else bisect_left(keys, (end,))
+        if after is not None:
+            if reverse:
+                hi = min(hi, bisect_left(keys, after))
+            else:
+                lo = max(lo, bisect_right(keys, after))
+        positions = range(hi - 1, lo - 1, -1) if reverse else range(lo, hi)
+        for i in positions:
+            if start is None or ends[i] > start:
+                yield keys[i], records[i]
+
+    def window(self, start=None, end=None, after=None, reverse=False):
+        """Pares (clave, reserva) que se solapan con [start, end), en orden, después de la clave `after`."""
+        after = None if after is None else tuple(after)
+        cars = [self._window(entries, start, end, after, reverse) for entries in list(self._cars.values())]
+        return heapq.merge(*cars, key=lambda pair: pair[0], reverse=reverse)
+
+
+def booking_calendar(collection):
+    return collection.view('calendar', BookingCalendar, BookingCalendar.apply_changes)
+
+
+def booking_intervals(collection):
+    return collection.view('intervals:car_id', BookingIntervals, BookingIntervals.apply_changes)
+
+
+class BookingsByUser:
+    """Índice user_id -> reservas del usuario, en orden de id.
+
+    La lista de un usuario se sustituye entera cuando cambia (copy-on-write).
+    """
+
+    def __init__(self, records=()):
+        self._users = {}
+        for record in records:
+            self._users.setdefault(self.key(record), []).append(record)
+
+    @staticmethod
+    def key(record):
+        return str(record.get('user_id'))
+
+    @staticmethod
+    def apply_changes(index, changes):
+        by_user = {}
+        for old, new in changes:
+            if old is not None:
+                by_user.setdefault(index.key(old), []).append((old, None))
+            if new is not None:
+                by_user.setdefault(index.key(new), []).append((None, new))
+        for user_id, user_changes in by_user.items():
+            bookings = list(index._users.get(user_id, []))
+            for old, new in user_changes:
+                if old is not None:
+                    bookings = [booking for booking in bookings if booking.get('id') != old.get('id')]
+                if new is not None:
+                    bookings.append(new)
+            if bookings:
+                index._users[user_id] = sorted(bookings, key=lambda booking: booking.get('id') or 0)
+            else:
+                index._users.pop(user_id, None)
+
+    def bookings(self, user_id):
+        """Reservas del usuario (lista compartida: no debe modificarse)."""
+        return self._users.get(str(user_id), [])
+
+
+def bookings_by_user(collection):
+    return collection.view('bookings:user_id', BookingsByUser, BookingsByUser.apply_changes)
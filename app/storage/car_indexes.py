@@ -0,0 +1,442 @@
+import heapq
+import math
+import re
+import threading
+from bisect import bisect_left, bisect_right, insort
+
+SORT_FIELDS = ('id', 'year', 'make')
+
+
+def sort_value(field, value):
+    """Valor comparable de un campo de ordenación (las marcas sin distinguir mayúsculas)."""
+    if field == 'make':
+        return value.lower() if isinstance(value, str) else ''
+    return value if isinstance(value, int) and not isinstance(value, bool) else 0
+
+
+class SortedIndex:
+    """Coches ordenados por (campo, id) para paginar por clave.
+
+    Las dos listas paralelas se sustituyen enteras en cada cambio (copy-on-write):
+    quien está recorriendo una página sigue con la versión que tomó.
+    """
+
+    def __init__(self, field, records=()):
+        self.field = field
+        entries = sorted((self.key(record), record) for record in records)
+        self._entries = ([key for key, _ in entries], [record for _, record in entries])
+
+    def key(self, record):
+        return (sort_value(self.field, record.get(self.field)), record.get('id'))
+
+    def __len__(self):
+        return len(self._entries[0])
+
+    @staticmethod
+    def apply_changes(index, changes):
+        keys, records = (list(entries) for entries in index._entries)
+        for old, new in changes:
+            if old is not None:
+                i = bisect_left(keys, index.key(old))
+                if i < len(keys) and keys[i] == index.key(old):
+                    del keys[i], records[i]
+            if new is not None:
+                i = bisect_right(keys, index.key(new))
+                keys.insert(i, index.key(new))
+                records.insert(i, new)
+        index._entries = (keys, records)
+
+    def scan(self, after=None, reverse=False):
+        """Pares (clave, coche) en orden, empezando justo después de la clave `after`."""
+        keys, records = self._entries
+        if reverse:
+            end = len(keys) if after is None else bisect_left(keys, tuple(after))
+            positions = range(end - 1, -1, -1)
+        else:
+            start = 0 if after is None else bisect_right(keys, tuple(after))
+            positions = range(start, len(keys))
+        for i in positions:
+            yield keys[i], records[i]
+
+    def scan_within(self, records, after=None, reverse=False, limit=None):
+        """Como `scan`, pero sólo sobre `records` (p.ej. los coches de un filtro) y hasta `limit`.
+
+        Cuesta O(len(records) · log limit) en vez de recorrer el índice entero
+        saltando los coches que no pasan el filtro.
+        """
+        entries = [(self.key(record), record) for record in records]
+        if after is not None:
+            after = tuple(after)
+            entries = [entry for entry in entries if (entry[0] < after if reverse else entry[0] > after)]
+        if limit is None:
+            return sorted(entries, key=lambda entry: entry[0], reverse=reverse)
+        select = heapq.nlargest if reverse else heapq.nsmallest
+        return select(limit, entries, key=lambda entry: entry[0])
+
+
+def sorted_index(collection, field):
+    return collection.view(f'sorted:{field}', lambda records: SortedIndex(field, records),
+                           SortedIndex.apply_changes)
+
+
+class PrefixIndex:
+    """Índice de prefijos de palabra sobre el modelo de los coches.
+
+    Las palabras distintas (en minúsculas) se guardan ordenadas, así que las
+    que empiezan por un prefijo forman un rango contiguo que se localiza con
+    bisect; cada palabra apunta a los ids de los coches que la contienen.
+    """
+
+    def __init__(self, records=()):
+        self._lock = threading.Lock()
+        self._postings = {}   # palabra -> ids de coches
+        self._cars = {}       # id -> coche
+        for record in records:
+            self._add(record)
+        self._words = sorted(self._postings)
+
+    @staticmethod
+    def words(model):
+        return {word.lower() for word in model.split()} if isinstance(model, str) else set()
+
+    def _add(self, record):
+        car_id = record.get('id')
+        self._cars[car_id] = record
+        for word in self.words(record.get('model')):
+            self._postings.setdefault(word, set()).add(car_id)
+
+    @staticmethod
+    def apply_changes(index, changes):
+        with index._lock:
+            for old, new in changes:
+                if old is not None:
+                    car_id = old.get('id')
+                    index._cars.pop(car_id, None)
+                    for word in index.words(old.get('model')):
+                        ids = index._postings.get(word)
+                        if ids is not None:
+                            ids.discard(car_id)
+                            if not ids:
+                                del index._postings[word]
+                                del index._words[bisect_left(index._words, word)]
+                if new is not None:
+                    for word in index.words(new.get('model')):
+                        if word not in index._postings:
+                            insort(index._words, word)
+                    index._add(new)
+
+    def _prefixed(self, prefix):
+        ids = set()
+        i = bisect_left(self._words, prefix)
+        while i < len(self._words) and self._words[i].startswith(prefix):
+            ids |= self._postings[self._words[i]]
+            i += 1
+        return ids
+
+    def lookup(self, query):
+        """Ids de los coches con una palabra del modelo que empieza por cada término de `query`."""
+        with self._lock:
+            ids = None
+            for term in query.lower().split():
+                matches = self._prefixed(term)
+                ids = matches if ids is None else ids & matches
+                if not ids:
+                    break
+            return set(self._cars) if ids is None else ids
+
+    def records(self, ids):
+        """Coches de `ids` ordenados por id."""
+        with self._lock:
+            return [self._cars[car_id] for car_id in sorted(ids) if car_id in self._cars]
+
+    def suggest(self, query, limit):
+        """Los `limit` modelos que coinciden con `query`, primero los que tienen más coches."""
+        counts = {}
+        for car in self.records(self.lookup(query)):
+            counts[car.get('model')] = counts.get(car.get('model'), 0) + 1
+        return sorted(counts, key=lambda model: (-counts[model], model))[:limit]
+
+
+def prefix_index(collection):
+    return collection.view('prefix:model', PrefixIndex, PrefixIndex.apply_changes)
+
+
+# Peso de cada campo en la relevancia: coincidir en el modelo cuenta más que en un extra
+SEARCH_FIELDS = {'model': 3.0, 'make': 2.0, 'features': 1.0}
+
+
+def tokenize(text):
+    return re.findall(r'[a-z0-9]+', text.lower()) if isinstance(text, str) else []
+
+
+class InvertedIndex:
+    """Índice invertido sobre marca, modelo y extras de los coches.
+
+    Cada término apunta a {id: peso}, donde el peso suma los campos en los que
+    aparece. Una búsqueda sólo recorre las listas de sus términos, así que su
+    coste depende de cuántos coches coinciden y no del tamaño del catálogo.
+    """
+
+    def __init__(self, records=()):
+        self._lock = threading.Lock()
+        self._postings = {}   # término -> {id: peso}
+        self._cars = {}       # id -> coche
+        for record in records:
+            self._add(record)
+
+    @staticmethod
+    def terms(record):
+        weights = {}
+        for field, weight in SEARCH_FIELDS.items():
+            values = record.get(field)
+            texts = values if isinstance(values, list) else [values]
+            # Un término cuenta una vez por campo aunque se repita
+            for term in {term for text in texts for term in tokenize(text)}:
+                weights[term] = weights.get(term, 0.0) + weight
+        return weights
+
+    def _add(self, record):
+        car_id = record.get('id')
+        self._cars[car_id] = record
+        for term, weight in self.terms(record).items():
+            self._postings.setdefault(term, {})[car_id] = weight
+
+    def _remove(self, record):
+        car_id = record.get('id')
+        self._cars.pop(car_id, None)
+        for term in self.terms(record):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(car_id, None)
+                if not postings:
+                    del self._postings[term]
+
+    @staticmethod
+    def apply_changes(index, changes):
+        with index._lock:
+            for old, new in changes:
+                if old is not None:
+                    index._remove(old)
+                if new is not None:
+                    index._add(new)
+
+    def search(self, query, limit=None):
+        """Coches que contienen algún término de `query`, del más al menos relevante.
+
+        Primero los que coinciden con más términos; a igualdad, por la suma de
+        idf (estilo BM25) por el peso del campo. Devuelve el total de
+        coincidencias y los `limit` primeros como pares (puntuación, coche).
+        """
+        with self._lock:
+            total_cars = len(self._cars)
+            scores, matched = {}, {}
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term, {})
+                idf = math.log(1 + (total_cars - len(postings) + 0.5) / (len(postings) + 0.5))
+                for car_id, weight in postings.items():
+                    scores[car_id] = scores.get(car_id, 0.0) + idf * weight
+                    matched[car_id] = matched.get(car_id, 0) + 1
+            def rank(car_id):
+                return (-matched[car_id], -scores[car_id], car_id)
+
+            ranking = sorted(scores, key=rank) if limit is None else heapq.nsmallest(limit, scores, key=rank)
+            return len(scores), [(round(scores[car_id], 4), self._cars[car_id]) for car_id in ranking]
+
+
+def inverted_index(collection):
+    return collection.view('inverted', InvertedIndex, InvertedIndex.apply_changes)
+
+
+FACETS = ('make', 'year', 'features')
+
+
+def bits(bitmap):
+    """Posiciones de los bits activos, en orden ascendente.
+
+    Se recorre el entero byte a byte y sólo se miran los bits de los bytes
+    distintos de cero.
+    """
+    positions = []
+    data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, 'little')
+    for i, byte in enumerate(data):
+        while byte:
+            low = byte & -byte
+            positions.append(i * 8 + low.bit_length() - 1)
+            byte ^= low
+    return positions
+
+
+class BitmapIndex:
+    """Un bitmap por marca, año y extra, con un bit por coche.
+
+    Cada id de coche ocupa una posición densa (`_slots`), reutilizando las que
+    dejan los borrados, así que el tamaño de los bitmaps depende del número de
+    coches y no del id más alto. Los bitmaps son enteros de Python: combinar
+    filtros es un AND/OR entre enteros y contar coincidencias es
+    int.bit_count(). Las búsquedas por marca y extra no distinguen mayúsculas.
+    """
+
+    def __init__(self, records=()):
+        self._lock = threading.Lock()
+        self._bitmaps = {facet: {} for facet in FACETS}
+        self._all = 0
+        self._slots = {}  # id -> posición del bit
+        self._ids = []    # posición -> id (None si está libre)
+        self._free = []
+        for record in records:
+            self._set(record, True)
+
+    @staticmethod
+    def values(record, facet):
+        value = record.get(facet)
+        values = value if isinstance(value, list) else [value]
+        return {value for value in values if isinstance(value, (str, int)) and not isinstance(value, bool)}
+
+    def _slot(self, car_id):
+        slot = self._slots.get(car_id)
+        if slot is None:
+            if self._free:
+                slot = self._free.pop()
+                self._ids[slot] = car_id
+            else:
+                slot = len(self._ids)
+                self._ids.append(car_id)
+            self._slots[car_id] = slot
+        return slot
+
+    def _set(self, record, present):
+        car_id = record.get('id')
+        if not isinstance(car_id, int) or isinstance(car_id, bool):
+            return
+        if not present and car_id not in self._slots:
+            return
+        bit = 1 << self._slot(car_id)
+        for facet in FACETS:
+            bitmaps = self._bitmaps[facet]
+            for value in self.values(record, facet):
+                bitmap = bitmaps.get(value, 0)
+                bitmap = bitmap | bit if present else bitmap & ~bit
+                if bitmap:
+                    bitmaps[value] = bitmap
+                else:
+                    bitmaps.pop(value, None)
+        if present:
+            self._all |= bit
+        else:
+            # Un coche borrado (o el valor anterior de una actualización) libera su posición
+            self._all &= ~bit
+            self._ids[self._slots.pop(car_id)] = None
+            self._free.append(bit.bit_length() - 1)
+
+    def _bitmap_of(self, ids):
+        bitmap = 0
+        for car_id in ids:
+            slot = self._slots.get(car_id)
+            if slot is not None:
+                bitmap |= 1 << slot
+        return bitmap
+
+    @staticmethod
+    def apply_changes(index, changes):
+        with index._lock:
+            for old, new in changes:
+                if old is not None:
+                    index._set(old, False)
+                if new is not None:
+                    index._set(new, True)
+
+    def _union(self, facet, wanted):
+        wanted = {str(value).lower() for value in wanted}
+        result = 0
+        for value, bitmap in self._bitmaps[facet].items():
+            if str(value).lower() in wanted:
+                result |= bitmap
+        return result
+
+    def _years(self, year_from, year_to):
+        result = 0
+        for year, bitmap in self._bitmaps['year'].items():
+            if isinstance(year, int) and (year_from is None or year >= year_from) and (year_to is None or year <= year_to):
+                result |= bitmap
+        return result
+
+    def _counts(self, facet, selected):
+        counts = {}
+        for value, bitmap in self._bitmaps[facet].items():
+            count = (bitmap & selected).bit_count()
+            if count:
+                counts[value] = count
+        return counts
+
+    def query(self, makes=None, year_from=None, year_to=None, features=None, within=None):
+        """Ids (ascendentes) de los coches que cumplen los filtros y recuento por faceta.
+
+        Marcas: cualquiera de `makes`; años: entre `year_from` y `year_to`;
+        extras: todos los de `features`. `within` restringe a un conjunto previo
+        de ids (p.ej. el resultado de la búsqueda por modelo). El recuento de
+        cada faceta aplica los demás filtros pero no el suyo, para poder ampliar
+        la selección.
+        """
+        with self._lock:
+            base = self._all if within is None else self._all & self._bitmap_of(within)
+            filters = {
+                'make': self._union('make', makes) if makes else None,
+                'year': self._years(year_from, year_to) if year_from is not None or year_to is not None else None,
+                'features': None,
+            }
+            for feature in features or ():
+                bitmap = self._union('features', [feature])
+                filters['features'] = bitmap if filters['features'] is None else filters['features'] & bitmap
+
+            def combine(excluded=None):
+                selected = base
+                for facet, bitmap in filters.items():
+                    if bitmap is not None and facet != excluded:
+                        selected &= bitmap
+                return selected
+
+            selected = combine()
+            facets = {
+                'make': self._counts('make', combine('make')),
+                'year': self._counts('year', combine('year')),
+                'features': self._counts('features', selected),
+            }
+            # Las posiciones se traducen a ids bajo el mismo lock con el que se asignaron
+            return sorted(self._ids[slot] for slot in bits(selected)), facets
+
+
+def bitmap_index(collection):
+    return collection.view('bitmaps', BitmapIndex, BitmapIndex.apply_changes)
+
+
+class ModelYearIndex:
+    """Índice hash (modelo, año) -> ids, para comprobar la unicidad sin recorrer el catálogo."""
+
+    def __init__(self, records=()):
+        self._ids = {}
+        for record in records:
+            self._ids.setdefault(self.key(record), set()).add(record.get('id'))
+
+    @staticmethod
+    def key(record):
+        return (record.get('model'), record.get('year'))
+
+    @staticmethod
+    def apply_changes(index, changes):
+        for old, new in changes:
+            if old is not None:
+                ids = index._ids.get(index.key(old), set()) - {old.get('id')}
+                if ids:
+                    index._ids[index.key(old)] = ids
+                else:
+                    index._ids.pop(index.key(old), None)
+            if new is not None:
+                index._ids[index.key(new)] = index._ids.get(index.key(new), set()) | {new.get('id')}
+
+    def conflicts(self, model, year, exclude_id=None):
+        """Indica si otro coche (distinto de `exclude_id`) tiene ya ese modelo y año."""
+        return bool(self._ids.get((model, year), set()) - {exclude_id})
+
+
+def model_year_index(collection):
+    return collection.view('unique:model_year', ModelYearIndex, ModelYearIndex.apply_changes)
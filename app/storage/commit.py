@@ -0,0 +1,277 @@
+import os
+import threading
+from concurrent.futures import Future
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    """Bloqueo exclusivo entre procesos (p.ej. workers de gunicorn) sobre un fichero auxiliar."""
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        if fcntl:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        else:
+            while True:
+                try:
+                    msvcrt.locking(self._fd, msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(self._fd, 0, os.SEEK_SET)
+            msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        os.close(self._fd)
+        self._fd = None
+
+
+CONDITIONAL = ('insert_if', 'append_if', 'modify')
+
+
+class DuplicateKey(KeyError):
+    """Alta con una clave que ya existe en la colección."""
+
+
+class GroupCommit:
+    """Agrupa en un único commit las escrituras que llegan mientras otro está en curso.
+
+    Cada escritura se encola como una operación (op, arg). El primer hilo que
+    encuentra la cola libre actúa como líder: toma el lote pendiente, lo aplica
+    con `_commit(ops)` (que debe devolver un resultado por operación y resolver
+    con `_checked` las operaciones condicionales: `insert_if`, `append_if` y
+    `modify`) y repite
+    mientras sigan llegando operaciones. Los demás hilos sólo esperan su
+    resultado, de modo que N escritores concurrentes pagan un fsync en lugar de N.
+    Si el resultado de una operación es una excepción (p.ej. DuplicateKey), sólo
+    falla esa operación; el resto del lote se guarda.
+    """
+
+    def _init_group_commit(self):
+        self._queue_lock = threading.Lock()
+        self._pending = []
+        self._committing = False
+        self.commits = 0
+
+    def _submit(self, op, arg):
+        return self._submit_many([(op, arg)])[0]
+
+    def _submit_many(self, ops):
+        """Encola varias operaciones a la vez: se aplican en el mismo commit y en orden."""
+        futures = [Future() for _ in ops]
+        with self._queue_lock:
+            self._pending.extend((op, arg, future) for (op, arg), future in zip(ops, futures))
+            leader = not self._committing
+            self._committing = True
+        if leader:
+            self._drain()
+        return [future.result() for future in futures]
+
+    def append(self, records):
+        """Añade varios registros en un único commit. Devuelve los registros guardados."""
+        return self._submit_many([('insert', record) for record in records])
+
+    def insert_if(self, record, check):
+        """Añade `record` sólo si `check()` es cierto en el momento del commit.
+
+        `check` se evalúa con los locks de la colección tomados y los datos
+        al día, así que dos escritores no pueden validar contra el mismo
+        estado (p.ej. dos reservas solapadas). Devuelve el registro guardado,
+        o None si `check()` lo rechazó.
+        """
+        return self._submit('insert_if', (record, check))
+
+    def append_if(self, records, check):
+        """Como `append`, pero sólo con los registros para los que `check(record)` es cierto.
+
+        Las comprobaciones se hacen en el commit, como en `insert_if`, y los
+        registros aceptados se guardan juntos. Devuelve un resultado por
+        registro: el registro guardado o None si se rechazó.
+        """
+        return self._submit('append_if', (list(records), check))
+
+    def modify(self, key, change):
+        """Lectura-modificación-escritura atómica del registro con clave `key`.
+
+        `change(registro)` recibe el registro actual (o None si no existe) con
+        los locks tomados, como los `check` de `insert_if`, y devuelve el
+        registro nuevo o None si no hay nada que cambiar. Así dos escritores
+        no pueden perder el cambio del otro. Devuelve el registro resultante.
+        """
+        return self._submit('modify', (key, change))
+
+    def _checked(self, ops):
+        """Resuelve la operación condicional con la que puede empezar un lote.
+
+        Devuelve las operaciones a aplicar y una función que, a partir de sus
+        resultados, compone los del lote original (None para lo rechazado).
+        """
+        op, arg = ops[0]
+        if op == 'insert_if':
+            record, check = arg
+            if check():
+                return [('insert', record)] + ops[1:], lambda results: results
+            return ops[1:], lambda results: [None] + results
+        if op == 'append_if':
+            records, check = arg
+            accepted = [check(record) for record in records]
+            inserts = [('insert', record) for record, ok in zip(records, accepted) if ok]
+
+            def restore(results):
+                saved = iter(results[:len(inserts)])
+                return [[next(saved) if ok else None for ok in accepted]] + results[len(inserts):]
+            return inserts + ops[1:], restore
+        if op == 'modify':
+            key, change = arg
+            current = self.get(key)
+            record = change(current)
+            if record is None:
+                return ops[1:], lambda results: [current] + results
+            write = ('update', (key, record)) if current is not None else ('insert', record)
+
+            def restore(results):
+                failed = isinstance(results[0], Exception)
+                return [results[0] if failed else record] + results[1:]
+            return [write] + ops[1:], restore
+        return ops, lambda results: results
+
+    def _drain(self):
+        while True:
+            with self._queue_lock:
+                # Un alta condicional abre siempre un lote nuevo: su comprobación
+                # tiene que ver aplicadas las operaciones anteriores
+                cut = next((i for i, (op, _, _) in enumerate(self._pending)
+                            if op in CONDITIONAL and i > 0), len(self._pending))
+                batch, self._pending = self._pending[:cut], self._pending[cut:]
+                if not batch:
+                    self._committing = False
+                    return
+            try:
+                results = self._commit([(op, arg) for op, arg, _ in batch])
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+            else:
+                self.commits += 1
+                self.writes += len(batch)
+                for (_, _, future), result in zip(batch, results):
+                    if isinstance(result, Exception):
+                        future.set_exception(result)
+                    else:
+                        future.set_result(result)
+
+
+class IdSequence:
+    """Siguiente id entero de una colección, persistido en `<fichero>.seq`.
+
+    Evita recalcular max(id) en cada alta y que se reutilicen los ids de
+    registros borrados. Debe usarse con el bloqueo de fichero de la colección.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def load(self):
+        try:
+            with open(self.path) as f:
+                return int(f.read().strip())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def save(self, next_id):
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(str(next_id))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def advance(self, current, inserted, key):
+        """Tras un commit, guarda el siguiente id si las altas `inserted` han superado `current`."""
+        ids = [record.get(key) for record in inserted if isinstance(record.get(key), int)]
+        if ids and (current is None or max(ids) + 1 > current):
+            self.save(max(ids) + 1)
+
+
+def with_key(record, key, value):
+    record = dict(record)
+    record[key] = value
+    return record
+
+
+def apply_ops(records, ops, key, next_id=None):
+    """Aplica en orden las operaciones sobre una copia de `records`.
+
+    Las altas sin clave reciben el siguiente id entero, a partir de `next_id`
+    si se conoce (secuencia persistida) o de max(id) + 1 si no. Devuelve la
+    nueva lista de registros y el resultado de cada operación: el registro
+    guardado para 'insert' (o DuplicateKey si su clave ya existe), el registro
+    anterior (o None) para 'update' y 'delete'.
+    """
+    records = list(records)
+    positions = None
+    results = []
+
+    for op, arg in ops:
+        if op == 'replace':
+            records = list(arg)
+            positions = None
+            next_id = None
+            results.append(None)
+            continue
+
+        if positions is None and key:
+            positions = {record.get(key): i for i, record in enumerate(records) if record is not None}
+
+        if op == 'insert':
+            record = arg
+            if key and record.get(key) is None:
+                if next_id is None:
+                    next_id = max((k for k in positions if isinstance(k, int)), default=0) + 1
+                while next_id in positions:  # Secuencia por detrás de los datos (p.ej. edición manual)
+                    next_id += 1
+                record = with_key(record, key, next_id)
+            elif key and record.get(key) in positions:
+                results.append(DuplicateKey(record.get(key)))
+                continue
+            if key:
+                positions[record.get(key)] = len(records)
+                if isinstance(record.get(key), int) and next_id is not None:
+                    next_id = max(next_id, record.get(key) + 1)
+            records.append(record)
+            results.append(record)
+        elif op == 'update':
+            old_key, record = arg
+            i = positions.get(old_key)
+            results.append(records[i] if i is not None else None)
+            if i is not None:
+                records[i] = record
+                del positions[old_key]
+                positions[record.get(key)] = i
+        elif op == 'delete':
+            i = positions.pop(arg, None)
+            results.append(records[i] if i is not None else None)
+            if i is not None:
+                records[i] = None  # Se compacta al final para no desplazar posiciones
+
+    return [record for record in records if record is not None], results
+
+
+def has_changes(ops, results):
+    """Indica si alguna operación del lote modificó la colección."""
+    return any(op == 'replace' or (result is not None and not isinstance(result, Exception))
+               for (op, _), result in zip(ops, results))
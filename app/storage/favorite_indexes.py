@@ -0,0 +1,23 @@
+class FavoriteSets:
+    """Índice username -> conjunto de ids de coches favoritos, para comprobar la pertenencia en O(1).
+
+    El conjunto de cada usuario es un frozenset que se sustituye entero al cambiar.
+    """
+
+    def __init__(self, records=()):
+        self._sets = {record.get('username'): frozenset(record.get('carIds', [])) for record in records}
+
+    @staticmethod
+    def apply_changes(index, changes):
+        for old, new in changes:
+            if old is not None:
+                index._sets.pop(old.get('username'), None)
+            if new is not None:
+                index._sets[new.get('username')] = frozenset(new.get('carIds', []))
+
+    def car_ids(self, username):
+        return self._sets.get(username, frozenset())
+
+
+def favorite_sets(collection):
+    return collection.view('favorites:sets', FavoriteSets, FavoriteSets.apply_changes)
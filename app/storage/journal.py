@@ -0,0 +1,276 @@
+import json
+import os
+import threading
+
+from storage.commit import DuplicateKey, with_key
+from storage.json_store import JsonCollection, file_signature, inserted
+from storage.views import changes_from
+
+
+class JournaledCollection(JsonCollection):
+    """Colección con diario de escritura (append-only) sobre el último snapshot JSON.
+
+    Cada alta, modificación o baja añade una línea al diario
+    (`<fichero>.journal`) con un número de secuencia, en lugar de reescribir el
+    fichero completo. Los lectores cargan el snapshot y reproducen el diario
+    encima; si otro proceso sólo ha añadido líneas, se reproduce únicamente la
+    cola nueva. Al superar `compact_threshold` entradas, un hilo en segundo
+    plano vuelca el estado a un snapshot nuevo y vacía el diario.
+
+    Las operaciones son idempotentes (insert/update sobrescriben, delete ignora
+    claves ausentes), por lo que volver a aplicar entradas ya incluidas en el
+    snapshot tras una caída durante la compactación no altera el resultado.
+    """
+
+    def __init__(self, name, path, key, wrapper=None, indent=4, compact_threshold=1000):
+        super().__init__(name, path, key=key, wrapper=wrapper, indent=indent)
+        self.journal_path = os.path.splitext(self.path)[0] + '.journal'
+        self.compact_threshold = compact_threshold
+        self._journal_signature = None
+        self._journal_offset = 0
+        self._journal_entries = 0
+        self._seq = 0
+        self._max_id = 0
+        self._next_id = None
+        self._compact_lock = threading.Lock()
+        self._compacting = False
+        self.compactions = 0
+
+    # --- Lectura -----------------------------------------------------------
+
+    def _revalidate(self):
+        snapshot = file_signature(self.path)
+        journal = file_signature(self.journal_path)
+        if self._version and snapshot == self._signature and journal == self._journal_signature:
+            return
+
+        previous = self._journal_signature
+        only_journal_grew = (
+            self._version and self._by_key is not None
+            and snapshot == self._signature and journal is not None
+            and (previous is None and self._journal_offset == 0
+                 or previous is not None and journal[2] == previous[2] and journal[1] >= self._journal_offset)
+        )
+        self._signature = snapshot
+        self._journal_signature = journal
+        if only_journal_grew:
+            # Otro proceso ha añadido entradas: sólo hace falta reproducir la cola
+            self._replay_journal()
+            self._records = None
+            self._views = {}
+            self._version += 1
+        else:
+            self._invalidate()
+
+    def _ensure_loaded(self):
+        self._revalidate()
+        if self._by_key is None:
+            self.misses += 1
+            self._by_key = {}
+            self._max_id = 0
+            for record in self._parse():
+                self._apply({"op": "insert", "record": record})
+            self._journal_offset = 0
+            self._journal_entries = 0
+            self._replay_journal()
+        else:
+            self.hits += 1
+
+    def _replay_journal(self):
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, 'rb') as f:
+            f.seek(self._journal_offset)
+            for line in f:
+                # Una última línea sin salto es una escritura interrumpida: se ignora
+                if not line.endswith(b'\n'):
+                    break
+                self._journal_offset += len(line)
+                entry = json.loads(line)
+                self._seq = max(self._seq, entry['seq'])
+                if entry['op'] != 'checkpoint':
+                    self._apply(entry)
+                    self._journal_entries += 1
+
+    def _apply(self, entry):
+        op = entry['op']
+        if op == 'delete':
+            self._by_key.pop(entry['key'], None)
+            return
+        record = entry['record']
+        new_key = record.get(self.key)
+        if op == 'update' and entry['key'] != new_key:
+            self._by_key.pop(entry['key'], None)
+        self._by_key[new_key] = record
+        if isinstance(new_key, int) and new_key > self._max_id:
+            self._max_id = new_key
+
+    def fingerprint(self):
+        with self._lock:
+            self._revalidate()
+            signatures = [signature for signature in (self._signature, self._journal_signature) if signature]
+            if not signatures:
+                return 'empty', None
+            token = '.'.join(f'{mtime_ns:x}-{size:x}-{ino:x}' for mtime_ns, size, ino in signatures)
+            return token, max(mtime_ns for mtime_ns, _, _ in signatures) / 1e9
+
+    def all(self):
+        with self._lock:
+            self._ensure_loaded()
+            if self._records is None:
+                self._records = list(self._by_key.values())
+            return self._records
+
+    def scan(self):
+        return self.all()
+
+    def get(self, key):
+        with self._lock:
+            self._ensure_loaded()
+            return self._by_key.get(key)
+
+    # --- Escritura ---------------------------------------------------------
+
+    def _entry(self, op, arg):
+        """Traduce una operación a una entrada del diario y su resultado (None si no cambia nada)."""
+        if op == 'insert':
+            record = arg
+            if record.get(self.key) is None:
+                next_id = max(self._max_id + 1, self._next_id or 0)
+                record = with_key(record, self.key, next_id)
+                self._next_id = next_id + 1
+            elif record.get(self.key) in self._by_key:
+                return None, DuplicateKey(record.get(self.key))
+            return {"op": "insert", "key": record.get(self.key), "record": record}, record
+        key = arg[0] if op == 'update' else arg
+        existing = self._by_key.get(key)
+        if existing is None:
+            return None, None
+        if op == 'update':
+            return {"op": "update", "key": key, "record": arg[1]}, existing
+        return {"op": "delete", "key": key}, existing
+
+    def _apply_batch(self, ops):
+        """Escribe el lote en el diario; `_commit` ya ha tomado los locks."""
+        # Reproducir lo que otros procesos hayan añadido antes de escribir
+        self._ensure_loaded()
+        previous = self._version
+        next_id = self._next_id = self.sequence.load()
+        lines, results = [], []
+        try:
+            for op, arg in ops:
+                entry, result = self._entry(op, arg)
+                results.append(result)
+                if entry is None:
+                    continue
+                self._seq += 1
+                entry = {"seq": self._seq, **entry}
+                self._apply(entry)
+                lines.append((json.dumps(entry) + '\n').encode('utf-8'))
+            if lines:
+                self._append_lines(b''.join(lines))
+                self.sequence.advance(next_id, inserted(ops, results), self.key)
+                self._update_views(changes_from(ops, results), previous)
+        except Exception:
+            # El estado en memoria puede ir por delante del disco: forzar recarga
+            self._invalidate()
+            raise
+        return results
+
+    def _append_lines(self, data):
+        os.makedirs(os.path.dirname(self.journal_path), exist_ok=True)
+        with open(self.journal_path, 'ab') as f:
+            # Descartar una posible línea a medio escribir antes de añadir las nuevas
+            if f.tell() > self._journal_offset:
+                f.truncate(self._journal_offset)
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+        self._journal_offset += len(data)
+        self._journal_entries += data.count(b'\n')
+        self._journal_signature = file_signature(self.journal_path)
+        self._records = None
+        self._version += 1
+
+        if self._journal_entries >= self.compact_threshold and not self._compacting:
+            self._compacting = True
+            threading.Thread(target=self.compact, daemon=True).start()
+
+    def replace(self, records):
+        with self._compact_lock, self._locked():
+            self._ensure_loaded()
+            self._by_key = {}
+            for record in records:
+                self._apply({"op": "insert", "record": record})
+            self._install_snapshot(self._prepare_snapshot(list(self._by_key.values())), b'')
+            self._records = None
+            self._views = {}
+            self._version += 1
+            self.writes += 1
+
+    # --- Compactación ------------------------------------------------------
+
+    def _prepare_snapshot(self, records):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # Nombre único por proceso: la compactación prepara el snapshot sin el bloqueo de fichero
+        tmp_snapshot = f'{self.path}.{os.getpid()}.tmp'
+        with open(tmp_snapshot, 'w') as f:
+            self._dump(f, records)
+            f.flush()
+            os.fsync(f.fileno())
+        return tmp_snapshot
+
+    def _install_snapshot(self, tmp_snapshot, journal_tail):
+        """Sustituye snapshot y diario; el diario nuevo sólo conserva las entradas `journal_tail`."""
+        checkpoint = (json.dumps({"seq": self._seq, "op": "checkpoint"}) + '\n').encode('utf-8')
+        tmp_journal = self.journal_path + '.tmp'
+        with open(tmp_journal, 'wb') as f:
+            f.write(checkpoint + journal_tail)
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.replace(tmp_snapshot, self.path)
+        os.replace(tmp_journal, self.journal_path)
+        self._signature = file_signature(self.path)
+        self._journal_signature = file_signature(self.journal_path)
+        self._journal_offset = len(checkpoint) + len(journal_tail)
+        self._journal_entries = journal_tail.count(b'\n')
+
+    def compact(self):
+        """Vuelca el diario en un snapshot nuevo sin bloquear a los escritores mientras se serializa."""
+        with self._compact_lock:
+            try:
+                with self._lock:
+                    self._ensure_loaded()
+                    records = list(self._by_key.values())
+                    folded_offset = self._journal_offset
+                    folded_journal = self._journal_signature
+
+                tmp_snapshot = self._prepare_snapshot(records)
+
+                with self._locked():
+                    self._ensure_loaded()
+                    if self._journal_signature is None or folded_journal is None \
+                            or self._journal_signature[2] != folded_journal[2]:
+                        # Otro proceso ha compactado mientras tanto: este snapshot ya no sirve
+                        os.remove(tmp_snapshot)
+                        return
+                    # Entradas añadidas (por este u otros procesos) mientras se escribía el snapshot
+                    with open(self.journal_path, 'rb') as f:
+                        f.seek(folded_offset)
+                        journal_tail = f.read(self._journal_offset - folded_offset)
+                    self._install_snapshot(tmp_snapshot, journal_tail)
+                    self.compactions += 1
+            finally:
+                self._compacting = False
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            stats.update({
+                "journal_entries": self._journal_entries,
+                "journal_seq": self._seq,
+                "compactions": self.compactions
+            })
+        return stats
@@ -0,0 +1,348 @@
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+
+from storage.commit import FileLock, GroupCommit, IdSequence, apply_ops, has_changes
+from storage.views import DerivedViews, changes_from
+
+logger = logging.getLogger(__name__)
+
+
+def file_signature(path):
+    """Firma barata de un fichero: (mtime, tamaño, inode), o None si no existe."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def inserted(ops, results):
+    return [result for (op, _), result in zip(ops, results)
+            if op == 'insert' and not isinstance(result, Exception)]
+
+
+class JsonCollection(GroupCommit, DerivedViews):
+    """Colección persistida en un fichero JSON con los registros ya parseados en memoria.
+
+    El fichero sólo se vuelve a leer cuando cambia su firma (mtime, tamaño e
+    inode), de modo que las lecturas repetidas no pagan el coste de json.load.
+    Cada cambio de contenido incrementa `version`, que sirve para invalidar
+    cualquier estructura derivada de la colección.
+
+    Las escrituras se serializan entre procesos con `<fichero>.lock`, se
+    aplican sobre el contenido más reciente del disco y sustituyen el fichero
+    de forma atómica (fichero temporal + rename), salvo las altas que se
+    añaden al final (ver `_append_in_place`).
+    """
+
+    def __init__(self, name, path, key=None, wrapper=None, indent=4):
+        self.name = name
+        self.path = os.path.abspath(path)
+        self.key = key          # Campo que identifica cada registro (None si no hay clave)
+        self.wrapper = wrapper  # Clave del objeto raíz, p.ej. {"reviews": [...]}
+        self.indent = indent
+        self.lock_path = self.path + '.lock'
+        self.undo_path = self.path + '.undo'
+        self.sequence = IdSequence(self.path + '.seq') if key else None
+        self._lock = threading.RLock()
+        self._file_locked = False  # Este proceso tiene el bloqueo de fichero (ver _locked)
+        self._signature = None
+        self._records = None
+        self._by_key = None
+        self._views = {}
+        self._version = 0
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self._init_group_commit()
+
+    # --- Lectura -----------------------------------------------------------
+
+    def _invalidate(self):
+        self._records = None
+        self._by_key = None
+        self._views = {}
+        self._version += 1
+
+    def _revalidate(self):
+        signature = file_signature(self.path)
+        if self._version == 0 or signature != self._signature:
+            self._signature = signature
+            self._invalidate()
+
+    def _read(self):
+        with open(self.path, 'r') as f:
+            return json.load(f)
+
+    def _parse(self):
+        """Registros del fichero. Si no se puede parsear lanza JSONDecodeError en vez de devolver [].
+
+        Un fallo puede deberse a un append in situ de otro proceso a medio
+        escribir: se vuelve a leer con el bloqueo de fichero, deshaciendo
+        antes un append interrumpido por una caída (ver `_recover`). Si aun
+        así falla, la excepción evita tanto servir una colección vacía como
+        que un commit la sobrescriba.
+        """
+        if self._signature is None:
+            return []
+        try:
+            data = self._read()
+        except json.JSONDecodeError:
+            try:
+                if self._file_locked:
+                    data = self._recover_and_read()
+                else:
+                    with FileLock(self.lock_path):
+                        data = self._recover_and_read()
+            except json.JSONDecodeError as e:
+                logger.error("Error al cargar %s: %s", self.path, e)
+                raise
+        if self.wrapper:
+            return data.get(self.wrapper, [])
+        return data
+
+    def _recover_and_read(self):
+        if self._recover():
+            logger.warning("Deshecho un append interrumpido en %s", self.path)
+        return self._read()
+
+    def _recover(self):
+        """Restaura el final del fichero si quedó un append in situ a medio escribir. Requiere el bloqueo de fichero."""
+        try:
+            with open(self.undo_path) as f:
+                undo = json.load(f)
+        except FileNotFoundError:
+            return False
+        except json.JSONDecodeError:
+            # La caída fue al escribir el propio registro de deshacer: el fichero no se llegó a tocar
+            os.remove(self.undo_path)
+            return False
+        with open(self.path, 'r+b') as f:
+            f.seek(undo['size'])
+            f.truncate()
+            f.write(undo['tail'].encode('utf-8'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.remove(self.undo_path)
+        return True
+
+    def _ensure_loaded(self):
+        self._revalidate()
+        if self._records is None:
+            self.misses += 1
+            self._records = self._parse()
+        else:
+            self.hits += 1
+
+    @property
+    def version(self):
+        with self._lock:
+            self._revalidate()
+            return self._version
+
+    def fingerprint(self):
+        """(token, fecha de modificación) del contenido persistido.
+
+        A diferencia de `version`, que es un contador propio de cada proceso,
+        el token es el mismo en todos los workers para el mismo contenido, así
+        que sirve para construir ETags.
+        """
+        with self._lock:
+            self._revalidate()
+            if self._signature is None:
+                return 'empty', None
+            mtime_ns, size, ino = self._signature
+            return f'{mtime_ns:x}-{size:x}-{ino:x}', mtime_ns / 1e9
+
+    def all(self):
+        """Devuelve la lista de registros en caché. No debe modificarse in situ."""
+        with self._lock:
+            self._ensure_loaded()
+            return self._records
+
+    def scan(self):
+        """Registros actuales sin guardarlos en caché, para quien mantiene su propia representación."""
+        with self._lock:
+            self._revalidate()
+            if self._records is not None:
+                return self._records
+            return self._parse()
+
+    def get(self, key):
+        with self._lock:
+            records = self.all()
+            if self._by_key is None:
+                self._by_key = {record.get(self.key): record for record in records}
+            return self._by_key.get(key)
+
+    def find(self, **criteria):
+        """Registros cuyos campos coinciden exactamente con `criteria`."""
+        return [record for record in self.all()
+                if all(record.get(field) == value for field, value in criteria.items())]
+
+    # --- Escritura ---------------------------------------------------------
+
+    def _dump(self, f, records):
+        data = {self.wrapper: records} if self.wrapper else records
+        json.dump(data, f, indent=self.indent)
+
+    def _save(self, records):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            self._dump(f, records)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self._signature = file_signature(self.path)
+        self._records = records
+        self._by_key = None
+        self._version += 1
+
+    def _append_in_place(self, records):
+        """Añade registros al final del array del fichero sin leerlo ni reescribirlo.
+
+        Sólo se usa en colecciones sin envoltorio cuando todas las altas se
+        pueden añadir tal cual (ver `_appendable`): se sustituye el `]` final
+        por los registros nuevos con el mismo formato que json.dump. Devuelve
+        False si el fichero no tiene esa forma y hay que reescribirlo.
+
+        Antes de tocar el fichero se guarda en `<fichero>.undo` cómo restaurar
+        el final original. Si la escritura falla se restaura en el momento; si
+        el proceso muere a mitad, lo hace `_recover` en la siguiente lectura.
+        Mientras tanto los lectores de otros procesos pueden ver el fichero
+        incompleto: `_parse` entonces reintenta con el bloqueo de fichero.
+        """
+        if self._signature is None:
+            return False
+        body = json.dumps(records, indent=self.indent)[1:-1]  # Elementos ya indentados, sin corchetes
+        with open(self.path, 'r+b') as f:
+            end = f.seek(0, os.SEEK_END)
+            start = max(0, end - 4096)
+            f.seek(start)
+            tail = f.read()
+            stripped = tail.rstrip()
+            if not stripped.endswith(b']'):
+                return False
+            last = stripped[:-1].rstrip()
+            if not last:
+                return False
+            cut = start + len(last)
+            separator = '' if last.endswith(b'[') else ','
+            with open(self.undo_path, 'w') as undo:
+                json.dump({"size": cut, "tail": tail[len(last):].decode('utf-8')}, undo)
+                undo.flush()
+                os.fsync(undo.fileno())
+            try:
+                f.seek(cut)
+                f.truncate()
+                f.write((separator + body + ']').encode('utf-8'))
+                f.flush()
+                os.fsync(f.fileno())
+            except BaseException:
+                f.seek(cut)
+                f.truncate()
+                f.write(tail[len(last):])
+                f.flush()
+                os.remove(self.undo_path)
+                raise
+            os.remove(self.undo_path)
+        self._signature = file_signature(self.path)
+        if self._records is not None:
+            self._records = self._records + records
+        if self._records is not None and self._by_key is not None:
+            # El mapa por clave se amplía en vez de reconstruirse (get() lo lee con el lock)
+            self._by_key.update((record.get(self.key), record) for record in records)
+        else:
+            self._by_key = None
+        self._version += 1
+        return True
+
+    def _appendable(self, records):
+        """Indica si las altas se pueden añadir al final del fichero sin pasar por apply_ops.
+
+        Sin clave siempre; con clave, sólo si todas la traen ya (no hay que
+        asignar ids) y no existe ninguna, p.ej. los usuarios, cuya clave es el
+        username. Con clave la colección tiene que estar cargada.
+        """
+        if self.key is None:
+            return True
+        keys = [record.get(self.key) for record in records]
+        if None in keys or len(set(keys)) != len(keys):
+            return False
+        if self._by_key is None:
+            self._by_key = {record.get(self.key): record for record in self._records}
+        return not any(key in self._by_key for key in keys)
+
+    @contextmanager
+    def _locked(self):
+        """Lock de la colección y bloqueo de fichero, para escribir."""
+        with self._lock, FileLock(self.lock_path):
+            self._file_locked = True
+            try:
+                yield
+            finally:
+                self._file_locked = False
+
+    def _commit(self, ops):
+        with self._locked():
+            ops, restore = self._checked(ops)
+            results = self._apply_batch(ops) if ops else []
+            return restore(results)
+
+    def _apply_batch(self, ops):
+        """Aplica un lote con los locks ya tomados. Devuelve un resultado por operación."""
+        if self.wrapper is None and all(op == 'insert' for op, _ in ops):
+            # Sólo altas: se añaden al final del fichero en vez de reescribirlo
+            # (sin clave, ni siquiera hace falta cargarlo)
+            if self.key is None:
+                self._revalidate()
+            else:
+                self._ensure_loaded()
+            previous = self._version
+            records = [arg for _, arg in ops]
+            if self._appendable(records) and self._append_in_place(records):
+                self._update_views([(None, record) for record in records], previous)
+                return records
+
+        # Releer si otro proceso ha escrito desde la última lectura
+        self._ensure_loaded()
+        previous = self._version
+        next_id = self.sequence.load() if self.sequence else None
+        records, results = apply_ops(self._records, ops, self.key, next_id)
+        if has_changes(ops, results):
+            self._save(records)
+            if self.sequence:
+                self.sequence.advance(next_id, inserted(ops, results), self.key)
+            self._update_views(changes_from(ops, results), previous)
+        return results
+
+    def replace(self, records):
+        self._submit('replace', list(records))
+
+    def insert(self, record):
+        """Añade `record`; si no trae clave se le asigna el siguiente id. Devuelve el registro guardado."""
+        return self._submit('insert', record)
+
+    def update(self, key, record):
+        """Sustituye el registro con clave `key` por `record`. Devuelve el registro anterior."""
+        return self._submit('update', (key, record))
+
+    def delete(self, key):
+        """Elimina el registro con clave `key`. Devuelve el registro eliminado o None."""
+        return self._submit('delete', key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "collection": self.name,
+                "version": self._version,
+                "hits": self.hits,
+                "misses": self.misses,
+                "writes": self.writes,
+                "commits": self.commits,
+                "cached_records": len(self._records) if self._records is not None else None
+            }
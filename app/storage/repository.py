@@ -0,0 +1,45 @@
+import os
+
+from config import (DATABASE_DIR, JOURNALED_COLLECTIONS, JOURNAL_COMPACT_THRESHOLD,
+                    SQLITE_PATH, STORAGE_BACKEND)
+from storage.json_store import JsonCollection
+from storage.journal import JournaledCollection
+from storage.sqlite_store import SCHEMAS, SqliteCollection, SqliteDatabase
+
+# nombre: (fichero JSON, clave, objeto raíz, sangría)
+COLLECTIONS = {
+    'cars': ('db.json', 'id', None, 4),
+    'sales': ('sales.json', None, None, 4),
+    'users': ('users.json', 'username', None, 4),
+    'bookings': ('bookings.json', 'id', None, 4),
+    'reviews': ('reviews.json', 'id', 'reviews', 4),
+    'favorites': ('favorites.json', 'username', 'favorites', 2),
+}
+
+
+def json_collection(name):
+    filename, key, wrapper, indent = COLLECTIONS[name]
+    path = os.path.join(DATABASE_DIR, filename)
+    # El diario necesita una clave por registro (las ventas no la tienen)
+    if name in JOURNALED_COLLECTIONS and key:
+        return JournaledCollection(name, path, key, wrapper=wrapper, indent=indent,
+                                   compact_threshold=JOURNAL_COMPACT_THRESHOLD)
+    return JsonCollection(name, path, key=key, wrapper=wrapper, indent=indent)
+
+
+def _build_collections():
+    if STORAGE_BACKEND == 'sqlite':
+        database = SqliteDatabase(SQLITE_PATH)
+        return {name: SqliteCollection(name, database, SCHEMAS[name]) for name in COLLECTIONS}
+    return {name: json_collection(name) for name in COLLECTIONS}
+
+
+_COLLECTIONS = _build_collections()
+
+
+def get_collection(name):
+    return _COLLECTIONS[name]
+
+
+def cache_stats():
+    return [collection.stats() for collection in _COLLECTIONS.values()]
@@ -0,0 +1,107 @@
+from storage.car_indexes import SortedIndex
+
+REVIEW_SORT_FIELDS = ('date', 'rating')
+
+
+def rating_of(review):
+    rating = review.get('rating')
+    return rating if isinstance(rating, (int, float)) else 0
+
+
+def car_of(review):
+    """car_id de la reseña, o None si no es un entero (p.ej. datos editados a mano)."""
+    car_id = review.get('car_id')
+    return car_id if isinstance(car_id, int) and not isinstance(car_id, bool) else None
+
+
+class RatingAggregates:
+    """Suma y número de puntuaciones por coche, mantenidos con cada alta, cambio o baja de reseña.
+
+    Cada coche guarda una tupla (suma, número) que se sustituye entera, así que
+    quien lee sin el lock de la colección nunca ve una media a medio actualizar.
+    """
+
+    def __init__(self, records=()):
+        self._totals = {}
+        for record in records:
+            self._add(record, 1)
+
+    def _add(self, review, sign):
+        car_id = car_of(review)
+        if car_id is None:
+            return
+        total, count = self._totals.get(car_id, (0, 0))
+        total, count = total + sign * rating_of(review), count + sign
+        if count:
+            self._totals[car_id] = (total, count)
+        else:
+            self._totals.pop(car_id, None)
+
+    @staticmethod
+    def apply_changes(aggregates, changes):
+        for old, new in changes:
+            if old is not None:
+                aggregates._add(old, -1)
+            if new is not None:
+                aggregates._add(new, 1)
+
+    def average(self, car_id):
+        """(media redondeada a un decimal, número de reseñas); (0, 0) si no tiene reseñas."""
+        total, count = self._totals.get(car_id, (0, 0))
+        return (round(total / count, 1), count) if count else (0, 0)
+
+
+def rating_aggregates(collection):
+    return collection.view('ratings', RatingAggregates, RatingAggregates.apply_changes)
+
+
+class ReviewSortedIndex(SortedIndex):
+    """Reseñas de un coche ordenadas por (fecha o puntuación, id)."""
+
+    def key(self, record):
+        value = record.get(self.field)
+        if self.field == 'rating':
+            return (value if isinstance(value, int) else 0, record.get('id'))
+        return (value if isinstance(value, str) else '', record.get('id'))
+
+
+class ReviewsByCar:
+    """Índice car_id -> reseñas del coche, ordenadas por cada campo de REVIEW_SORT_FIELDS.
+
+    Un cambio sólo copia las listas del coche afectado (copy-on-write, ver
+    SortedIndex), no las de todas las reseñas.
+    """
+
+    def __init__(self, records=()):
+        grouped = {}
+        for record in records:
+            if car_of(record) is not None:
+                grouped.setdefault(car_of(record), []).append(record)
+        self._cars = {car_id: {field: ReviewSortedIndex(field, reviews) for field in REVIEW_SORT_FIELDS}
+                      for car_id, reviews in grouped.items()}
+
+    @staticmethod
+    def apply_changes(index, changes):
+        by_car = {}
+        for old, new in changes:
+            if old is not None and car_of(old) is not None:
+                by_car.setdefault(car_of(old), []).append((old, None))
+            if new is not None and car_of(new) is not None:
+                by_car.setdefault(car_of(new), []).append((None, new))
+        for car_id, car_changes in by_car.items():
+            indexes = index._cars.get(car_id) or {field: ReviewSortedIndex(field) for field in REVIEW_SORT_FIELDS}
+            for field_index in indexes.values():
+                SortedIndex.apply_changes(field_index, car_changes)
+            if len(indexes[REVIEW_SORT_FIELDS[0]]):
+                index._cars[car_id] = indexes
+            else:
+                index._cars.pop(car_id, None)
+
+    def sorted_by(self, car_id, field):
+        """Índice ordenado de las reseñas del coche (vacío si no tiene)."""
+        indexes = self._cars.get(car_id)
+        return indexes[field] if indexes else ReviewSortedIndex(field)
+
+
+def reviews_by_car(collection):
+    return collection.view('reviews:car_id', ReviewsByCar, ReviewsByCar.apply_changes)
@@ -0,0 +1,408 @@
+import threading
+
+import numpy as np
+
+from storage.repository import get_collection
+
+DIMENSIONS = ('year', 'model', 'country')
+METRICS = ('sum', 'avg', 'count', 'min', 'max')
+FIELDS = ('year', 'model', 'country', 'units_sold')
+DENSE_GROUPS = 1 << 20  # Máximo de grupos posibles para agrupar con bincount
+YEAR_RANGE = (int(np.iinfo(np.int16).min), int(np.iinfo(np.int16).max))
+UNITS_RANGE = (0, int(np.iinfo(np.int32).max))
+
+
+def storable(sale):
+    """Indica si la venta cabe en las columnas (año int16, unidades int32 no negativas).
+
+    Las filas que no caben (p.ej. editadas a mano en sales.json) se omiten
+    tanto en las columnas como en los agregados en vez de desbordarlas.
+    """
+    year, units = sale.get('year'), sale.get('units_sold')
+    return (isinstance(year, int) and not isinstance(year, bool) and YEAR_RANGE[0] <= year <= YEAR_RANGE[1]
+            and isinstance(units, int) and not isinstance(units, bool) and UNITS_RANGE[0] <= units <= UNITS_RANGE[1]
+            and isinstance(sale.get('model'), str) and isinstance(sale.get('country'), str))
+
+
+class SalesStore:
+    """Ventas en formato columnar con modelo y país codificados por diccionario.
+
+    Cada venta ocupa una posición en cuatro arrays de numpy (año, unidades,
+    código de modelo y código de país), unos 12 bytes por fila frente a los
+    cientos de bytes de un dict. Las agregaciones por país, modelo o año se
+    resuelven con np.bincount sobre los códigos en lugar de recorrer filas.
+
+    Las altas se añaden al final de los arrays (que crecen por duplicación) y
+    actualizan los agregados de `rollups`, así que no obligan a reconstruir.
+    Se publican sustituyendo de una vez la tupla `_columns` de vistas: cada
+    consulta toma esa tupla una sola vez (`_snapshot`) y trabaja con cuatro
+    columnas del mismo tamaño aunque entre otra alta mientras tanto.
+    """
+
+    def __init__(self):
+        self.models = []          # código -> nombre del modelo
+        self.countries = []       # código -> nombre del país
+        self._model_codes = {}    # nombre -> código
+        self._country_codes = {}
+        self._year = np.empty(0, dtype=np.int16)
+        self._units = np.empty(0, dtype=np.int32)
+        self._model = np.empty(0, dtype=np.int32)
+        self._country = np.empty(0, dtype=np.int32)
+        self._size = 0
+        self._columns = (self._year, self._units, self._model, self._country)
+        self._lock = threading.Lock()
+        self.rollups = SalesRollups()
+
+    @classmethod
+    def from_records(cls, records):
+        store = cls()
+        years, units, models, countries = [], [], [], []
+        for sale in filter(storable, records):
+            years.append(sale['year'])
+            units.append(sale['units_sold'])
+            models.append(store._encode(store.models, store._model_codes, sale['model']))
+            countries.append(store._encode(store.countries, store._country_codes, sale['country']))
+        store._year = np.array(years, dtype=np.int16)
+        store._units = np.array(units, dtype=np.int32)
+        store._model = np.array(models, dtype=np.int32)
+        store._country = np.array(countries, dtype=np.int32)
+        store._size = len(years)
+        store._publish()
+        store.rollups = SalesRollups.from_store(store)
+        return store
+
+    @staticmethod
+    def _encode(values, codes, value):
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(values)
+            values.append(value)
+        return code
+
+    # Las columnas son vistas sobre la parte ocupada de los buffers; una
+    # ampliación posterior no afecta a las vistas que ya tenga un lector.
+    def _publish(self):
+        self._columns = tuple(column[:self._size] for column in (self._year, self._units, self._model, self._country))
+
+    def _snapshot(self, mask=None):
+        """(año, unidades, modelo, país) de una misma alta; recortadas a `mask` si se calculó antes de otras altas."""
+        columns = self._columns
+        if mask is not None and len(mask) < len(columns[0]):
+            return tuple(column[:len(mask)] for column in columns)
+        return columns
+
+    @property
+    def year(self):
+        return self._columns[0]
+
+    @property
+    def units(self):
+        return self._columns[1]
+
+    @property
+    def model(self):
+        return self._columns[2]
+
+    @property
+    def country(self):
+        return self._columns[3]
+
+    def __len__(self):
+        return len(self._columns[0])
+
+    @property
+    def nbytes(self):
+        return sum(column.nbytes for column in self._columns)
+
+    def model_codes_for(self, model_name):
+        """Códigos de los modelos que coinciden con `model_name` sin distinguir mayúsculas."""
+        name = model_name.lower()
+        return [code for code, model in enumerate(self.models) if model.lower() == name]
+
+    # --- Altas ---------------------------------------------------------------
+
+    def _reserve(self, size):
+        capacity = len(self._year)
+        if size <= capacity:
+            return
+        capacity = max(size, 2 * capacity, 1024)
+        for name in ('_year', '_units', '_model', '_country'):
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, name, new)
+
+    def append(self, records):
+        """Añade ventas al final de las columnas y las suma a los agregados."""
+        records = [sale for sale in records if storable(sale)]
+        with self._lock:
+            self._reserve(self._size + len(records))
+            i = self._size
+            for sale in records:
+                self._year[i] = sale['year']
+                self._units[i] = sale['units_sold']
+                self._model[i] = self._encode(self.models, self._model_codes, sale['model'])
+                self._country[i] = self._encode(self.countries, self._country_codes, sale['country'])
+                i += 1
+            # Las columnas sólo muestran las filas nuevas cuando ya están completas
+            self._size = i
+            self._publish()
+            self.rollups.add(records)
+
+    @staticmethod
+    def apply_changes(store, changes):
+        """Mantenimiento incremental como vista de la colección: sólo altas."""
+        if any(old is not None for old, _ in changes):
+            return False
+        store.append([new for _, new in changes])
+
+    # --- Agregaciones --------------------------------------------------------
+
+    @staticmethod
+    def _sum_by(codes, units, size, mask=None):
+        units = units if mask is None else units[mask]
+        codes = codes if mask is None else codes[mask]
+        # Los pesos de bincount son float64: exacto para totales por debajo de 2**53
+        return np.bincount(codes, weights=units, minlength=size).astype(np.int64)
+
+    def totals_by_country(self):
+        _, units, _, country = self._snapshot()
+        totals = self._sum_by(country, units, len(self.countries))
+        return [(country, int(total)) for country, total in zip(self.countries, totals)]
+
+    def totals_by_model(self):
+        _, units, model, _ = self._snapshot()
+        totals = self._sum_by(model, units, len(self.models))
+        return [(model, int(total)) for model, total in zip(self.models, totals)]
+
+    def totals_by_year(self, mask=None):
+        year, units, _, _ = self._snapshot(mask)
+        selected = year if mask is None else year[mask]
+        if len(selected) == 0:
+            return []
+        # Los años, desplazados al menor, se usan como índice de bincount (el array resultante es pequeño)
+        base = int(selected.min())
+        totals = self._sum_by(year.astype(np.int64) - base, units, 0, mask)
+        present = np.flatnonzero(np.bincount(selected.astype(np.int64) - base)).tolist()
+        return [(base + offset, int(totals[offset])) for offset in present]
+
+    def totals_by_model_year(self):
+        """Totales por (modelo, año) de los pares que tienen ventas."""
+        year, units, model, _ = self._snapshot()
+        if len(year) == 0:
+            return []
+        base = int(year.min())
+        span = int(year.max()) - base + 1
+        pairs = model.astype(np.int64) * span + (year.astype(np.int64) - base)
+        totals = self._sum_by(pairs, units, 0)
+        present = np.flatnonzero(np.bincount(pairs)).tolist()
+        return [((self.models[pair // span], base + pair % span), int(totals[pair])) for pair in present]
+
+    def model_mask(self, model_name):
+        return np.isin(self.model, self.model_codes_for(model_name))
+
+    # --- Consultas genéricas -------------------------------------------------
+
+    def filter_mask(self, year_from=None, year_to=None, models=None, countries=None):
+        """Máscara de las ventas que cumplen todos los filtros (modelos y países sin distinguir mayúsculas)."""
+        year, _, model, country = self._snapshot()
+        mask = np.ones(len(year), dtype=bool)
+        if year_from is not None:
+            mask &= year >= year_from
+        if year_to is not None:
+            mask &= year <= year_to
+        if models:
+            codes = [code for name in models for code in self.model_codes_for(name)]
+            mask &= np.isin(model, codes)
+        if countries:
+            wanted = {name.lower() for name in countries}
+            codes = [code for code, name in enumerate(self.countries) if name.lower() in wanted]
+            mask &= np.isin(country, codes)
+        return mask
+
+    def aggregate(self, group_by=(), metric='sum', mask=None):
+        """Agrupa las ventas por las dimensiones de `group_by` y calcula `metric` de units_sold.
+
+        Cada grupo se identifica con un único entero (códigos de las dimensiones
+        en base mixta). Mientras el producto de las cardinalidades sea pequeño
+        los grupos se cuentan con np.bincount sobre ese entero, sin ordenar;
+        si no, se agrupa con np.unique. Las métricas se calculan con
+        bincount/ufunc.at sin recorrer filas en Python.
+        Devuelve una lista de dicts con las dimensiones y el valor de la métrica.
+        """
+        year, units, model, country = self._snapshot(mask)
+        units = units if mask is None else units[mask]
+        if len(units) == 0:
+            return []
+        columns = {}
+        for dimension in group_by:
+            column = {'year': year, 'model': model, 'country': country}[dimension]
+            columns[dimension] = column if mask is None else column[mask]
+
+        year = columns.get('year')
+        base = int(year.min()) if year is not None else 0
+        radix = {'year': int(year.max()) - base + 1 if year is not None else 1,
+                 'model': len(self.models), 'country': len(self.countries)}
+        group = np.zeros(len(units), dtype=np.int64)
+        for dimension in group_by:
+            codes = columns[dimension].astype(np.int64) - base if dimension == 'year' else columns[dimension]
+            group = group * radix[dimension] + codes
+
+        size = int(np.prod([radix[dimension] for dimension in group_by]))
+        if size <= DENSE_GROUPS:
+            counts = np.bincount(group, minlength=size)
+            groups = np.flatnonzero(counts)
+            counts = counts[groups]
+        else:
+            groups, group = np.unique(group, return_inverse=True)
+            size = len(groups)
+            counts = np.bincount(group, minlength=size)
+
+        if metric == 'count':
+            values = counts
+        elif metric in ('sum', 'avg'):
+            values = np.bincount(group, weights=units, minlength=size)
+            values = values[groups] if size > len(groups) else values
+            values = values.astype(np.int64) if metric == 'sum' else np.round(values / counts, 2)
+        else:
+            ufunc, initial = (np.minimum, np.iinfo(np.int32).max) if metric == 'min' else (np.maximum, -1)
+            values = np.full(size, initial, dtype=np.int64)
+            ufunc.at(values, group, units)
+            values = values[groups] if size > len(groups) else values
+
+        decoded = {}
+        remaining = groups
+        # Se deshace la base mixta empezando por la última dimensión
+        for dimension in reversed(group_by):
+            codes = (remaining % radix[dimension]).tolist()
+            remaining = remaining // radix[dimension]
+            labels = {'model': self.models, 'country': self.countries}.get(dimension)
+            decoded[dimension] = [base + code for code in codes] if labels is None else [labels[code] for code in codes]
+        keys = [decoded[dimension] for dimension in group_by]
+        return [{**dict(zip(group_by, key)), metric: value}
+                for *key, value in zip(*keys, values.tolist())]
+
+    def page(self, mask=None, start=0, limit=None):
+        """Posiciones de la página que empieza en la fila `start`.
+
+        Devuelve (posiciones, total seleccionado, posición de la página
+        siguiente o None). Las ventas sólo se añaden al final, así que una
+        posición sirve de cursor estable entre peticiones.
+        """
+        positions = np.arange(len(self)) if mask is None else np.flatnonzero(mask)
+        page = positions[np.searchsorted(positions, start):]
+        following = None
+        if limit is not None and len(page) > limit:
+            following = int(page[limit])
+            page = page[:limit]
+        return page, len(positions), following
+
+    def rows(self, selection=None, fields=FIELDS):
+        """Materializa las ventas seleccionadas (máscara, índices o slice) como dicts con el formato de sales.json.
+
+        Con `fields` sólo se decodifican las columnas pedidas.
+        """
+        selected = slice(None) if selection is None else selection
+        is_mask = isinstance(selection, np.ndarray) and selection.dtype == bool
+        year, units, model, country = self._snapshot(selection if is_mask else None)
+        columns = []
+        for field in fields:
+            if field == 'year':
+                columns.append(year[selected].tolist())
+            elif field == 'units_sold':
+                columns.append(units[selected].tolist())
+            else:
+                labels, codes = (self.models, model) if field == 'model' else (self.countries, country)
+                columns.append(np.array(labels, dtype=object)[codes[selected]].tolist())
+        if tuple(fields) == FIELDS:
+            # Caso habitual: un literal de dict es bastante más rápido que dict(zip(...))
+            return [{"year": year, "model": model, "country": country, "units_sold": units}
+                    for year, model, country, units in zip(*columns)]
+        return [dict(zip(fields, values)) for values in zip(*columns)]
+
+
+class SalesRollups:
+    """Totales de unidades materializados por país, modelo, año y (modelo, año).
+
+    Se calculan una vez al construir el almacén y después se actualizan con
+    cada alta, de modo que los informes de /sales son una lectura de
+    diccionarios pequeños. Los diccionarios conservan el orden de aparición.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.by_country = {}
+        self.by_model = {}
+        self.by_year = {}
+        self.by_model_year = {}   # (modelo, año) -> total
+
+    @classmethod
+    def from_store(cls, store):
+        rollups = cls()
+        rollups.by_country = dict(store.totals_by_country())
+        rollups.by_model = dict(store.totals_by_model())
+        rollups.by_year = dict(store.totals_by_year())
+        rollups.by_model_year = dict(store.totals_by_model_year())
+        return rollups
+
+    @classmethod
+    def from_records(cls, records):
+        """Recalcula los agregados recorriendo las filas (referencia para verify)."""
+        rollups = cls()
+        rollups.add(records)
+        return rollups
+
+    def add(self, records):
+        with self._lock:
+            for sale in filter(storable, records):
+                units = sale['units_sold']
+                model, year, country = sale['model'], sale['year'], sale['country']
+                self.by_country[country] = self.by_country.get(country, 0) + units
+                self.by_model[model] = self.by_model.get(model, 0) + units
+                self.by_year[year] = self.by_year.get(year, 0) + units
+                self.by_model_year[model, year] = self.by_model_year.get((model, year), 0) + units
+
+    def totals_by_country(self):
+        with self._lock:
+            return list(self.by_country.items())
+
+    def totals_by_model(self):
+        with self._lock:
+            return list(self.by_model.items())
+
+    def totals_by_year(self):
+        with self._lock:
+            return sorted(self.by_year.items())
+
+    def model_totals_by_year(self, model_name):
+        """Totales por año de los modelos que coinciden con `model_name` sin distinguir mayúsculas."""
+        name = model_name.lower()
+        totals = {}
+        with self._lock:
+            for (model, year), units in self.by_model_year.items():
+                if model.lower() == name:
+                    totals[year] = totals.get(year, 0) + units
+        return sorted(totals.items())
+
+    def diff(self, other):
+        """Nombres de los agregados que no coinciden con `other`."""
+        with self._lock:
+            return [name for name in ('by_country', 'by_model', 'by_year', 'by_model_year')
+                    if getattr(self, name) != getattr(other, name)]
+
+
+def get_sales_store():
+    """Almacén columnar de ventas: se construye una vez y se mantiene con cada alta."""
+    return get_collection('sales').view('columnar', SalesStore.from_records, SalesStore.apply_changes)
+
+
+def verify_rollups():
+    """Compara los agregados mantenidos con un recálculo completo desde las filas."""
+    collection = get_collection('sales')
+    while True:
+        version = collection.version
+        store = get_sales_store()
+        expected = SalesRollups.from_records(collection.scan())
+        # Si entra una escritura entre ambas lecturas se repite la comparación
+        if collection.version == version:
+            return store.rollups.diff(expected)
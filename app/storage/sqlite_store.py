@@ -0,0 +1,344 @@
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from storage.commit import DuplicateKey, GroupCommit, apply_ops, with_key
+from storage.views import DerivedViews, changes_from
+
+
+# Esquema de cada colección: clave, columnas extraídas del registro e índices.
+# El registro completo se guarda como JSON en la columna `data`.
+SCHEMAS = {
+    'cars': {
+        'key': 'id',
+        'columns': {'id': 'INTEGER', 'make': 'TEXT', 'model': 'TEXT', 'year': 'INTEGER'},
+        'indexes': [('model', 'year')]
+    },
+    'sales': {
+        'key': None,
+        'columns': {'year': 'INTEGER', 'model': 'TEXT', 'country': 'TEXT'},
+        'indexes': [('model', 'year'), ('year',), ('country',)]
+    },
+    'users': {
+        'key': 'username',
+        'columns': {'username': 'TEXT'},
+        'indexes': []
+    },
+    'bookings': {
+        'key': 'id',
+        'columns': {'id': 'INTEGER', 'car_id': 'INTEGER', 'user_id': 'TEXT'},
+        'indexes': [('car_id',), ('user_id',)]
+    },
+    'reviews': {
+        'key': 'id',
+        'columns': {'id': 'INTEGER', 'car_id': 'INTEGER'},
+        'indexes': [('car_id',)]
+    },
+    'favorites': {
+        'key': 'username',
+        'columns': {'username': 'TEXT'},
+        'indexes': []
+    },
+}
+
+
+class SqliteDatabase:
+    """Fichero SQLite compartido por todas las colecciones, con una conexión por hilo."""
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_ready = False
+
+    def connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            # Autocommit: las transacciones se abren explícitamente en transaction()
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._ensure_schema(conn)
+            self._local.conn = conn
+        return conn
+
+    def _ensure_schema(self, conn):
+        with self._schema_lock:
+            if self._schema_ready:
+                return
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS collection_versions '
+                '(name TEXT PRIMARY KEY, version INTEGER NOT NULL, updated_at TEXT)'
+            )
+            conn.execute('CREATE TABLE IF NOT EXISTS id_sequences (name TEXT PRIMARY KEY, next_id INTEGER NOT NULL)')
+            for name, schema in SCHEMAS.items():
+                columns = [f'{column} {sql_type}' + (' UNIQUE' if column == schema['key'] else '')
+                           for column, sql_type in schema['columns'].items()]
+                conn.execute(
+                    f'CREATE TABLE IF NOT EXISTS {name} '
+                    f'(_pos INTEGER PRIMARY KEY, {", ".join(columns)}, data TEXT NOT NULL)'
+                )
+                for index in schema['indexes']:
+                    conn.execute(
+                        f'CREATE INDEX IF NOT EXISTS idx_{name}_{"_".join(index)} '
+                        f'ON {name} ({", ".join(index)})'
+                    )
+            self._schema_ready = True
+
+    @contextmanager
+    def transaction(self):
+        conn = self.connection()
+        # IMMEDIATE toma el bloqueo de escritura al empezar, no al primer UPDATE
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        else:
+            conn.execute('COMMIT')
+
+
+class SqliteCollection(GroupCommit, DerivedViews):
+    """Colección almacenada en una tabla SQLite con la misma interfaz que JsonCollection.
+
+    La versión de cada colección se persiste en `collection_versions` y se
+    incrementa en cada escritura, así que la caché en memoria se revalida con
+    una consulta por clave primaria y detecta cambios hechos por otros workers.
+    Las búsquedas por clave o por columnas indexadas no necesitan cargar la
+    colección completa. Las escrituras concurrentes se agrupan en una única
+    transacción.
+    """
+
+    def __init__(self, name, database, schema):
+        self.name = name
+        self.database = database
+        self.path = database.path
+        self.key = schema['key']
+        self.columns = list(schema['columns'])
+        self._lock = threading.RLock()
+        self._records = None
+        self._by_key = None
+        self._views = {}
+        self._version = 0
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self._init_group_commit()
+
+    # --- Lectura -----------------------------------------------------------
+
+    def _db_version(self, conn):
+        row = conn.execute('SELECT version FROM collection_versions WHERE name = ?', (self.name,)).fetchone()
+        return row[0] if row else 0
+
+    def _revalidate(self):
+        version = self._db_version(self.database.connection())
+        if version != self._version:
+            self._records = None
+            self._by_key = None
+            self._views = {}
+            self._version = version
+
+    def _select(self, where='', params=()):
+        rows = self.database.connection().execute(
+            f'SELECT data FROM {self.name} {where} ORDER BY _pos', params
+        )
+        return [json.loads(data) for (data,) in rows]
+
+    @property
+    def version(self):
+        with self._lock:
+            self._revalidate()
+            return self._version
+
+    def fingerprint(self):
+        """(versión persistida, fecha de la última escritura): iguales en todos los workers."""
+        row = self.database.connection().execute(
+            'SELECT version, updated_at FROM collection_versions WHERE name = ?', (self.name,)
+        ).fetchone()
+        if row is None:
+            return '0', None
+        return str(row[0]), datetime.fromisoformat(row[1]).replace(tzinfo=timezone.utc).timestamp()
+
+    def all(self):
+        """Devuelve la lista de registros en caché. No debe modificarse in situ."""
+        with self._lock:
+            self._revalidate()
+            if self._records is None:
+                self.misses += 1
+                self._records = self._select()
+            else:
+                self.hits += 1
+            return self._records
+
+    def scan(self):
+        """Registros actuales sin guardarlos en caché, para quien mantiene su propia representación."""
+        with self._lock:
+            self._revalidate()
+            if self._records is not None:
+                return self._records
+            return self._select()
+
+    def get(self, key):
+        with self._lock:
+            self._revalidate()
+            if self._records is None:
+                found = self._select(f'WHERE {self.key} = ?', (key,))
+                return found[0] if found else None
+            if self._by_key is None:
+                self._by_key = {record.get(self.key): record for record in self._records}
+            return self._by_key.get(key)
+
+    def find(self, **criteria):
+        """Registros cuyos campos coinciden con `criteria`, usando los índices de la tabla."""
+        if not all(field in self.columns for field in criteria):
+            return [record for record in self.all()
+                    if all(record.get(field) == value for field, value in criteria.items())]
+        where = ' AND '.join(f'{field} = ?' for field in criteria)
+        return self._select(f'WHERE {where}', tuple(criteria.values()))
+
+    # --- Escritura ---------------------------------------------------------
+
+    def _row(self, record):
+        return [record.get(column) for column in self.columns] + [json.dumps(record)]
+
+    def _placeholders(self):
+        return ', '.join(['?'] * (len(self.columns) + 1))
+
+    def _insert_row(self, conn, record):
+        conn.execute(
+            f'INSERT INTO {self.name} ({", ".join(self.columns)}, data) VALUES ({self._placeholders()})',
+            self._row(record)
+        )
+
+    def _select_one(self, conn, key):
+        row = conn.execute(f'SELECT data FROM {self.name} WHERE {self.key} = ?', (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _commit(self, ops):
+        with self._lock, self.database.transaction() as conn:
+            ops, restore = self._checked(ops)
+            results = self._apply_batch(conn, ops) if ops else []
+            return restore(results)
+
+    def _apply_op(self, conn, op, arg):
+        """Aplica una operación. Devuelve la operación tal como se aplicó (None si no cambió nada) y su resultado."""
+        if op == 'replace':
+            conn.execute(f'DELETE FROM {self.name}')
+            conn.executemany(
+                f'INSERT INTO {self.name} ({", ".join(self.columns)}, data) VALUES ({self._placeholders()})',
+                [self._row(record) for record in arg]
+            )
+            return (op, arg), None
+        if op == 'insert':
+            record = arg
+            if self.key and record.get(self.key) is None:
+                # El id se asigna dentro de la transacción: no puede repetirse entre workers.
+                # La secuencia evita reutilizar ids borrados; MAX() usa el índice único de la clave
+                (next_id,) = conn.execute(
+                    f'SELECT MAX(COALESCE((SELECT next_id FROM id_sequences WHERE name = ?), 0), '
+                    f'COALESCE((SELECT MAX({self.key}) FROM {self.name}), 0) + 1)', (self.name,)
+                ).fetchone()
+                record = with_key(record, self.key, next_id)
+            elif self.key and self._select_one(conn, record.get(self.key)) is not None:
+                return None, DuplicateKey(record.get(self.key))
+            if self.key and isinstance(record.get(self.key), int):
+                conn.execute(
+                    'INSERT INTO id_sequences (name, next_id) VALUES (?, ?) '
+                    'ON CONFLICT(name) DO UPDATE SET next_id = MAX(next_id, excluded.next_id)',
+                    (self.name, record[self.key] + 1)
+                )
+            self._insert_row(conn, record)
+            return (op, record), record
+        key = arg[0] if op == 'update' else arg
+        existing = self._select_one(conn, key)
+        if existing is None:
+            return None, None
+        if op == 'update':
+            assignments = ', '.join(f'{column} = ?' for column in self.columns)
+            conn.execute(
+                f'UPDATE {self.name} SET {assignments}, data = ? WHERE {self.key} = ?',
+                self._row(arg[1]) + [key]
+            )
+        else:
+            conn.execute(f'DELETE FROM {self.name} WHERE {self.key} = ?', (key,))
+        return (op, arg), existing
+
+    def _apply_batch(self, conn, ops):
+        """Aplica un lote dentro de la transacción ya abierta. Devuelve un resultado por operación.
+
+        Cada operación va en su propio SAVEPOINT: si viola una restricción
+        (p.ej. una actualización que repite una clave única) se deshace sólo
+        ella y su resultado es la excepción, que falla únicamente su petición.
+        """
+        previous = self._db_version(conn)
+        applied, results = [], []
+        for op, arg in ops:
+            conn.execute('SAVEPOINT op')
+            try:
+                done, result = self._apply_op(conn, op, arg)
+            except sqlite3.IntegrityError as e:
+                conn.execute('ROLLBACK TO op')
+                done, result = None, e
+            conn.execute('RELEASE op')
+            if done is not None:
+                applied.append(done)
+            results.append(result)
+
+        if not applied:
+            return results
+        conn.execute(
+            'INSERT INTO collection_versions (name, version, updated_at) VALUES (?, 1, ?) '
+            'ON CONFLICT(name) DO UPDATE SET version = version + 1, updated_at = excluded.updated_at',
+            (self.name, datetime.utcnow().isoformat())
+        )
+        # Si la caché estaba al día se actualiza en memoria en lugar de recargarla
+        fresh = self._records is not None and self._version == previous
+        self._records = apply_ops(self._records, applied, self.key)[0] if fresh else None
+        self._by_key = None
+        self._version = previous + 1
+        self._update_views(changes_from(ops, results), previous)
+        return results
+
+    def replace(self, records):
+        self._submit('replace', list(records))
+
+    def insert(self, record):
+        """Añade `record`; si no trae clave se le asigna el siguiente id. Devuelve el registro guardado."""
+        return self._submit('insert', record)
+
+    def update(self, key, record):
+        """Sustituye el registro con clave `key` por `record`. Devuelve el registro anterior."""
+        return self._submit('update', (key, record))
+
+    def delete(self, key):
+        """Elimina el registro con clave `key`. Devuelve el registro eliminado o None."""
+        return self._submit('delete', key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "collection": self.name,
+                "backend": "sqlite",
+                "version": self._version,
+                "hits": self.hits,
+                "misses": self.misses,
+                "writes": self.writes,
+                "commits": self.commits,
+                "cached_records": len(self._records) if self._records is not None else None
+            }
+
+
+def migrate_from_json(json_collections, database):
+    """Copia cada colección JSON a su tabla SQLite. Devuelve {nombre: registros migrados}."""
+    migrated = {}
+    for name, collection in json_collections.items():
+        records = collection.all()
+        SqliteCollection(name, database, SCHEMAS[name]).replace(records)
+        migrated[name] = len(records)
+    return migrated
@@ -0,0 +1,60 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def changes_from(ops, results):
+    """Cambios (anterior, nuevo) de un lote ya aplicado; None si sustituyó la colección entera."""
+    changes = []
+    for (op, arg), result in zip(ops, results):
+        if op == 'replace':
+            return None
+        if result is None or isinstance(result, Exception):
+            continue  # update/delete de una clave inexistente o alta rechazada
+        if op == 'insert':
+            changes.append((None, result))
+        elif op == 'update':
+            changes.append((result, arg[1]))
+        else:
+            changes.append((result, None))
+    return changes
+
+
+class DerivedViews:
+    """Estructuras derivadas de una colección (índices, agregados...) con mantenimiento incremental.
+
+    `view(name, builder, apply)` construye la vista con `builder(registros)` y
+    la guarda junto a la versión de la colección. Tras cada commit local se
+    llama a `apply(vista, cambios)` con la lista de pares (anterior, nuevo);
+    si devuelve False o lanza una excepción, o la vista no tiene `apply`, se
+    descarta y se reconstruye en el siguiente acceso. Los cambios hechos por
+    otros procesos siempre provocan una reconstrucción.
+
+    `apply` se ejecuta con el lock de la colección, pero quien lee la vista no
+    lo tiene: las vistas que se modifican in situ deben protegerse a sí mismas.
+    """
+
+    def view(self, name, builder, apply=None):
+        with self._lock:
+            self._revalidate()
+            cached = self._views.get(name)
+            if cached is None or cached[0] != self._version:
+                cached = (self._version, builder(self.scan()), apply)
+                self._views[name] = cached
+            return cached[1]
+
+    def _update_views(self, changes, previous):
+        views = {}
+        for name, (version, value, apply) in self._views.items():
+            if version != previous or changes is None or apply is None:
+                continue
+            try:
+                keep = apply(value, changes) is not False
+            except Exception:
+                # Los datos ya están guardados: la vista se descarta y se reconstruye
+                # al leerla, en vez de hacer fallar un commit que sí se ha hecho
+                logger.exception("Error al actualizar la vista %s de %s", name, self.name)
+                continue
+            if keep:
+                views[name] = (self._version, value, apply)
+        self._views = views
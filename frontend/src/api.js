@@ -7,6 +7,22 @@ export const getCars = async (model = '', page = 1, limit = 5) => {
   return await res.json();
 };
 
+// Catálogo completo recorriendo las páginas con cursor: el servidor limita
+// cada página a MAX_PAGE_SIZE coches, así que un limit grande no basta
+export const getAllCars = async () => {
+  const cars = [];
+  let cursor = null;
+  do {
+    const params = new URLSearchParams({ sort: 'id', limit: 100, include_total: false });
+    if (cursor) params.set('cursor', cursor);
+    const res = await fetch(`/cars?${params.toString()}`);
+    const data = await res.json();
+    cars.push(...data.data);
+    cursor = data.next_cursor;
+  } while (cursor);
+  return cars;
+};
+
 export const createCar = async (car) => {
   const response = await fetch('/cars', {
     method: 'POST',
@@ -69,7 +85,8 @@ export const getUserIdFromToken = (token) => {
 };
 
 // Funciones para gestionar favoritos - Ya no incluimos username en la URL
-export const getUserFavorites = async (token) => {
+// Con expand = true la respuesta incluye también los coches completos (cars)
+export const getUserFavorites = async (token, expand = false) => {
   try {
     // Si no hay token, devolver un objeto con array vacío
     if (!token) {
@@ -77,7 +94,8 @@ export const getUserFavorites = async (token) => {
       return { carIds: [] };
     }
 
-    const response = await fetch(`http://localhost:5000/favorites`, {
+    const query = expand ? '?expand=cars' : '';
+    const response = await fetch(`http://localhost:5000/favorites${query}`, {
       method: 'GET',
       headers: authHeaders(token)
     });
@@ -93,7 +111,7 @@ export const getUserFavorites = async (token) => {
     
     const data = await response.json();
     // Asegurarnos de que devolvemos un objeto con carIds como array
-    return { carIds: data.carIds || [] };
+    return expand ? { carIds: data.carIds || [], cars: data.cars || [] } : { carIds: data.carIds || [] };
   } catch (error) {
     console.error("Error al obtener favoritos:", error);
     return { carIds: [] };
@@ -222,6 +240,25 @@ export const getCarAverageRating = async (carId) => {
   }
 };
 
+// Puntuación media de varios coches en una sola petición: { [carId]: { avgRating, total } }
+export const getAverageRatings = async (carIds) => {
+  if (!carIds.length) {
+    return {};
+  }
+  try {
+    const params = new URLSearchParams({ ids: carIds.join(',') });
+    const response = await fetch(`http://localhost:5000/cars/average-ratings?${params.toString()}`);
+    if (!response.ok) {
+      throw new Error(`Error: ${response.status}`);
+    }
+    const data = await response.json();
+    return data.ratings || {};
+  } catch (error) {
+    console.error("Error al obtener puntuaciones medias:", error);
+    return {};
+  }
+};
+
 // Uso alias para mantener compatibilidad con CarItem.jsx
 export const getCarReviews = async (carId) => {
   try {
@@ -330,10 +367,12 @@ export const deleteBooking = async (bookingId, token) => {
   }
 };
 
-// Solo para admins
-export const getAllBookings = async (token) => {
+// Solo para admins. Con params ({ from, to, car_id, user_id, sort, limit, cursor })
+// se piden sólo las reservas de esa ventana, paginadas
+export const getAllBookings = async (token, params = null) => {
   try {
-    const response = await fetch('http://localhost:5000/admin/bookings', {
+    const query = params ? `?${new URLSearchParams(params).toString()}` : '';
+    const response = await fetch(`http://localhost:5000/admin/bookings${query}`, {
       method: 'GET',
       headers: authHeaders(token)
     });
@@ -347,7 +386,11 @@ export const getAllBookings = async (token) => {
       throw new Error(`Error: ${response.status}`);
     }
     
-    return { bookings: await response.json() };
+    const data = await response.json();
+    if (params) {
+      return { bookings: data.data, nextCursor: data.next_cursor };
+    }
+    return { bookings: data };
   } catch (error) {
     console.error("Error al obtener todas las reservas:", error);
     return { error: error.message, bookings: [] };
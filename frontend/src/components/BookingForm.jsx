@@ -1,7 +1,7 @@
 import { useState, useEffect } from 'react';
 import { Calendar, Clock, Car, ArrowRight } from 'lucide-react';
 import { useAuth } from '../context/AuthContext';
-import { getCars, createBooking } from '../api';
+import { getAllCars, createBooking } from '../api';
 import { Modal, Button } from 'react-bootstrap';
 
 export default function BookingForm({ onBookingCreated }) {
@@ -26,11 +26,8 @@ export default function BookingForm({ onBookingCreated }) {
     const fetchCars = async () => {
       try {
         setLoading(true);
-        // Obtener todos los coches para seleccionar
-        const response = await getCars('', 1, 100);
-        if (response && response.data) {
-          setCars(response.data);
-        }
+        // Obtener todos los coches para seleccionar (por páginas: el servidor limita su tamaño)
+        setCars(await getAllCars());
       } catch (error) {
         console.error("Error cargando coches:", error);
         setError("No se pudieron cargar los coches disponibles");
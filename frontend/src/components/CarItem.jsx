@@ -1,12 +1,12 @@
 import React, { useState, useEffect } from 'react';
 import { Edit, Trash, BarChart, Heart, MessageSquare, Pencil } from 'lucide-react';
 import { useNavigate, useLocation } from 'react-router-dom';
-import { addFavorite, removeFavorite, getCarReviews } from '../api';
+import { addFavorite, removeFavorite, getCarAverageRating } from '../api';
 import { useAuth } from '../context/AuthContext';
 import { useCars } from '../context/CarsContext';
 import ReviewsModal from './modals/ReviewsModal';
 
-export default function CarItem({ car, index, onEdit, onDelete, onViewSales, onRemoveFavorite }) {
+export default function CarItem({ car, index, rating, onEdit, onDelete, onViewSales, onRemoveFavorite }) {
   const navigate = useNavigate();
   const location = useLocation();
   const { username, token, isAdmin } = useAuth(); // Asegúrate de que isAdmin se está pasando desde el contexto
@@ -21,26 +21,27 @@ export default function CarItem({ car, index, onEdit, onDelete, onViewSales, onR
   useEffect(() => {
     setIsFavorite(isCarFavorite(car.id));
     
-    const loadReviews = async () => {
+    // La lista pasa la puntuación ya cargada (una petición por página); si no, se pide la de este coche
+    if (rating !== undefined) {
+      if (rating) {
+        setAverageRating(rating.avgRating || 0);
+        setReviewCount(rating.total || 0);
+      }
+      return;
+    }
+
+    const loadRating = async () => {
       try {
-        const reviewsData = await getCarReviews(car.id);
-        if (reviewsData && Array.isArray(reviewsData)) {
-          if (reviewsData.length > 0) {
-            const totalRating = reviewsData.reduce((sum, review) => sum + review.rating, 0);
-            setAverageRating(totalRating / reviewsData.length);
-            setReviewCount(reviewsData.length);
-          }
-        } else if (reviewsData && reviewsData.reviews) {
-          setAverageRating(reviewsData.avgRating || 0);
-          setReviewCount(reviewsData.total || 0);
-        }
+        const ratingData = await getCarAverageRating(car.id);
+        setAverageRating(ratingData.avgRating || 0);
+        setReviewCount(ratingData.total || 0);
       } catch (error) {
         console.error("Error al cargar reseñas:", error);
       }
     };
     
-    loadReviews();
-  }, [car.id, isCarFavorite]);
+    loadRating();
+  }, [car.id, isCarFavorite, rating]);
 
   const toggleFavorite = async (e) => {
     e.stopPropagation();
@@ -1,6 +1,21 @@
+import { useEffect, useState } from 'react';
 import CarItem from './CarItem';
+import { getAverageRatings } from '../api';
 
 export default function CarList({ cars, onEdit, onDelete, animationClass, onViewSales, onRemoveFavorite }) {
+  const [ratings, setRatings] = useState(null);
+  const carIds = cars.map((car) => car.id).join(',');
+
+  // Una sola petición con las puntuaciones de toda la página
+  useEffect(() => {
+    let cancelled = false;
+    setRatings(null);
+    getAverageRatings(carIds ? carIds.split(',') : []).then((data) => {
+      if (!cancelled) setRatings(data);
+    });
+    return () => { cancelled = true; };
+  }, [carIds]);
+
   return (
     <div className={`car-list-container ${animationClass}`}>
       <div className="car-grid">
@@ -9,6 +24,7 @@ export default function CarList({ cars, onEdit, onDelete, animationClass, onView
             key={car.id}
             car={car}
             index={index}
+            rating={ratings ? ratings[car.id] || { avgRating: 0, total: 0 } : null}
             onEdit={onEdit}
             onDelete={() => onDelete(car)}
             onViewSales={onViewSales}
@@ -7,7 +7,7 @@ import { useCars } from '../context/CarsContext';
 import CarList from './CarList';
 import CarForm from './CarForm';
 import CarItem from './CarItem';
-import { getCars, getUserFavorites, updateCar, deleteCar, removeFavorite } from '../api';
+import { getUserFavorites, updateCar, deleteCar, removeFavorite } from '../api';
 
 export default function FavoritesPage() {
   const [favorites, setFavorites] = useState([]);
@@ -40,29 +40,9 @@ export default function FavoritesPage() {
         return;
       }
       
-      // Ya no pasamos el username, solo el token
-      const favoritesResponse = await getUserFavorites(token);
-      
-      // Usar operador de nullish coalescing para garantizar un array
-      const favoriteIds = favoritesResponse?.carIds || [];
-      
-      if (favoriteIds.length === 0) {
-        setFavorites([]);
-        setIsLoading(false);
-        return;
-      }
-      
-      // Primero obtener el conteo total de coches
-      const countResponse = await getCars('', 1, 1);
-      const totalCars = countResponse.total;
-
-      // Luego hacer la solicitud con el número exacto de coches
-      const carsResponse = await getCars('', 1, totalCars);
-      const allCars = carsResponse.cars || carsResponse.data;
-      
-      // Filtramos para obtener solo los favoritos
-      const favoriteCars = allCars.filter(car => favoriteIds.includes(car.id));
-      setFavorites(favoriteCars);
+      // Ya no pasamos el username, solo el token; los coches llegan en la misma respuesta
+      const favoritesResponse = await getUserFavorites(token, true);
+      setFavorites(favoritesResponse?.cars || []);
     } catch (error) {
       console.error("Error al cargar favoritos:", error);
     } finally {
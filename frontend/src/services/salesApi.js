@@ -1,11 +1,12 @@
 /**
  * API service for sales data
  */
+import { getAllCars } from '../api';
 
 // Fetch sales data for a specific model
 export const getModelSales = async (model) => {
   try {
-    const res = await fetch(`/sales?model=${model}`);
+    const res = await fetch(`/sales?model=${model}&fields=year,units_sold`);
     const data = await res.json();
     
     // Group by year and sum units sold
@@ -41,14 +42,9 @@ export const getAnnualSales = async () => {
 // Fetch available car models
 export const getAvailableModels = async () => {
   try {
-    const initialRes = await fetch('/cars?page=1&limit=1');
-    const initialData = await initialRes.json();
-    const totalCars = initialData.total;
-    
-    const res = await fetch(`/cars?limit=${totalCars}`);
-    const data = await res.json();
-    
-    return [...new Set(data.data.map(car => car.model))];
+    // Recorrer el catálogo por páginas con cursor (el servidor limita el tamaño de página)
+    const cars = await getAllCars();
+    return [...new Set(cars.map(car => car.model))];
   } catch (error) {
     console.error('Error fetching available models:', error);
     throw error;
@@ -0,0 +1,17 @@
+import os
+import sys
+
+# Migración única de los ficheros JSON de app/database a la base de datos SQLite
+# configurada en SQLITE_PATH. Después, arrancar el servidor con STORAGE_BACKEND=sqlite.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app'))
+
+from config import SQLITE_PATH
+from storage.repository import COLLECTIONS, json_collection
+from storage.sqlite_store import SqliteDatabase, migrate_from_json
+
+json_collections = {name: json_collection(name) for name in COLLECTIONS}
+migrated = migrate_from_json(json_collections, SqliteDatabase(SQLITE_PATH))
+
+for name, count in migrated.items():
+    print(f"{name}: {count} registros migrados")
+print(f"Migración completada en {SQLITE_PATH}")
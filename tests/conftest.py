@@ -0,0 +1,38 @@
+import json
+import os
+import sys
+
+import pytest
+
+# Los módulos de la aplicación se importan como paquetes de primer nivel
+# (routes, storage, models, config), igual que al ejecutar `python app/main.py`
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'app')))
+from storage import repository
+from storage.json_store import JsonCollection
+
+
+@pytest.fixture
+def make_collection(tmp_path):
+    """Crea en tmp_path una colección con el fichero, la clave y el objeto raíz que usa la aplicación."""
+    def make(name, records=()):
+        filename, key, wrapper, indent = repository.COLLECTIONS[name]
+        path = tmp_path / filename
+        records = list(records)
+        path.write_text(json.dumps({wrapper: records} if wrapper else records, indent=indent))
+        return JsonCollection(name, str(path), key=key, wrapper=wrapper, indent=indent)
+    return make
+
+
+@pytest.fixture
+def collections(make_collection, monkeypatch):
+    """Sustituye todas las colecciones de la aplicación (repositorio y `*_repo` de las rutas) por temporales vacías."""
+    replacements = {name: make_collection(name) for name in repository.COLLECTIONS}
+    for name, collection in replacements.items():
+        monkeypatch.setitem(repository._COLLECTIONS, name, collection)
+    for module_name, module in list(sys.modules.items()):
+        if not module_name.startswith('routes.'):
+            continue
+        for attr, value in list(vars(module).items()):
+            if attr.endswith('_repo') and getattr(value, 'name', None) in replacements:
+                monkeypatch.setattr(module, attr, replacements[value.name])
+    return replacements
@@ -0,0 +1,119 @@
+import base64
+import threading
+import time
+from concurrent.futures import Future
+import jwt
+import pytest
+from flask import Flask, g, jsonify
+from werkzeug.security import generate_password_hash
+from config import PASSWORD_HASH_METHOD, PASSWORD_RETRY_AFTER, SECRET_KEY
+from routes import auth, passwords
+from routes.auth import admin_required, auth_bp, token_required, verify_token
+
+def make_token(username='ana@example.com', is_admin=False, exp=3600):
+    return jwt.encode({'username': username, 'is_admin': is_admin, 'exp': int(time.time()) + exp},
+                      SECRET_KEY, algorithm='HS256')
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+
+    @app.route('/me')
+    @token_required
+    def me(username):
+        return jsonify({'username': username, 'is_admin': g.is_admin})
+
+    @app.route('/admin')
+    @admin_required
+    def admin(username):
+        return jsonify({'username': username})
+
+    with app.test_client() as client:
+        yield client
+
+def bearer(token):
+    return {'Authorization': f'Bearer {token}'}
+
+def test_verified_tokens_are_cached(monkeypatch):
+    token = make_token()
+    assert verify_token(token)['username'] == 'ana@example.com'
+    calls = []
+    monkeypatch.setattr(auth.jwt, 'decode', lambda *args, **kwargs: calls.append(args))
+    assert verify_token(token)['username'] == 'ana@example.com'
+    assert calls == []
+
+def test_cached_tokens_expire(monkeypatch):
+    token = make_token(exp=60)
+    assert verify_token(token)
+    later = time.time() + 120
+    monkeypatch.setattr(auth.time, 'time', lambda: later)
+    assert verify_token(token) is None
+
+def test_invalid_tokens():
+    assert verify_token('not-a-token') is None
+    assert verify_token(make_token(exp=-10)) is None
+
+def test_claims_on_request_context(client):
+    assert client.get('/me').status_code == 401
+    assert client.get('/me', headers=bearer('x.y.z')).status_code == 401
+    assert client.get('/me', headers=bearer(make_token(is_admin=True))).json == {
+        'username': 'ana@example.com', 'is_admin': True
+    }
+
+def test_admin_required(client):
+    assert client.get('/admin', headers=bearer(make_token())).status_code == 403
+    assert client.get('/admin', headers=bearer(make_token(is_admin=True))).status_code == 200
+
+def test_needs_rehash(monkeypatch):
+    monkeypatch.setattr(passwords, '_method', None)
+    # Mientras el pool no ha calculado el método actual no se pide ningún rehash
+    assert not passwords.needs_rehash(generate_password_hash('secreto', 'pbkdf2:sha256:1000'))
+    passwords._method.result(timeout=30)
+    assert not passwords.needs_rehash(generate_password_hash('secreto', PASSWORD_HASH_METHOD))
+    assert passwords.needs_rehash(generate_password_hash('secreto', 'pbkdf2:sha256:1000'))
+
+def test_rehash_is_saved_outside_the_callback_thread(monkeypatch):
+    pending = Future()
+    monkeypatch.setattr(passwords, '_submit', lambda *args: pending)
+    saved, done = [], threading.Event()
+
+    def save(password_hash):
+        saved.append((password_hash, threading.current_thread()))
+        done.set()
+
+    passwords.rehash_later('secreto', save)
+    pending.set_result('nuevo-hash')  # Los callbacks se ejecutan en este hilo
+    assert done.wait(5)
+    assert saved[0][0] == 'nuevo-hash' and saved[0][1] is not threading.current_thread()
+
+def test_saturated_password_pool_returns_503(monkeypatch):
+    monkeypatch.setattr(passwords, '_pending', threading.BoundedSemaphore(1))
+    passwords._pending.acquire()  # Cola llena
+    app = Flask(__name__)
+    app.register_blueprint(auth_bp)
+    credentials = base64.b64encode(b'nuevo@example.com:secreto').decode()
+    response = app.test_client().post('/register', headers={'Authorization': f'Basic {credentials}'})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == str(PASSWORD_RETRY_AFTER)
+
+def test_slow_password_hash_times_out(monkeypatch):
+    pending = Future()  # Nunca termina: el pool está ocupado con otros cálculos
+    monkeypatch.setattr(passwords, '_submit', lambda *args: pending)
+    monkeypatch.setattr(passwords, 'PASSWORD_TIMEOUT', 0.01)
+    with pytest.raises(passwords.PasswordPoolBusy):
+        passwords.hash_password('secreto')
+    assert pending.cancelled()
+
+def test_register_rejects_a_user_created_while_hashing(monkeypatch, collections):
+    def slow_hash(password):
+        # Otra petición registra el mismo usuario mientras se calcula el hash
+        collections['users'].insert({'username': 'nuevo@example.com', 'password': 'x', 'is_admin': False})
+        return 'hash'
+
+    monkeypatch.setattr(auth, 'hash_password', slow_hash)
+    app = Flask(__name__)
+    app.register_blueprint(auth_bp)
+    credentials = base64.b64encode(b'nuevo@example.com:secreto').decode()
+    response = app.test_client().post('/register', headers={'Authorization': f'Basic {credentials}'})
+    assert response.status_code == 400
+    assert [user['password'] for user in collections['users'].all()] == ['x']
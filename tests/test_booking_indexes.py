@@ -0,0 +1,90 @@
+from datetime import datetime
+import pytest
+from storage.booking_indexes import (
+    BookingCalendar, BookingIntervals, booking_calendar, booking_interval, booking_intervals, bookings_by_user,
+    parse_datetime
+)
+
+def booking(id, car_id, date, return_date, time="10:00", return_time="10:00"):
+    return {"id": id, "user_id": "ana", "car_id": car_id, "date": date, "time": time,
+            "return_date": return_date, "return_time": return_time}
+
+BOOKINGS = [
+    booking(1, 1, "2025-05-01", "2025-05-10"),
+    # Solapamiento antiguo: queda contenido en la primera
+    booking(2, 1, "2025-05-02", "2025-05-03"),
+    booking(3, 1, "2025-06-01", "2025-06-05"),
+    booking(4, 2, "2025-05-01", "2025-05-02"),
+]
+
+@pytest.fixture
+def bookings(make_collection):
+    return make_collection('bookings', BOOKINGS)
+
+def day(value):
+    return datetime.fromisoformat(value)
+
+def test_booking_interval():
+    assert booking_interval(BOOKINGS[0]) == (day("2025-05-01T10:00"), day("2025-05-10T10:00"))
+    assert booking_interval(booking(5, 1, "2025-05-10", "2025-05-01")) is None
+    assert booking_interval(booking(5, 1, "mañana", "2025-05-01")) is None
+    # Con zona horaria no se podría comparar con el resto: se rechaza
+    assert booking_interval(booking(5, 1, "2025-05-01", "2025-05-02", time="10:00+02:00")) is None
+    with pytest.raises(ValueError):
+        parse_datetime("2030-01-01T00:00Z")
+
+@pytest.mark.parametrize('start, end, expected', [
+    ("2025-05-05", "2025-05-06", True),     # Dentro de la primera reserva, después de la segunda
+    ("2025-04-20", "2025-05-01T10:00", False),  # Termina justo cuando empieza la primera
+    ("2025-05-10T10:00", "2025-05-20", False),  # Empieza justo al devolverla
+    ("2025-05-20", "2025-06-02", True),
+    ("2025-06-05T10:00", "2025-07-01", False),
+])
+def test_overlaps(start, end, expected):
+    assert BookingIntervals(BOOKINGS).overlaps(1, day(start), day(end)) is expected
+
+def test_intervals_follow_writes(bookings):
+    index = booking_intervals(bookings)
+    assert not index.overlaps(3, day("2025-05-01"), day("2025-05-02"))
+    bookings.insert(booking(None, 3, "2025-05-01", "2025-05-03"))
+    bookings.delete(4)
+    assert booking_intervals(bookings) is index
+    assert index.overlaps(3, day("2025-05-01"), day("2025-05-02"))
+    assert not index.overlaps(2, day("2025-05-01"), day("2025-05-02"))
+
+def ids(pairs):
+    return [booking["id"] for _, booking in pairs]
+
+def test_calendar_window_and_cursor():
+    calendar = BookingCalendar(BOOKINGS)
+    assert ids(calendar.window()) == [1, 4, 2, 3]
+    # La reserva 1 empieza antes de la ventana pero sigue activa en ella
+    assert ids(calendar.window(day("2025-05-04"), day("2025-06-02"))) == [1, 3]
+    assert ids(calendar.window(day("2025-05-04"), day("2025-06-02"), reverse=True)) == [3, 1]
+    after, _ = next(calendar.window())
+    assert ids(calendar.window(after=after)) == [4, 2, 3]
+    assert ids(calendar.window(end=day("2025-06-01T10:00"), after=after, reverse=True)) == []
+
+def test_calendar_follows_writes(bookings):
+    calendar = booking_calendar(bookings)
+    bookings.insert(booking(None, 3, "2025-04-01", "2025-04-03"))
+    bookings.delete(1)
+    assert booking_calendar(bookings) is calendar
+    assert ids(calendar.window()) == [5, 4, 2, 3]
+    assert ids(calendar.window(day("2025-05-04"))) == [3]
+    # Un cambio sólo reconstruye las listas del coche afectado
+    untouched = calendar._cars[2]
+    bookings.update(3, booking(3, 4, "2025-06-01", "2025-06-05"))
+    assert calendar._cars[2] is untouched
+    assert ids(calendar.window(day("2025-05-04"), reverse=True)) == [3]
+    assert calendar._cars.keys() == BookingCalendar(bookings.all())._cars.keys()
+
+def test_bookings_by_user_follow_writes(bookings):
+    index = bookings_by_user(bookings)
+    assert [b["id"] for b in index.bookings("ana")] == [1, 2, 3, 4]
+    bookings.insert({**booking(None, 2, "2025-07-01", "2025-07-02"), "user_id": "luis"})
+    bookings.delete(2)
+    assert bookings_by_user(bookings) is index
+    assert [b["id"] for b in index.bookings("ana")] == [1, 3, 4]
+    assert [b["id"] for b in index.bookings("luis")] == [5]
+    assert index.bookings("eva") == []
@@ -0,0 +1,130 @@
+import pytest
+from storage.car_indexes import (
+    BitmapIndex, InvertedIndex, PrefixIndex, SortedIndex, bitmap_index, bits, inverted_index, prefix_index,
+    model_year_index, sorted_index
+)
+
+CARS = [
+    {"id": 1, "make": "Toyota", "model": "Corolla", "year": 2020},
+    {"id": 2, "make": "honda", "model": "Civic", "year": 2018},
+    {"id": 3, "make": "Ford", "model": "Focus", "year": 2020},
+    {"id": 4, "make": "BMW", "model": "X5", "year": 2019},
+]
+
+@pytest.fixture
+def cars(make_collection):
+    return make_collection('cars', CARS)
+
+def pages(index, size, reverse=False):
+    result, after = [], None
+    while True:
+        page = []
+        for key, car in index.scan(after, reverse):
+            page.append(car["id"])
+            after = key
+            if len(page) == size:
+                break
+        result.append(page)
+        if len(page) < size:
+            return result
+
+def test_sorted_index_pages_are_stable(cars):
+    index = sorted_index(cars, 'year')
+    assert pages(index, 2) == [[2, 4], [1, 3], []]
+    assert pages(index, 3, reverse=True) == [[3, 1, 4], [2]]
+    assert [car["id"] for _, car in sorted_index(cars, 'make').scan()] == [4, 3, 2, 1]
+
+def test_sorted_index_follows_writes(cars):
+    index = sorted_index(cars, 'year')
+    cars.insert({"id": None, "make": "Kia", "model": "Soul", "year": 2017})
+    cars.update(1, {"id": 1, "make": "Toyota", "model": "Corolla", "year": 2016})
+    cars.delete(4)
+    assert sorted_index(cars, 'year') is index
+    assert [car["id"] for _, car in index.scan()] == [1, 5, 2, 3]
+    assert [key for key, _ in index.scan()] == [key for key, _ in SortedIndex('year', cars.all()).scan()]
+
+def test_scan_within_pages_a_subset(cars):
+    index = sorted_index(cars, 'year')
+    subset = [car for car in cars.all() if car["id"] != 2]
+    assert [car["id"] for _, car in index.scan_within(subset, limit=2)] == [4, 1]
+    after = index.key(CARS[0])
+    assert [car["id"] for _, car in index.scan_within(subset, after, limit=2)] == [3]
+    assert [car["id"] for _, car in index.scan_within(subset, after, reverse=True)] == [4]
+
+def test_prefix_index_matches_word_prefixes(cars):
+    index = prefix_index(cars)
+    assert index.lookup("c") == {1, 2}
+    assert index.lookup("FO") == {3}
+    assert index.lookup("orolla") == set()
+    cars.insert({"id": None, "make": "Tesla", "model": "Model 3", "year": 2021})
+    cars.update(2, {"id": 2, "make": "Honda", "model": "Accord", "year": 2018})
+    assert prefix_index(cars) is index
+    assert index.lookup("c") == {1}
+    assert index.lookup("model 3") == {5}
+    assert index.suggest("a", 5) == ["Accord"]
+    rebuilt = PrefixIndex(cars.all())
+    assert index._words == rebuilt._words and index._postings == rebuilt._postings
+
+def test_suggest_ranks_by_number_of_cars():
+    index = PrefixIndex([{"id": 1, "model": "Civic"}, {"id": 2, "model": "Corolla"}, {"id": 3, "model": "Corolla"}])
+    assert index.suggest("c", 10) == ["Corolla", "Civic"]
+    assert index.suggest("c", 1) == ["Corolla"]
+
+def test_search_ranks_cars_matching_more_terms_first(cars):
+    cars.update(1, {**CARS[0], "features": ["Heated Seats", "Sunroof"]})
+    cars.update(3, {**CARS[2], "features": ["Heated Mirrors"]})
+    index = inverted_index(cars)
+    total, ranked = index.search("heated seats")
+    assert total == 2
+    assert [car["id"] for _, car in ranked] == [1, 3]
+    # El modelo pesa más que un extra
+    cars.insert({"id": None, "make": "Seat", "model": "Leon", "year": 2020})
+    assert [car["id"] for _, car in index.search("seat")[1]] == [5]
+    assert index.search("sunroof", limit=1)[1][0][1]["id"] == 1
+
+def test_inverted_index_follows_writes(cars):
+    index = inverted_index(cars)
+    cars.update(2, {**CARS[1], "model": "Accord"})
+    cars.delete(4)
+    assert inverted_index(cars) is index
+    assert index.search("civic") == (0, [])
+    assert index._postings == InvertedIndex(cars.all())._postings
+
+def test_bitmap_filters_and_facet_counts(cars):
+    cars.update(1, {**CARS[0], "features": ["Sunroof", "Bluetooth"]})
+    cars.update(3, {**CARS[2], "features": ["Sunroof"]})
+    index = bitmap_index(cars)
+    selected, facets = index.query(makes=["toyota", "Ford"], year_from=2019, features=["sunroof"])
+    assert selected == [1, 3]
+    assert facets["make"] == {"Toyota": 1, "Ford": 1}
+    # El recuento por año ignora el propio filtro de años
+    assert facets["year"] == {2020: 2}
+    assert facets["features"] == {"Sunroof": 2, "Bluetooth": 1}
+    assert index.query(features=["Sunroof", "Bluetooth"])[0] == [1]
+    assert index.query(within={2, 4}, year_to=2018)[0] == [2]
+
+def test_bitmap_index_follows_writes(cars):
+    index = bitmap_index(cars)
+    cars.update(4, {**CARS[3], "make": "Toyota"})
+    cars.delete(1)
+    assert bitmap_index(cars) is index
+    assert index.query(makes=["Toyota"])[0] == [4]
+    rebuilt = BitmapIndex(cars.all())
+    assert index.query() == rebuilt.query()
+    assert sorted(index._slots) == sorted(rebuilt._slots)
+
+def test_model_year_index_checks_uniqueness(cars):
+    index = model_year_index(cars)
+    assert index.conflicts("Civic", 2018)
+    assert not index.conflicts("Civic", 2018, exclude_id=2)
+    cars.update(2, {**CARS[1], "year": 2019})
+    cars.insert({"id": None, "make": "Kia", "model": "Soul", "year": 2017})
+    assert not index.conflicts("Civic", 2018)
+    assert index.conflicts("Civic", 2019) and index.conflicts("Soul", 2017)
+
+def test_bitmap_size_does_not_depend_on_ids(cars):
+    index = bitmap_index(cars)
+    cars.update(1, {**CARS[0], "id": 10**9})
+    assert index.query(makes=["Toyota"])[0] == [10**9]
+    assert index._all.bit_length() <= len(CARS)
+    assert bits(0b1010_0000_0001) == [0, 9, 11]
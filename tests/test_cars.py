@@ -89,3 +89,13 @@ def test_delete_car_not_found(client):
     response = client.delete('/cars/3')
     assert response.status_code == 404
     assert response.get_json() == {'error': 'Car not found'}
+
+@pytest.mark.parametrize('car', [
+    {"make": "Ford", "model": ["Focus"], "year": 2020},
+    {"make": "Ford", "model": {"name": "Focus"}, "year": 2020},
+    {"make": "Ford", "model": "Focus", "year": [2020]},
+])
+def test_create_car_with_invalid_types(client, car):
+    # Se rechazan antes de consultar el índice (modelo, año), que necesita claves hashables
+    response = client.post('/cars', json=car)
+    assert response.status_code == 400
@@ -0,0 +1,264 @@
+import json
+import threading
+import time
+import jwt
+import pytest
+from config import MAX_PAGE_SIZE, SECRET_KEY
+from main import app
+import routes.cars
+from routes.pagination import encode_cursor
+
+def bearer(username='ana@example.com', is_admin=False):
+    token = jwt.encode({'username': username, 'is_admin': is_admin, 'exp': int(time.time()) + 3600},
+                       SECRET_KEY, algorithm='HS256')
+    return {'Authorization': f'Bearer {token}'}
+
+ADMIN = bearer('admin@example.com', is_admin=True)
+
+def booking(id, car_id, date, return_date, user_id='ana@example.com'):
+    return {"id": id, "user_id": user_id, "car_id": car_id, "date": date, "time": "10:00",
+            "return_date": return_date, "return_time": "10:00"}
+
+@pytest.fixture
+def client(collections):
+    # Todas las rutas trabajan sobre colecciones temporales (ver conftest.collections)
+    collections['cars'].append([
+        {"id": 1, "make": "Toyota", "model": "Corolla", "year": 2020},
+        {"id": 2, "make": "Honda", "model": "Civic", "year": 2021},
+    ])
+    with app.test_client() as client:
+        yield client
+
+# --- Reservas ----------------------------------------------------------------
+
+@pytest.mark.parametrize('query', [
+    '',
+    '?from=2030-01-01',
+    '?from=mañana&to=2030-01-02',
+    '?from=2030-01-01T00:00Z&to=2030-01-02',
+    '?from=2030-01-02&to=2030-01-01',
+])
+def test_available_cars_rejects_invalid_ranges(client, query):
+    assert client.get(f'/cars/available{query}').status_code == 400
+
+def test_available_cars_excludes_overlapping_bookings(client, collections):
+    collections['bookings'].insert(booking(1, 1, "2030-01-01", "2030-01-05"))
+    response = client.get('/cars/available?from=2030-01-04&to=2030-01-06')
+    assert response.status_code == 200
+    assert [car["id"] for car in response.json["data"]] == [2]
+    assert client.get('/cars/available?from=2030-01-05T10:00&to=2030-01-06').json["total"] == 2
+
+def test_create_booking_rejects_timezones_and_overlaps(client, collections):
+    data = {"car_id": 1, "date": "2030-01-01", "time": "10:00", "return_date": "2030-01-03", "return_time": "10:00"}
+    assert client.post('/bookings', json={**data, "time": "10:00+02:00"}, headers=bearer()).status_code == 400
+    assert client.post('/bookings', json=data, headers=bearer()).status_code == 201
+    assert client.post('/bookings', json={**data, "date": "2030-01-02"}, headers=bearer()).status_code == 400
+    assert len(collections['bookings'].all()) == 1
+
+def test_admin_bookings_filters_and_pages(client, collections):
+    collections['bookings'].append([
+        booking(None, 1, "2030-01-01", "2030-01-03"),
+        booking(None, 2, "2030-01-02", "2030-01-04", user_id='luis@example.com'),
+        booking(None, 1, "2030-02-01", "2030-02-03"),
+    ])
+    first = client.get('/admin/bookings?from=2030-01-01&to=2030-01-31&limit=1', headers=ADMIN).json
+    assert [b["id"] for b in first["data"]] == [1]
+    second = client.get(f'/admin/bookings?from=2030-01-01&to=2030-01-31&limit=1&cursor={first["next_cursor"]}',
+                        headers=ADMIN).json
+    assert [b["id"] for b in second["data"]] == [2] and second["next_cursor"] is None
+    by_user = client.get('/admin/bookings?user_id=luis@example.com', headers=ADMIN).json
+    assert [b["id"] for b in by_user["data"]] == [2]
+    by_car = client.get('/admin/bookings?car_id=1&sort=-date', headers=ADMIN).json
+    assert [b["id"] for b in by_car["data"]] == [3, 1]
+
+@pytest.mark.parametrize('query', [
+    'car_id=uno', 'limit=0', 'from=2030-01-01T00:00Z', 'sort=id', 'cursor=no-es-un-cursor',
+    f'cursor={encode_cursor({"sort": "date", "after": ["mañana", 1]})}',
+    f'cursor={encode_cursor({"sort": "date", "after": 5})}',
+])
+def test_admin_bookings_rejects_invalid_params(client, query):
+    assert client.get(f'/admin/bookings?{query}', headers=ADMIN).status_code == 400
+
+def test_admin_bookings_requires_admin(client):
+    assert client.get('/admin/bookings?limit=1').status_code == 401
+    assert client.get('/admin/bookings?limit=1', headers=bearer()).status_code == 403
+
+# --- Coches -------------------------------------------------------------------
+
+def test_conditional_get(client, collections):
+    response = client.get('/cars/1')
+    etag = response.headers['ETag']
+    assert response.status_code == 200
+    assert response.headers['Cache-Control'] == 'no-cache'
+    assert 'Last-Modified' in response.headers
+
+    not_modified = client.get('/cars/1', headers={'If-None-Match': etag})
+    assert not_modified.status_code == 304
+    assert not_modified.data == b''
+    assert not_modified.headers['ETag'] == etag
+
+    # Otra URL del mismo catálogo tiene su propio ETag
+    assert client.get('/cars?page=1').headers['ETag'] != etag
+
+    # Un cambio hecho por otro proceso directamente en el fichero también invalida el ETag
+    with open(collections['cars'].path, 'w') as f:
+        json.dump([{"id": 1, "make": "Toyota", "model": "Camry", "year": 2020}], f, indent=4)
+    changed = client.get('/cars/1', headers={'If-None-Match': etag})
+    assert changed.status_code == 200
+    assert changed.json["model"] == "Camry"
+    assert changed.headers['ETag'] != etag
+
+def test_filtered_cars_page_by_key(client, collections):
+    collections['cars'].append([
+        {"id": None, "make": "Toyota", "model": "Yaris", "year": 2018},
+        {"id": None, "make": "Toyota", "model": "Camry", "year": 2022},
+    ])
+    first = client.get('/cars?make=toyota&sort=-year&limit=2').json
+    assert [car["id"] for car in first["data"]] == [4, 1] and first["total"] == 3
+    second = client.get(f'/cars?make=toyota&limit=2&cursor={first["next_cursor"]}').json
+    assert [car["id"] for car in second["data"]] == [3] and second["next_cursor"] is None
+    assert [car["id"] for car in client.get('/cars?model=c&sort=year').json["data"]] == [1, 2, 4]
+
+def test_update_car_keeps_its_id(client, collections):
+    car = {"make": "Toyota", "model": "Corolla", "year": 2022}
+    assert client.put('/cars/1', json={**car, "id": 2}).status_code == 400
+    assert client.put('/cars/1', json={**car, "id": 10**9}).status_code == 400
+    assert client.put('/cars/1', json=car).json == {**car, "id": 1}
+    assert [car["id"] for car in collections['cars'].all()] == [1, 2]
+
+def test_create_car_checks_uniqueness_in_the_commit(client, collections, monkeypatch):
+    car = {"make": "Ford", "model": "Focus", "year": 2019}
+    assert client.post('/cars', json={**car, "year": True}).status_code == 400
+    # Otra petición da de alta el mismo coche entre la validación y el commit
+    monkeypatch.setattr(routes.cars, 'validate_car_data', lambda car_data: None)
+    collections['cars'].insert({**car, "id": None})
+    assert client.post('/cars', json=car).status_code == 400
+    response = client.post('/cars/bulk', json=[car, {**car, "model": "Ka"}])
+    assert [car["id"] for car in response.json["inserted"]] == [4]
+    assert response.json["errors"] == [{"index": 0, "error": "Car with the same model and year already exists."}]
+    assert len(collections['cars'].all()) == 4
+
+# --- Altas en bloque -----------------------------------------------------------
+
+def test_bulk_cars(client, collections):
+    assert client.post('/cars/bulk', json={"make": "Ford"}).status_code == 400
+    response = client.post('/cars/bulk', json=[
+        {"make": "Ford", "model": "Focus", "year": 2019},
+        {"make": "Ford", "model": ["Fiesta"], "year": 2019},
+        {"make": "Ford", "model": "Focus", "year": 2019},   # Repetido dentro del lote
+        {"make": "Toyota", "model": "Corolla", "year": 2020},  # Ya existe
+        "Ford Ka",
+    ])
+    assert response.status_code == 201
+    assert [car["id"] for car in response.json["inserted"]] == [3]
+    assert [error["index"] for error in response.json["errors"]] == [1, 2, 3, 4]
+    assert client.post('/cars/bulk', json=[{"make": "ford"}]).status_code == 400
+    assert len(collections['cars'].all()) == 3
+
+def test_bulk_sales(client, collections):
+    body = '\n'.join([
+        '{"year": 2020, "model": "GLE", "country": "Spain", "units_sold": 10}',
+        '{"year": 40000, "model": "GLE", "country": "Spain", "units_sold": 10}',
+        '{"year": 2021, "model": "GLE", "country": "Spain", "units_sold": 2147483648}',
+        '{"year": 2021, "model": "GLE"',
+        '[]',
+        '',
+        '{"year": 2021, "model": "GLE", "country": "Spain", "units_sold": 5}',
+    ])
+    response = client.post('/sales/bulk', data=body, content_type='application/x-ndjson')
+    assert response.status_code == 201
+    assert response.json["inserted"] == 2 and response.json["failed"] == 4
+    assert [error["line"] for error in response.json["errors"]] == [2, 3, 4, 5]
+    assert client.get('/sales/total-by-year').status_code == 200
+    assert len(collections['sales'].all()) == 2
+
+    invalid = client.post('/sales/bulk', data='{"year": -3}\n', content_type='application/x-ndjson')
+    assert invalid.status_code == 400 and invalid.json["inserted"] == 0
+
+# --- Favoritos -----------------------------------------------------------------
+
+@pytest.mark.parametrize('body', [[1, 2], {"add": 1}, {"add": ["1"]}, {"remove": [True]}])
+def test_favorites_batch_rejects_invalid_bodies(client, body):
+    assert client.post('/favorites/batch', json=body, headers=bearer()).status_code == 400
+
+def test_favorites_batch(client):
+    assert client.post('/favorites/batch', json={"add": [1]}).status_code == 401
+    response = client.post('/favorites/batch', json={"add": [1, 2, 1]}, headers=bearer())
+    assert response.json["carIds"] == [1, 2] and response.json["added"] == [1, 2]
+    response = client.post('/favorites/batch', json={"add": [2, 3], "remove": [1, 4]}, headers=bearer())
+    assert response.json == {"carIds": [2, 3], "added": [3], "removed": [1], "success": True}
+    expanded = client.get('/favorites?expand=cars', headers=bearer()).json
+    assert [car["id"] for car in expanded["cars"]] == [2]  # El coche 3 no existe
+
+def test_concurrent_favorite_changes_are_not_lost(client, collections):
+    def add(car_id):
+        with app.test_client() as own_client:
+            assert own_client.post(f'/favorites/add/{car_id}', headers=bearer()).status_code == 200
+
+    threads = [threading.Thread(target=add, args=(car_id,)) for car_id in range(1, 11)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert [sorted(user["carIds"]) for user in collections['favorites'].all()] == [list(range(1, 11))]
+    assert client.delete('/favorites/remove/3', headers=bearer()).json["success"] is True
+    assert client.delete('/favorites/remove/3', headers=bearer()).json["success"] is False
+    assert 3 not in client.get('/favorites', headers=bearer()).json["carIds"]
+
+def test_concurrent_favorite_batches_are_not_lost(client, collections):
+    client.post('/favorites/batch', json={"add": [100, 101]}, headers=bearer())
+    responses = []
+
+    def batch(car_id):
+        with app.test_client() as own_client:
+            body = {"add": [car_id, car_id + 1], "remove": [100]}
+            responses.append(own_client.post('/favorites/batch', json=body, headers=bearer()).json)
+
+    threads = [threading.Thread(target=batch, args=(car_id,)) for car_id in range(1, 20, 2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert [sorted(user["carIds"]) for user in collections['favorites'].all()] == [list(range(1, 21)) + [101]]
+    # Sólo una de las peticiones llegó a quitar el 100
+    assert sum(response["removed"] == [100] for response in responses) == 1
+
+# --- Reseñas -------------------------------------------------------------------
+
+def test_reviews_pages_and_ratings(client, collections):
+    collections['reviews'].append([
+        {"id": None, "car_id": 1, "username": "ana", "text": "Bien", "rating": 4, "date": "2030-01-01"},
+        {"id": None, "car_id": 1, "username": "luis", "text": "Mal", "rating": 2, "date": "2030-01-02"},
+        {"id": None, "car_id": 2, "username": "eva", "text": "Top", "rating": 5, "date": "2030-01-03"},
+    ])
+    first = client.get('/reviews/1?sort=-rating&limit=1').json
+    assert [review["id"] for review in first["reviews"]] == [1]
+    assert first["avgRating"] == 3.0 and first["total"] == 2
+    second = client.get(f'/reviews/1?limit=1&cursor={first["next_cursor"]}').json
+    assert [review["id"] for review in second["reviews"]] == [2] and second["next_cursor"] is None
+
+    ratings = client.get('/cars/average-ratings?ids=1,2,3').json["ratings"]
+    assert ratings == {"1": {"avgRating": 3.0, "total": 2}, "2": {"avgRating": 5, "total": 1},
+                       "3": {"avgRating": 0, "total": 0}}
+
+@pytest.mark.parametrize('query', [
+    'limit=abc', 'limit=-1', 'sort=text', 'cursor=no-es-un-cursor',
+    f'cursor={encode_cursor({"sort": "rating", "after": ["alta", 1]})}',
+    f'cursor={encode_cursor({"sort": "date", "after": 5})}',
+])
+def test_reviews_rejects_invalid_params(client, query):
+    assert client.get(f'/reviews/1?{query}').status_code == 400
+
+def test_average_ratings_rejects_invalid_ids(client):
+    assert client.get('/cars/average-ratings?ids=1,dos').status_code == 400
+    ids = ','.join(str(i) for i in range(MAX_PAGE_SIZE + 1))
+    assert client.get(f'/cars/average-ratings?ids={ids}').status_code == 400
+
+@pytest.mark.parametrize('car_id', [[1], "1", True, None])
+def test_create_review_requires_integer_car_id(client, collections, car_id):
+    review = {"car_id": car_id, "text": "Bien", "rating": 4}
+    assert client.post('/reviews', json=review, headers=bearer()).status_code == 400
+    assert client.post('/reviews', json={**review, "car_id": 1, "rating": "mucho"},
+                       headers=bearer()).status_code == 400
+    assert collections['reviews'].all() == []
+    assert client.get('/cars/average-ratings?ids=1').status_code == 200
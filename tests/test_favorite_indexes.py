@@ -0,0 +1,19 @@
+import pytest
+from storage.favorite_indexes import favorite_sets
+
+@pytest.fixture
+def favorites(make_collection):
+    return make_collection('favorites', [{"username": "ana", "carIds": [1, 2]}])
+
+def test_favorite_sets_follow_writes(favorites):
+    sets = favorite_sets(favorites)
+    assert sets.car_ids("ana") == {1, 2}
+    assert sets.car_ids("luis") == frozenset()
+
+    favorites.update("ana", {"username": "ana", "carIds": [2, 3]})
+    favorites.insert({"username": "luis", "carIds": [7]})
+    assert favorite_sets(favorites) is sets
+    assert sets.car_ids("ana") == {2, 3}
+    assert 7 in sets.car_ids("luis")
+    favorites.delete("luis")
+    assert sets.car_ids("luis") == frozenset()
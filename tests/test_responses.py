@@ -0,0 +1,56 @@
+import datetime
+import gzip
+import pytest
+from flask import Flask, Response, jsonify
+from flask.json.provider import DefaultJSONProvider
+from routes.compression import compress_response
+from routes.json_provider import OrjsonProvider, orjson
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.after_request(compress_response)
+
+    @app.route('/big')
+    def big():
+        response = jsonify([{"model": "Corolla", "units_sold": i} for i in range(500)])
+        response.set_etag('abc')
+        return response
+
+    @app.route('/small')
+    def small():
+        return jsonify({"ok": True})
+
+    @app.route('/stream')
+    def stream():
+        return Response((f'{{"n": {i}}}\n' for i in range(100)), mimetype='application/x-ndjson')
+
+    return app
+
+@pytest.mark.skipif(orjson is None, reason="orjson no instalado")
+def test_orjson_provider_matches_default():
+    app = Flask(__name__)
+    data = {"b": [1, 2.5, None], "a": {"x": "y"}, "years": {2021: 5, 2020: 3},
+            "date": datetime.datetime(2024, 1, 2, 3, 4, 5)}
+    with app.app_context():
+        assert OrjsonProvider(app).response(data).get_data() == DefaultJSONProvider(app).response(data).get_data()
+        assert OrjsonProvider(app).loads(b'{"a": [1, "x"]}') == {"a": [1, "x"]}
+        # Sin escapar los caracteres no ASCII, pero con el mismo contenido
+        assert OrjsonProvider(app).response({"x": "ñ"}).get_json() == {"x": "ñ"}
+
+def test_large_responses_are_gzipped(app):
+    client = app.test_client()
+    plain = client.get('/big')
+    compressed = client.get('/big', headers={'Accept-Encoding': 'gzip'})
+    assert 'Content-Encoding' not in plain.headers
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert compressed.headers['ETag'] == '"abc-gzip"'
+    assert 'Accept-Encoding' in compressed.headers['Vary']
+    assert gzip.decompress(compressed.data) == plain.data
+
+def test_small_and_streamed_responses(app):
+    client = app.test_client()
+    assert 'Content-Encoding' not in client.get('/small', headers={'Accept-Encoding': 'gzip'}).headers
+    streamed = client.get('/stream', headers={'Accept-Encoding': 'gzip'})
+    assert streamed.headers['Content-Encoding'] == 'gzip'
+    assert len(gzip.decompress(streamed.data).splitlines()) == 100
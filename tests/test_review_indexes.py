@@ -0,0 +1,51 @@
+import pytest
+from storage.review_indexes import RatingAggregates, rating_aggregates, reviews_by_car
+
+REVIEWS = [
+    {"id": 1, "car_id": 1, "username": "ana", "text": "Bien", "rating": 4},
+    {"id": 2, "car_id": 1, "username": "luis", "text": "Regular", "rating": 3},
+    {"id": 3, "car_id": 2, "username": "ana", "text": "Genial", "rating": 5},
+]
+
+@pytest.fixture
+def reviews(make_collection):
+    return make_collection('reviews', REVIEWS)
+
+def test_rating_aggregates_follow_writes(reviews):
+    aggregates = rating_aggregates(reviews)
+    assert aggregates.average(1) == (3.5, 2)
+    assert aggregates.average(3) == (0, 0)
+
+    reviews.insert({"id": None, "car_id": 3, "username": "ana", "text": "Mal", "rating": 1})
+    reviews.update(2, {**REVIEWS[1], "rating": 5})
+    reviews.delete(3)
+
+    assert rating_aggregates(reviews) is aggregates
+    assert aggregates.average(1) == (4.5, 2)
+    assert aggregates.average(2) == (0, 0)
+    assert aggregates.average(3) == (1, 1)
+    rebuilt = RatingAggregates(reviews.all())
+    assert all(rebuilt.average(car_id) == aggregates.average(car_id) for car_id in (1, 2, 3))
+
+def test_reviews_by_car_sorted_and_maintained(reviews):
+    index = reviews_by_car(reviews)
+    assert [r["id"] for _, r in index.sorted_by(1, 'rating').scan()] == [2, 1]
+    assert list(index.sorted_by(3, 'date').scan()) == []
+
+    reviews.insert({"id": None, "car_id": 1, "username": "eva", "text": "Top", "rating": 5, "date": "2024-01-01"})
+    reviews.update(1, {**REVIEWS[0], "car_id": 2})
+
+    assert reviews_by_car(reviews) is index
+    assert [r["id"] for _, r in index.sorted_by(1, 'rating').scan(reverse=True)] == [4, 2]
+    assert [r["id"] for _, r in index.sorted_by(2, 'date').scan()] == [1, 3]
+    # Desde el cursor (clave de la última reseña devuelta)
+    first_key, _ = next(index.sorted_by(2, 'date').scan())
+    assert [r["id"] for _, r in index.sorted_by(2, 'date').scan(first_key)] == [3]
+
+def test_indexes_skip_invalid_car_ids(reviews):
+    # Reseñas con car_id no entero (datos antiguos o editados a mano) no rompen los índices
+    reviews.insert({"id": None, "car_id": [1], "username": "eva", "text": "?", "rating": 5})
+    reviews.insert({"id": None, "car_id": 1, "username": "pau", "text": "?", "rating": "5"})
+    assert rating_aggregates(reviews).average(1) == (2.3, 3)
+    assert [r["id"] for _, r in reviews_by_car(reviews).sorted_by(1, 'rating').scan()] == [5, 2, 1]
+    assert RatingAggregates(reviews.all()).average(1) == (2.3, 3)
@@ -0,0 +1,127 @@
+import random
+import pytest
+import json
+from models.sale import Sale
+from storage.json_store import JsonCollection
+from storage.sales_store import SalesRollups, SalesStore
+
+MODELS = ["GLE", "Civic", "Model 3", "X5"]
+COUNTRIES = ["USA", "Spain", "Japan"]
+
+@pytest.fixture
+def sales():
+    rng = random.Random(42)
+    return [
+        {"year": rng.randint(2015, 2024), "model": rng.choice(MODELS),
+         "country": rng.choice(COUNTRIES), "units_sold": rng.randint(50, 500)}
+        for _ in range(2000)
+    ]
+
+def totals(sales, field):
+    result = {}
+    for sale in sales:
+        result[sale[field]] = result.get(sale[field], 0) + sale["units_sold"]
+    return result
+
+def test_columnar_totals_match_row_scan(sales):
+    store = SalesStore.from_records(sales)
+    assert dict(store.totals_by_country()) == totals(sales, "country")
+    assert dict(store.totals_by_model()) == totals(sales, "model")
+    assert store.totals_by_year() == sorted(totals(sales, "year").items())
+
+def test_model_filter_is_case_insensitive(sales):
+    store = SalesStore.from_records(sales)
+    mask = store.model_mask("model 3")
+    gle_sales = [sale for sale in sales if sale["model"] == "Model 3"]
+    assert store.rows(mask) == gle_sales
+    assert store.totals_by_year(mask) == sorted(totals(gle_sales, "year").items())
+    assert not store.model_mask("Corolla").any()
+
+def test_rows_round_trip(sales):
+    store = SalesStore.from_records(sales)
+    assert store.rows() == sales
+    assert store.nbytes < 20 * len(sales)
+
+def test_rollups_match_full_recompute(sales):
+    store = SalesStore.from_records(sales)
+    assert store.rollups.diff(SalesRollups.from_records(sales)) == []
+    assert store.rollups.model_totals_by_year("gle") == store.totals_by_year(store.model_mask("GLE"))
+
+def test_append_updates_columns_and_rollups(sales):
+    store = SalesStore.from_records(sales[:1500])
+    store.append(sales[1500:1501])
+    store.append(sales[1501:] + [{"year": 2025, "model": "Corolla", "country": "Peru", "units_sold": 7}])
+    expected = sales + [{"year": 2025, "model": "Corolla", "country": "Peru", "units_sold": 7}]
+    assert store.rows() == expected
+    assert store.rollups.diff(SalesRollups.from_records(expected)) == []
+    assert store.rollups.diff(SalesStore.from_records(expected).rollups) == []
+
+def test_out_of_range_rows_are_skipped(sales):
+    invalid = [{"year": 40000, "model": "GLE", "country": "USA", "units_sold": 1},
+               {"year": 2020, "model": "GLE", "country": "USA", "units_sold": 2 ** 40}]
+    negative = {"year": -3, "model": "GLE", "country": "USA", "units_sold": 5}
+    store = SalesStore.from_records(sales[:10] + invalid)
+    store.append(invalid + [negative])
+    expected = sales[:10] + [negative]
+    assert store.rows() == expected
+    # Un año negativo no rompe bincount: los años se desplazan al menor
+    assert store.totals_by_year() == sorted(totals(expected, "year").items())
+    assert store.rollups.diff(SalesRollups.from_records(expected + invalid)) == []
+
+@pytest.mark.parametrize("field, value", [("year", 40000), ("year", -3), ("units_sold", 2 ** 31)])
+def test_sale_rejects_out_of_range_values(field, value):
+    sale = {"year": 2020, "model": "GLE", "country": "USA", "units_sold": 5, field: value}
+    with pytest.raises(ValueError):
+        Sale.from_dict(sale)
+
+def test_queries_use_one_snapshot_across_appends(sales):
+    store = SalesStore.from_records(sales[:100])
+    mask = store.filter_mask(models=["GLE"])
+    positions, total, _ = store.page(mask)
+    # Una alta concurrente entre el filtro y la consulta no desalinea las columnas
+    store.append(sales[100:200])
+    selected = [sale for sale in sales[:100] if sale["model"] == "GLE"]
+    assert store.rows(mask) == selected
+    assert store.rows(positions) == selected
+    assert store.totals_by_year(mask) == sorted(totals(selected, "year").items())
+    counts = {row["country"]: row["count"] for row in store.aggregate(("country",), "count", mask)}
+    assert counts == {country: sum(sale["country"] == country for sale in selected)
+                      for country in {sale["country"] for sale in selected}}
+
+def test_store_is_maintained_as_collection_view(tmp_path, sales):
+    path = tmp_path / 'sales.json'
+    path.write_text(json.dumps(sales[:100]))
+    collection = JsonCollection('sales', str(path))
+    store = collection.view('columnar', SalesStore.from_records, SalesStore.apply_changes)
+    collection.insert(sales[100])
+    assert collection.view('columnar', SalesStore.from_records, SalesStore.apply_changes) is store
+    assert store.rows() == sales[:101]
+
+@pytest.mark.parametrize("metric", ["sum", "avg", "count", "min", "max"])
+@pytest.mark.parametrize("group_by", [(), ("year",), ("country", "model"), ("model", "year", "country")])
+def test_aggregate_matches_row_scan(sales, group_by, metric):
+    store = SalesStore.from_records(sales)
+    mask = store.filter_mask(year_from=2017, year_to=2022, models=["gle", "X5", "Corolla"])
+    selected = [sale for sale in sales if 2017 <= sale["year"] <= 2022 and sale["model"] in ("GLE", "X5")]
+
+    groups = {}
+    for sale in selected:
+        groups.setdefault(tuple(sale[field] for field in group_by), []).append(sale["units_sold"])
+    reduce = {"sum": sum, "count": len, "min": min, "max": max,
+              "avg": lambda units: round(sum(units) / len(units), 2)}[metric]
+    expected = {key: reduce(units) for key, units in groups.items()}
+
+    result = store.aggregate(group_by, metric, mask)
+    assert {tuple(row[field] for field in group_by): row[metric] for row in result} == expected
+    assert all(list(row) == list(group_by) + [metric] for row in result)
+
+def test_cursor_pages_cover_selection_once(sales):
+    store = SalesStore.from_records(sales)
+    mask = store.model_mask("Civic")
+    pages, start = [], 0
+    while start is not None:
+        positions, total, start = store.page(mask, start, limit=70)
+        pages.append(store.rows(positions, fields=("year", "units_sold")))
+    expected = [{"year": sale["year"], "units_sold": sale["units_sold"]} for sale in sales if sale["model"] == "Civic"]
+    assert [row for page in pages for row in page] == expected
+    assert total == len(expected) and all(len(page) <= 70 for page in pages)
@@ -0,0 +1,399 @@
+import json
+import multiprocessing
+import os
+import sqlite3
+import threading
+import pytest
+from storage.commit import DuplicateKey
+from storage.json_store import JsonCollection
+from storage.journal import JournaledCollection
+from storage.sqlite_store import SCHEMAS, SqliteCollection, SqliteDatabase, migrate_from_json
+
+@pytest.fixture
+def cars(make_collection):
+    return make_collection('cars', [{"id": 1, "make": "Toyota", "model": "Corolla", "year": 2020}])
+
+def test_cached_reads(cars):
+    first = cars.all()
+    second = cars.all()
+    assert first is second
+    assert cars.hits == 1
+    assert cars.misses == 1
+
+def test_external_change_is_detected(cars):
+    version = cars.version
+    with open(cars.path, 'w') as f:
+        json.dump([{"id": 1, "make": "Toyota", "model": "Corolla", "year": 2020},
+                   {"id": 2, "make": "Honda", "model": "Civic", "year": 2021}], f)
+    assert len(cars.all()) == 2
+    assert cars.version > version
+    assert cars.misses == 1
+
+def test_writes_update_cache_and_file(cars):
+    cars.insert({"id": 2, "make": "Honda", "model": "Civic", "year": 2021})
+    cars.update(1, {"id": 1, "make": "Toyota", "model": "Camry", "year": 2020})
+    cars.delete(2)
+    assert cars.get(1)["model"] == "Camry"
+    assert cars.get(2) is None
+    with open(cars.path) as f:
+        assert json.load(f) == cars.all()
+    assert cars.misses == 1
+
+def test_views_are_maintained_by_local_commits(cars):
+    def ids(records):
+        return {record["id"] for record in records}
+
+    def apply(view, changes):
+        for old, new in changes:
+            if old is not None:
+                return False
+            view.add(new["id"])
+
+    view = cars.view('ids', ids, apply)
+    cars.insert({"id": 2, "make": "Honda", "model": "Civic", "year": 2021})
+    assert cars.view('ids', ids, apply) is view and view == {1, 2}
+    # Las bajas no se soportan incrementalmente: la vista se reconstruye
+    cars.delete(1)
+    assert cars.view('ids', ids, apply) == {2}
+
+def test_failing_view_does_not_fail_commit(cars):
+    def ids(records):
+        return {record["id"] for record in records}
+
+    def apply(view, changes):
+        raise KeyError("id")
+
+    cars.view('ids', ids, apply)
+    cars.insert({"id": 2, "make": "Honda", "model": "Civic", "year": 2021})
+    assert cars.get(2)["model"] == "Civic"
+    # La vista se descartó y se reconstruye con el registro ya guardado
+    assert cars.view('ids', ids, apply) == {1, 2}
+
+@pytest.mark.parametrize("existing", [[], [{"year": 2020, "units_sold": 1}]])
+def test_append_in_place_matches_full_rewrite(tmp_path, existing):
+    path = tmp_path / 'sales.json'
+    path.write_text(json.dumps(existing, indent=4))
+    sales = JsonCollection('sales', str(path))
+    sales.append([{"year": 2021, "units_sold": 2}])
+    sales.append([{"year": 2022, "units_sold": 3}, {"year": 2023, "units_sold": 4}])
+    expected = existing + [{"year": year, "units_sold": year - 2019} for year in (2021, 2022, 2023)]
+    assert sales._records is None  # No se ha cargado el fichero
+    assert path.read_text() == json.dumps(expected, indent=4)
+    assert sales.all() == expected
+
+def test_keyed_inserts_are_appended_in_place(tmp_path):
+    path = tmp_path / 'users.json'
+    path.write_text(json.dumps([{"username": "ana", "is_admin": False}], indent=4))
+    users = JsonCollection('users', str(path), key='username')
+    inode = os.stat(path).st_ino
+    users.insert({"username": "luis", "is_admin": False})
+    users.append([{"username": "eva", "is_admin": True}, {"username": "pau", "is_admin": False}])
+    assert os.stat(path).st_ino == inode  # Sin reescribir el fichero
+    assert users.get("eva")["is_admin"] is True
+    assert json.loads(path.read_text()) == users.all()
+    # Una clave repetida se rechaza sin tocar el fichero ni el resto del lote
+    with pytest.raises(DuplicateKey):
+        users.insert({"username": "ana", "is_admin": True})
+    assert users.get("ana")["is_admin"] is False
+    assert json.loads(path.read_text()) == users.all()
+
+def test_unparseable_file_is_not_served_or_overwritten(cars):
+    with open(cars.path, 'w') as f:
+        f.write('[{"id": 1, "make": "Toyota"')
+    with pytest.raises(json.JSONDecodeError):
+        cars.all()
+    with pytest.raises(json.JSONDecodeError):
+        cars.insert({"id": None, "make": "Honda", "model": "Civic", "year": 2021})
+    with open(cars.path) as f:
+        assert f.read() == '[{"id": 1, "make": "Toyota"'
+
+def test_interrupted_append_is_undone(tmp_path):
+    path = tmp_path / 'users.json'
+    path.write_text(json.dumps([{"username": "ana"}], indent=4))
+    users = JsonCollection('users', str(path), key='username')
+    users.insert({"username": "luis"})
+    assert not os.path.exists(users.undo_path)
+
+    # Caída a mitad de un append: queda el registro de deshacer y el fichero truncado
+    complete = path.read_text()
+    cut = complete.rindex('}') + 1
+    (tmp_path / 'users.json.undo').write_text(json.dumps({"size": cut, "tail": complete[cut:]}))
+    path.write_text(complete[:cut] + ',\n    {"username": "e')
+    reader = JsonCollection('users', str(path), key='username')
+    assert [user["username"] for user in reader.all()] == ["ana", "luis"]
+    assert path.read_text() == complete
+    assert not os.path.exists(users.undo_path)
+
+def test_append_assigns_ids_in_one_commit(cars):
+    stored = cars.append([{"id": None, "model": "Civic"}, {"id": None, "model": "Golf"}])
+    assert [car["id"] for car in stored] == [2, 3]
+    assert cars.commits == 1
+
+@pytest.mark.parametrize("collection_class", [JsonCollection, JournaledCollection])
+def test_id_sequence_does_not_reuse_deleted_ids(tmp_path, collection_class):
+    path = tmp_path / 'db.json'
+    path.write_text(json.dumps([{"id": 1, "model": "Corolla"}]))
+    cars = collection_class('cars', str(path), key='id')
+    assert cars.insert({"id": None, "model": "Civic"})["id"] == 2
+    cars.delete(2)
+    assert cars.insert({"id": None, "model": "Golf"})["id"] == 3
+    assert (tmp_path / 'db.json.seq').read_text() == '4'
+
+def test_wrapper_and_missing_file(tmp_path):
+    reviews = JsonCollection('reviews', str(tmp_path / 'reviews.json'), key='id', wrapper='reviews')
+    assert reviews.all() == []
+    reviews.insert({"id": 1, "car_id": 1, "rating": 5})
+    with open(reviews.path) as f:
+        assert json.load(f) == {"reviews": [{"id": 1, "car_id": 1, "rating": 5}]}
+    assert os.path.exists(reviews.path)
+
+@pytest.fixture
+def journaled(tmp_path):
+    path = tmp_path / 'db.json'
+    with open(path, 'w') as f:
+        json.dump([{"id": 1, "make": "Toyota", "model": "Corolla", "year": 2020}], f)
+    return JournaledCollection('cars', str(path), key='id', compact_threshold=1000)
+
+def test_journal_appends_instead_of_rewriting(journaled):
+    with open(journaled.path) as f:
+        snapshot = f.read()
+    journaled.insert({"id": 2, "make": "Honda", "model": "Civic", "year": 2021})
+    journaled.update(1, {"id": 1, "make": "Toyota", "model": "Camry", "year": 2020})
+    journaled.delete(2)
+    with open(journaled.path) as f:
+        assert f.read() == snapshot
+    with open(journaled.journal_path) as f:
+        entries = [json.loads(line) for line in f]
+    assert [(e["seq"], e["op"]) for e in entries] == [(1, "insert"), (2, "update"), (3, "delete")]
+
+    # Otro proceso reproduce el diario sobre el snapshot
+    reader = JournaledCollection('cars', journaled.path, key='id')
+    assert reader.all() == [{"id": 1, "make": "Toyota", "model": "Camry", "year": 2020}]
+
+def test_journal_tail_replay_and_torn_line(journaled):
+    reader = JournaledCollection('cars', journaled.path, key='id')
+    assert len(reader.all()) == 1
+    journaled.insert({"id": 2, "make": "Honda", "model": "Civic", "year": 2021})
+    with open(journaled.journal_path, 'a') as f:
+        f.write('{"seq": 99, "op": "ins')
+    assert [car["id"] for car in reader.all()] == [1, 2]
+    assert reader.misses == 1
+
+    reader.insert({"id": 3, "make": "Ford", "model": "Focus", "year": 2022})
+    fresh = JournaledCollection('cars', journaled.path, key='id')
+    assert [car["id"] for car in fresh.all()] == [1, 2, 3]
+
+def test_journal_compaction(journaled):
+    for i in range(2, 6):
+        journaled.insert({"id": i, "make": "Ford", "model": f"Model {i}", "year": 2000 + i})
+    journaled.delete(3)
+    version = journaled.version
+    journaled.compact()
+    assert journaled.version == version
+    with open(journaled.path) as f:
+        assert [car["id"] for car in json.load(f)] == [1, 2, 4, 5]
+    with open(journaled.journal_path) as f:
+        assert [json.loads(line)["op"] for line in f] == ["checkpoint"]
+
+    journaled.insert({"id": 6, "make": "Ford", "model": "Model 6", "year": 2006})
+    fresh = JournaledCollection('cars', journaled.path, key='id')
+    assert [car["id"] for car in fresh.all()] == [1, 2, 4, 5, 6]
+    assert fresh._seq == 6
+
+def test_sqlite_collection(tmp_path):
+    db_path = str(tmp_path / 'app.db')
+    bookings = SqliteCollection('bookings', SqliteDatabase(db_path), SCHEMAS['bookings'])
+    bookings.insert({"id": 1, "user_id": "a@a.com", "car_id": 5, "date": "2025-05-02"})
+    bookings.insert({"id": 2, "user_id": "b@b.com", "car_id": 5, "date": "2025-05-03"})
+    bookings.update(1, {"id": 1, "user_id": "a@a.com", "car_id": 7, "date": "2025-05-02"})
+    assert [b["id"] for b in bookings.find(car_id=5)] == [2]
+    assert bookings.get(1)["car_id"] == 7
+
+    # Otro worker con su propia conexión ve los cambios a través de la versión persistida
+    other = SqliteCollection('bookings', SqliteDatabase(db_path), SCHEMAS['bookings'])
+    assert [b["id"] for b in other.all()] == [1, 2]
+    bookings.delete(2)
+    assert [b["id"] for b in other.all()] == [1]
+    assert other.misses == 2
+
+def test_migrate_from_json(tmp_path, cars):
+    database = SqliteDatabase(str(tmp_path / 'app.db'))
+    assert migrate_from_json({'cars': cars}, database) == {'cars': 1}
+    migrated = SqliteCollection('cars', database, SCHEMAS['cars'])
+    assert migrated.all() == cars.all()
+    assert migrated.find(model="Corolla", year=2020)[0]["id"] == 1
+
+def _insert_cars(collection_class, path, count):
+    collection = collection_class('cars', path, key='id')
+    for i in range(count):
+        collection.insert({"id": None, "make": "Ford", "model": f"Model {os.getpid()} {i}", "year": 2000})
+
+@pytest.mark.parametrize('collection_class', [JsonCollection, JournaledCollection])
+def test_concurrent_writers_do_not_lose_updates(tmp_path, collection_class):
+    path = str(tmp_path / 'db.json')
+    context = multiprocessing.get_context('fork')
+    workers = [context.Process(target=_insert_cars, args=(collection_class, path, 20)) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    # Hilos del propio proceso compitiendo con los otros workers
+    threads = [threading.Thread(target=_insert_cars, args=(collection_class, path, 5)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for worker in workers:
+        worker.join()
+    for thread in threads:
+        thread.join()
+
+    ids = [car["id"] for car in collection_class('cars', path, key='id').all()]
+    assert len(ids) == 100
+    assert sorted(ids) == list(range(1, 101))
+
+def test_group_commit_batches_queued_writes(tmp_path):
+    cars = JsonCollection('cars', str(tmp_path / 'db.json'), key='id')
+
+    def insert(i):
+        cars.insert({"make": "Ford", "model": str(i), "year": 2000})
+
+    with cars._lock:
+        # El primer escritor se queda bloqueado dentro del commit...
+        leader = threading.Thread(target=insert, args=(0,))
+        leader.start()
+        while not (cars._committing and not cars._pending):
+            pass
+        # ...y el resto se acumula en la cola
+        threads = [threading.Thread(target=insert, args=(i,)) for i in range(1, 10)]
+        for thread in threads:
+            thread.start()
+        while len(cars._pending) < 9:
+            pass
+    for thread in [leader] + threads:
+        thread.join()
+    assert len(cars.all()) == 10
+    assert cars.writes == 10
+    assert cars.commits == 2
+
+def test_insert_if_checks_inside_the_commit(tmp_path):
+    cars = JsonCollection('cars', str(tmp_path / 'db.json'), key='id')
+    results = []
+
+    def insert(i):
+        # Sólo se admite un coche por modelo: la comprobación ve las altas anteriores
+        results.append(cars.insert_if({"make": "Ford", "model": "Focus", "year": 2000 + i},
+                                      lambda: not cars.find(model="Focus")))
+
+    with cars._lock:
+        leader = threading.Thread(target=insert, args=(0,))
+        leader.start()
+        while not (cars._committing and not cars._pending):
+            pass
+        threads = [threading.Thread(target=insert, args=(i,)) for i in range(1, 5)]
+        for thread in threads:
+            thread.start()
+        while len(cars._pending) < 4:
+            pass
+    for thread in [leader] + threads:
+        thread.join()
+    assert len(cars.all()) == 1
+    assert sum(result is not None for result in results) == 1
+
+@pytest.mark.parametrize('backend', ['json', 'journal', 'sqlite'])
+def test_insert_if_rejects(tmp_path, backend):
+    if backend == 'sqlite':
+        bookings = SqliteCollection('bookings', SqliteDatabase(str(tmp_path / 'app.db')), SCHEMAS['bookings'])
+    else:
+        collection_class = JsonCollection if backend == 'json' else JournaledCollection
+        bookings = collection_class('bookings', str(tmp_path / 'bookings.json'), key='id')
+    booking = {"id": None, "user_id": "a@a.com", "car_id": 5, "date": "2025-05-02"}
+    assert bookings.insert_if(booking, lambda: True)["id"] == 1
+    assert bookings.insert_if(booking, lambda: not bookings.find(car_id=5)) is None
+    assert [b["id"] for b in bookings.all()] == [1]
+
+@pytest.mark.parametrize('backend', ['json', 'journal', 'sqlite'])
+def test_duplicate_keys_only_fail_their_own_insert(tmp_path, backend):
+    if backend == 'sqlite':
+        users = SqliteCollection('users', SqliteDatabase(str(tmp_path / 'app.db')), SCHEMAS['users'])
+    else:
+        collection_class = JsonCollection if backend == 'json' else JournaledCollection
+        users = collection_class('users', str(tmp_path / 'users.json'), key='username')
+    users.insert({"username": "ana", "is_admin": False})
+    results = []
+
+    def insert(username):
+        try:
+            results.append(users.insert({"username": username, "is_admin": True}))
+        except DuplicateKey as e:
+            results.append(e)
+
+    with users._lock:
+        leader = threading.Thread(target=insert, args=("luis",))
+        leader.start()
+        while not (users._committing and not users._pending):
+            pass
+        threads = [threading.Thread(target=insert, args=(username,)) for username in ("ana", "eva", "eva")]
+        for thread in threads:
+            thread.start()
+        while len(users._pending) < 3:
+            pass
+    for thread in [leader] + threads:
+        thread.join()
+    assert sum(isinstance(result, DuplicateKey) for result in results) == 2
+    assert sorted(user["username"] for user in users.all()) == ["ana", "eva", "luis"]
+    assert users.get("ana")["is_admin"] is False
+
+def test_sqlite_constraint_violation_only_fails_its_operation(tmp_path):
+    users = SqliteCollection('users', SqliteDatabase(str(tmp_path / 'app.db')), SCHEMAS['users'])
+    users.append([{"username": "ana"}, {"username": "luis"}])
+    results = {}
+
+    def run(name, write):
+        try:
+            results[name] = write()
+        except Exception as e:
+            results[name] = e
+
+    writes = {
+        "rename": lambda: users.update("luis", {"username": "ana"}),  # Clave única repetida
+        "insert": lambda: users.insert({"username": "eva"}),
+        "delete": lambda: users.delete("ana"),
+    }
+    with users._lock:
+        leader = threading.Thread(target=run, args=("first", lambda: users.insert({"username": "pau"})))
+        leader.start()
+        while not (users._committing and not users._pending):
+            pass
+        threads = []
+        for name, write in writes.items():
+            threads.append(threading.Thread(target=run, args=(name, write)))
+            threads[-1].start()
+            while len(users._pending) < len(threads):
+                pass
+    for thread in [leader] + threads:
+        thread.join()
+    assert users.commits == 3  # El alta inicial, la del líder y el resto en un único lote
+    assert isinstance(results["rename"], sqlite3.IntegrityError)
+    assert results["insert"] == {"username": "eva"} and results["delete"] == {"username": "ana"}
+    assert sorted(user["username"] for user in users.all()) == ["eva", "luis", "pau"]
+
+@pytest.mark.parametrize('backend', ['json', 'journal', 'sqlite'])
+def test_append_if_keeps_accepted_records(tmp_path, backend):
+    if backend == 'sqlite':
+        cars = SqliteCollection('cars', SqliteDatabase(str(tmp_path / 'app.db')), SCHEMAS['cars'])
+    else:
+        collection_class = JsonCollection if backend == 'json' else JournaledCollection
+        cars = collection_class('cars', str(tmp_path / 'db.json'), key='id')
+    cars.insert({"id": None, "make": "Ford", "model": "Focus", "year": 2019})
+    batch = [{"id": None, "make": "Kia", "model": model, "year": 2020} for model in ("Soul", "Focus", "Rio")]
+    saved = cars.append_if(batch, lambda car: not cars.find(model=car["model"]))
+    assert [car and car["id"] for car in saved] == [2, None, 3]
+    assert [car["model"] for car in cars.all()] == ["Focus", "Soul", "Rio"]
+
+@pytest.mark.parametrize('collection_class', [JsonCollection, JournaledCollection])
+def test_fingerprint_changes_with_content(tmp_path, collection_class):
+    path = tmp_path / 'db.json'
+    path.write_text('[]')
+    cars = collection_class('cars', str(path), key='id')
+    token, modified = cars.fingerprint()
+    assert modified is not None
+    assert collection_class('cars', str(path), key='id').fingerprint()[0] == token
+    cars.insert({"id": None, "make": "Toyota", "model": "Corolla", "year": 2020})
+    assert cars.fingerprint()[0] != token